@@ -0,0 +1 @@
+default_app_config = 'smart_heating.apps.SmartHeatingConfig'
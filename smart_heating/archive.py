@@ -0,0 +1,477 @@
+"""
+Copyright 2016 Michael Spiegel, Wilhelm Kleiminger
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Cold storage of old temperatures.
+
+The temperatures of each thermostat and month older than `TEMPERATURE_ARCHIVE_AGE_DAYS` are moved from
+the database into a compressed file of the archive directory. A file consists of a header and two
+zlib compressed columns: the milliseconds since the previous timestamp and the difference of the
+values quantised to `1 / TEMPERATURE_ARCHIVE_SCALE` degrees.
+
+`TieredTemperatures` reads the temperatures of a thermostat across the database and the archive.
+Temperatures stored later for an archived month stay in the database until the month is archived
+again, reads merge them with the archive.
+"""
+
+import datetime
+import functools
+import heapq
+import os
+import struct
+import zlib
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from smart_heating import markers
+from smart_heating.models import Temperature, Thermostat
+from smart_heating.rows import RowQuerySet, TemperatureRow
+
+MAGIC = b'SHT1'
+# Magic, number of temperatures, first timestamp in milliseconds and scale of the values
+HEADER = struct.Struct('<4sIqI')
+FILE_EXTENSION = '.bin'
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+DATETIME_LOOKUPS = ('datetime__gte', 'datetime__gt', 'datetime__lt', 'datetime__lte')
+
+
+def to_milliseconds(date):
+    return (date - EPOCH) // datetime.timedelta(milliseconds=1)
+
+
+def from_milliseconds(milliseconds):
+    return EPOCH + datetime.timedelta(milliseconds=milliseconds)
+
+
+def get_month_start(date):
+    return date.astimezone(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def get_next_month(month):
+    if month.month == 12:
+        return month.replace(year=month.year + 1, month=1)
+    return month.replace(month=month.month + 1)
+
+
+def get_thermostat_directory(thermostat_pk):
+    return os.path.join(settings.TEMPERATURE_ARCHIVE_DIR, str(thermostat_pk))
+
+
+def get_month_path(thermostat_pk, month):
+    return os.path.join(get_thermostat_directory(thermostat_pk), month.strftime('%Y-%m') + FILE_EXTENSION)
+
+
+def get_archived_months(thermostat_pk):
+    """
+    Returns the sorted start datetimes of the archived months of a thermostat.
+    """
+    try:
+        names = os.listdir(get_thermostat_directory(thermostat_pk))
+    except FileNotFoundError:
+        return []
+    months = []
+    for name in names:
+        if name.endswith(FILE_EXTENSION):
+            month = datetime.datetime.strptime(name[:-len(FILE_EXTENSION)], '%Y-%m')
+            months.append(month.replace(tzinfo=timezone.utc))
+    return sorted(months)
+
+
+def get_horizon(thermostat_pk):
+    """
+    Returns the end of the last archived month of a thermostat, or None. Later temperatures are only stored
+    in the database.
+    """
+    months = get_archived_months(thermostat_pk)
+    return get_next_month(months[-1]) if months else None
+
+
+def encode(readings, scale):
+    """
+    Encodes a sorted list of (datetime, value) readings.
+    """
+    timestamps = [to_milliseconds(date) for date, value in readings]
+    values = [int(round(value * scale)) for date, value in readings]
+    deltas = [0] + [timestamp - previous for previous, timestamp in zip(timestamps, timestamps[1:])]
+    value_deltas = values[:1] + [value - previous for previous, value in zip(values, values[1:])]
+    columns = struct.pack('<%dI%di' % (len(readings), len(readings)), *(deltas + value_deltas))
+    return HEADER.pack(MAGIC, len(readings), timestamps[0], scale) + zlib.compress(columns)
+
+
+def decode(data):
+    """
+    Decodes the sorted list of (datetime, value) readings of an archive file.
+    """
+    magic, count, timestamp, scale = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError('Not a temperature archive file.')
+    columns = struct.unpack('<%dI%di' % (count, count), zlib.decompress(data[HEADER.size:]))
+    readings = []
+    value = 0
+    for delta, value_delta in zip(columns[:count], columns[count:]):
+        timestamp += delta
+        value += value_delta
+        readings.append((from_milliseconds(timestamp), value / scale))
+    return readings
+
+
+def read_count(path):
+    """
+    Returns the number of temperatures of an archive file without decompressing it.
+    """
+    with open(path, 'rb') as archive_file:
+        return HEADER.unpack(archive_file.read(HEADER.size))[1]
+
+
+@functools.lru_cache(maxsize=32)
+def read_cached(path, modification_time):
+    with open(path, 'rb') as archive_file:
+        return decode(archive_file.read())
+
+
+def read_month(thermostat_pk, month):
+    """
+    Returns the archived (datetime, value) readings of a thermostat and month, or an empty list.
+    """
+    path = get_month_path(thermostat_pk, month)
+    try:
+        modification_time = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return []
+    return read_cached(path, modification_time)
+
+
+def write_month(thermostat_pk, month, readings):
+    """
+    Replaces the archive file of a thermostat and month by the sorted readings.
+    """
+    path = get_month_path(thermostat_pk, month)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'wb') as archive_file:
+        archive_file.write(encode(readings, settings.TEMPERATURE_ARCHIVE_SCALE))
+    os.replace(temporary_path, path)
+
+
+def merge(archived, stored):
+    """
+    Merges sorted archived and stored (datetime, value) readings. Stored readings take precedence.
+    """
+    stored_timestamps = set(to_milliseconds(date) for date, value in stored)
+    archived = [reading for reading in archived if to_milliseconds(reading[0]) not in stored_timestamps]
+    return list(heapq.merge(archived, stored))
+
+
+def archive_temperatures(before=None, thermostat_pks=None):
+    """
+    Moves the temperatures of all months ending before the given datetime into the archive.
+
+    Defaults to `TEMPERATURE_ARCHIVE_AGE_DAYS` ago. Months are archived one at a time and merged with an
+    existing archive file. The latest temperature of each thermostat is never archived, since the latest
+    readings are only read from the database. Returns the number of archived temperatures.
+    """
+    if before is None:
+        before = timezone.now() - datetime.timedelta(days=settings.TEMPERATURE_ARCHIVE_AGE_DAYS)
+    end = get_month_start(before)
+    if thermostat_pks is None:
+        thermostat_pks = Thermostat.objects.order_by('pk').values_list('pk', flat=True)
+
+    archived = 0
+    for thermostat_pk in thermostat_pks:
+        temperatures = Temperature.objects.filter(thermostat_id=thermostat_pk, datetime__lt=end)
+        # The latest temperature stays in the database, see `smart_heating.latest`
+        newest = Temperature.objects.filter(thermostat_id=thermostat_pk).order_by('-datetime').values_list(
+            'pk', flat=True).first()
+        temperatures = temperatures.exclude(pk=newest)
+        first = temperatures.order_by('datetime').values_list('datetime', flat=True).first()
+        month = get_month_start(first) if first is not None else end
+        while month < end:
+            month_temperatures = temperatures.filter(datetime__gte=month, datetime__lt=get_next_month(month))
+            with transaction.atomic():
+                stored = list(month_temperatures.order_by('datetime').values_list('datetime', 'value'))
+                if stored:
+                    write_month(thermostat_pk, month, merge(read_month(thermostat_pk, month), stored))
+                    month_temperatures.delete()
+                    # The values are quantised
+                    markers.touch_collections(Temperature, [thermostat_pk])
+            archived += len(stored)
+            month = get_next_month(month)
+    return archived
+
+
+def remove_temperatures(thermostat_pk, before):
+    """
+    Removes the archived temperatures of a thermostat older than the datetime. Returns their number.
+    """
+    removed = 0
+    for month in get_archived_months(thermostat_pk):
+        if month >= before:
+            break
+        path = get_month_path(thermostat_pk, month)
+        readings = read_month(thermostat_pk, month)
+        kept = [reading for reading in readings if reading[0] >= before]
+        if kept:
+            write_month(thermostat_pk, month, kept)
+        else:
+            os.remove(path)
+        removed += len(readings) - len(kept)
+    return removed
+
+
+class Segment:
+    """
+    The archived and the not yet archived temperatures of a thermostat within a month.
+    """
+
+    def __init__(self, thermostat_pk, month, stored, lower, upper, complete):
+        self.thermostat_pk = thermostat_pk
+        self.month = month
+        self.stored = stored
+        self.lower = lower
+        self.upper = upper
+        # Whether the month lies completely within the bounds
+        self.complete = complete
+        self._readings = None
+
+    @property
+    def readings(self):
+        if self._readings is None:
+            archived = [reading for reading in read_month(self.thermostat_pk, self.month)
+                        if in_bounds(reading[0], self.lower, self.upper)]
+            self._readings = merge(archived, self.stored)
+        return self._readings
+
+    def count(self):
+        if self._readings is None and self.complete and not self.stored:
+            path = get_month_path(self.thermostat_pk, self.month)
+            if os.path.exists(path):
+                return read_count(path)
+        return len(self.readings)
+
+
+def in_bounds(date, lower, upper):
+    """
+    Checks the datetime against (datetime, inclusive) lower and upper bounds, which may be None.
+    """
+    if lower is not None and (date < lower[0] or date == lower[0] and not lower[1]):
+        return False
+    if upper is not None and (date > upper[0] or date == upper[0] and not upper[1]):
+        return False
+    return True
+
+
+def get_tighter_bound(bound, other, choose):
+    """
+    Returns the tighter of two (datetime, inclusive) bounds, where `choose` is `max` for lower bounds
+    and `min` for upper bounds.
+    """
+    if bound is None:
+        return other
+    if bound[0] == other[0]:
+        return bound[0], bound[1] and other[1]
+    return choose(bound, other, key=lambda candidate: candidate[0])
+
+
+class TieredTemperatures:
+    """
+    Queryset-like sequence of the temperatures of a thermostat in the database and in the archive.
+
+    Supports filtering by datetime, ordering by datetime, counting, slicing and iteration, as used
+    by the time range filter and the paginations. The archive is read for the requested months only.
+    Yields model instances, or `TemperatureRow` tuples after calling `rows()`.
+    """
+
+    def __init__(self, thermostat_pk, queryset=None, thermostat=None):
+        self.thermostat_pk = thermostat_pk
+        self.queryset = queryset if queryset is not None else Temperature.objects.filter(thermostat_id=thermostat_pk)
+        self.thermostat = thermostat
+        self.lower = None
+        self.upper = None
+        self.reverse = False
+        self.as_rows = False
+        self._segments = None
+
+    def _clone(self, queryset):
+        clone = TieredTemperatures(self.thermostat_pk, queryset, self.thermostat)
+        clone.lower = self.lower
+        clone.upper = self.upper
+        clone.reverse = self.reverse
+        clone.as_rows = self.as_rows
+        return clone
+
+    def filter(self, **kwargs):
+        for lookup in kwargs:
+            if lookup not in DATETIME_LOOKUPS:
+                raise TypeError('Archived temperatures can only be filtered by datetime.')
+        clone = self._clone(self.queryset.filter(**kwargs))
+        for lookup, value in kwargs.items():
+            # The cursor pagination passes the position as a string
+            value = Temperature._meta.get_field('datetime').to_python(value)
+            if timezone.is_naive(value):
+                value = timezone.make_aware(value, timezone.get_current_timezone())
+            if lookup in ('datetime__gte', 'datetime__gt'):
+                clone.lower = get_tighter_bound(clone.lower, (value, lookup == 'datetime__gte'), max)
+            else:
+                clone.upper = get_tighter_bound(clone.upper, (value, lookup == 'datetime__lte'), min)
+        return clone
+
+    def order_by(self, *fields):
+        if fields not in (('datetime',), ('-datetime',)):
+            raise TypeError('Archived temperatures can only be ordered by datetime.')
+        clone = self._clone(self.queryset)
+        clone.reverse = fields[0] == '-datetime'
+        return clone
+
+    @property
+    def horizon(self):
+        """
+        The end of the last archived month. Later temperatures are only stored in the database.
+        """
+        if not hasattr(self, '_horizon'):
+            self._horizon = get_horizon(self.thermostat_pk)
+        return self._horizon
+
+    def overlaps(self, start, end):
+        """
+        Checks if the bounds overlap the range start <= datetime < end.
+        """
+        return ((self.lower is None or self.lower[0] < end) and
+                (self.upper is None or self.upper[0] > start or self.upper == (start, True)))
+
+    @property
+    def segments(self):
+        """
+        The months up to the horizon overlapping the bounds in ascending order.
+        """
+        if self._segments is None:
+            self._segments = []
+            horizon = self.horizon
+            if horizon is None:
+                return self._segments
+            stored = {}
+            for date, value in self.queryset.filter(datetime__lt=horizon).order_by('datetime').values_list(
+                    'datetime', 'value'):
+                stored.setdefault(get_month_start(date), []).append((date, value))
+            months = set(get_archived_months(self.thermostat_pk)).union(stored)
+            for month in sorted(months):
+                month_end = get_next_month(month)
+                if not self.overlaps(month, month_end):
+                    continue
+                complete = ((self.lower is None or self.lower[0] < month or self.lower == (month, True)) and
+                            (self.upper is None or self.upper[0] >= month_end))
+                self._segments.append(Segment(self.thermostat_pk, month, stored.get(month, []),
+                                              self.lower, self.upper, complete))
+        return self._segments
+
+    @property
+    def recent(self):
+        """
+        The temperatures after the horizon, which are only stored in the database.
+        """
+        horizon = self.horizon
+        queryset = self.queryset if horizon is None else self.queryset.filter(datetime__gte=horizon)
+        return queryset.order_by('-datetime' if self.reverse else 'datetime')
+
+    def count(self):
+        return sum(segment.count() for segment in self.segments) + self.recent.count()
+
+    def __len__(self):
+        return self.count()
+
+    def rows(self):
+        """
+        Returns a copy which yields `TemperatureRow` tuples instead of model instances.
+        """
+        clone = self._clone(self.queryset)
+        clone.as_rows = True
+        return clone
+
+    def make_temperature(self, reading):
+        if self.as_rows:
+            return TemperatureRow._make(reading)
+        temperature = Temperature(thermostat_id=self.thermostat_pk, datetime=reading[0], value=reading[1])
+        if self.thermostat is not None:
+            temperature.thermostat = self.thermostat
+        return temperature
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice) or index.step is not None or \
+                (index.start or 0) < 0 or (index.stop is not None and index.stop < 0):
+            raise TypeError('Archived temperatures only support slices with non-negative bounds.')
+        start = index.start or 0
+        stop = index.stop
+        segments = reversed(self.segments) if self.reverse else self.segments
+
+        result = []
+        recent = RowQuerySet(self.recent, TemperatureRow) if self.as_rows else self.recent
+        if self.reverse:
+            # The recent temperatures come first
+            result.extend(recent[start:stop])
+            if stop is not None and len(result) == stop - start:
+                return result
+            recent_count = recent.count()
+            start = max(0, start - recent_count)
+            stop = None if stop is None else stop - recent_count
+
+        for segment in segments:
+            if stop is not None and stop <= 0:
+                break
+            count = segment.count()
+            if start < count:
+                readings = segment.readings[::-1] if self.reverse else segment.readings
+                result.extend(self.make_temperature(reading)
+                              for reading in readings[start:None if stop is None else min(stop, count)])
+            start = max(0, start - count)
+            stop = None if stop is None else stop - count
+
+        if not self.reverse and (stop is None or stop > 0):
+            result.extend(recent[start:stop])
+        return result
+
+    def __iter__(self):
+        for temperature in self.readings():
+            yield self.make_temperature(temperature)
+
+    def readings(self, chunk_size=None):
+        """
+        Yields the (datetime, value) readings in order. The database is read in chunks.
+        """
+        if chunk_size is None:
+            chunk_size = settings.EXPORT_CHUNK_SIZE
+        if self.reverse:
+            yield from self.recent_readings(chunk_size)
+        for segment in (reversed(self.segments) if self.reverse else self.segments):
+            yield from (reversed(segment.readings) if self.reverse else segment.readings)
+        if not self.reverse:
+            yield from self.recent_readings(chunk_size)
+
+    def recent_readings(self, chunk_size):
+        queryset = self.recent.values_list('datetime', 'value')
+        after = None
+        while True:
+            if after is None:
+                chunk = queryset
+            else:
+                chunk = queryset.filter(**{'datetime__lt' if self.reverse else 'datetime__gt': after})
+            chunk = list(chunk[:chunk_size])
+            yield from chunk
+            if len(chunk) < chunk_size:
+                break
+            after = chunk[-1][0]
@@ -0,0 +1,125 @@
+"""
+Copyright 2016 Michael Spiegel, Wilhelm Kleiminger
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Forecasts the battery depletion of all thermostats.
+
+The battery levels of the recent meta entries are loaded in column form with a single query, and a linear
+trend is fitted to the levels of every thermostat in one vectorised pass: the sums of the least squares
+fit are accumulated per thermostat with `numpy.bincount` instead of a loop over the thermostats.
+"""
+
+import datetime
+
+import numpy
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from smart_heating import markers
+from smart_heating.models import BatteryForecast, ThermostatMetaEntry
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+def load_levels(since, thermostat_pks=None):
+    """
+    Returns the (thermostat pks, times, levels) columns of the battery levels since the given time, ordered by
+    thermostat and datetime. Times are seconds since the epoch.
+    """
+    queryset = ThermostatMetaEntry.objects.filter(datetime__gte=since, battery__isnull=False)
+    if thermostat_pks is not None:
+        queryset = queryset.filter(thermostat_id__in=thermostat_pks)
+    rows = queryset.order_by('thermostat_id', 'datetime').values_list('thermostat_id', 'datetime', 'battery')
+    columns = list(zip(*rows.iterator()))
+    if not columns:
+        return numpy.array([], dtype=object), numpy.array([]), numpy.array([])
+    thermostat_column, datetime_column, level_column = columns
+    times = numpy.fromiter((date.timestamp() for date in datetime_column), dtype=float, count=len(datetime_column))
+    return numpy.array(thermostat_column, dtype=object), times, numpy.array(level_column, dtype=float)
+
+
+def fit(thermostat_column, times, levels, now):
+    """
+    Fits a linear trend to the levels of each thermostat and projects when it reaches `BATTERY_EMPTY_LEVEL`.
+
+    Expects the columns to be ordered by thermostat and time. Returns a list of unsaved `BatteryForecast`
+    objects of the thermostats with at least `BATTERY_FORECAST_MIN_ENTRIES` levels.
+    """
+    if len(thermostat_column) == 0:
+        return []
+    # The entries of each thermostat are contiguous, so each run is a group
+    starts = numpy.concatenate(([True], thermostat_column[1:] != thermostat_column[:-1]))
+    groups = numpy.cumsum(starts) - 1
+    thermostat_pks = thermostat_column[starts]
+    last = numpy.concatenate((numpy.flatnonzero(starts)[1:] - 1, [len(groups) - 1]))
+
+    days = (times - now.timestamp()) / SECONDS_PER_DAY
+    count = numpy.bincount(groups)
+    mean_days = numpy.bincount(groups, days) / count
+    mean_levels = numpy.bincount(groups, levels) / count
+    # Centered per thermostat for numerical stability
+    centered_days = days - mean_days[groups]
+    centered_levels = levels - mean_levels[groups]
+    sxx = numpy.bincount(groups, centered_days * centered_days)
+    sxy = numpy.bincount(groups, centered_days * centered_levels)
+    syy = numpy.bincount(groups, centered_levels * centered_levels)
+
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        slopes = numpy.where(sxx > 0, sxy / sxx, 0.0)
+        confidences = numpy.where((sxx > 0) & (syy > 0), sxy * sxy / (sxx * syy), 0.0)
+        empty_days = numpy.where(slopes < 0, mean_days + (settings.BATTERY_EMPTY_LEVEL - mean_levels) / slopes,
+                                 numpy.nan)
+    # Without decrease or beyond the horizon there is no projection
+    projected = numpy.isfinite(empty_days) & (numpy.abs(empty_days) <= settings.BATTERY_FORECAST_HORIZON_DAYS)
+    confidences[slopes >= 0] = 0.0
+
+    forecasts = []
+    for index in numpy.flatnonzero(count >= settings.BATTERY_FORECAST_MIN_ENTRIES):
+        empty_date = now + datetime.timedelta(days=float(empty_days[index])) if projected[index] else None
+        forecasts.append(BatteryForecast(thermostat_id=thermostat_pks[index], computed=now,
+                                         count=int(count[index]), battery=int(levels[last[index]]),
+                                         slope=float(slopes[index]), empty_date=empty_date,
+                                         confidence=float(confidences[index])))
+    return forecasts
+
+
+def forecast(thermostat_pks=None, now=None):
+    """
+    Returns the battery forecasts of the given thermostats, or of all thermostats, based on the meta entries
+    of the last `BATTERY_FORECAST_DAYS` days.
+    """
+    if now is None:
+        now = timezone.now()
+    since = now - datetime.timedelta(days=settings.BATTERY_FORECAST_DAYS)
+    return fit(*load_levels(since, thermostat_pks), now=now)
+
+
+def update(thermostat_pks=None, now=None):
+    """
+    Replaces the stored battery forecasts of the given thermostats, or of all thermostats.
+
+    Returns the number of forecasts written.
+    """
+    forecasts = forecast(thermostat_pks, now)
+    with transaction.atomic():
+        stored = BatteryForecast.objects.all()
+        if thermostat_pks is not None:
+            stored = stored.filter(thermostat_id__in=thermostat_pks)
+        stored.delete()
+        BatteryForecast.objects.bulk_create(forecasts)
+        markers.touch([markers.get_model_key(BatteryForecast)])
+    return len(forecasts)
@@ -0,0 +1,80 @@
+"""
+Copyright 2016 Michael Spiegel, Wilhelm Kleiminger
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Opt-in cache of rendered responses.
+
+A response is stored under its scheme, host, path, query string, media type and entity tag. The scheme
+and host are part of the key, since the representations contain absolute urls. The entity tag is derived
+from the change markers, which writes touch for the affected objects and collections only, see
+`smart_heating.markers`. A write therefore invalidates exactly the responses of its subtree, whose keys
+change with it. Outdated entries are never read again and expire.
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+
+def get_cache():
+    """
+    Returns the cache configured by `RESPONSE_CACHE`, or None if the response cache is disabled.
+    """
+    if settings.RESPONSE_CACHE is None:
+        return None
+    return caches[settings.RESPONSE_CACHE]
+
+
+def get_key(request, etag):
+    source = '\n'.join((request.scheme, request.get_host(), request.get_full_path(), request.accepted_media_type or '',
+                        etag))
+    return 'smart_heating.response:' + hashlib.md5(source.encode()).hexdigest()
+
+
+def is_cacheable(request):
+    # The browsable API includes user specific data
+    return request.accepted_renderer.format != 'api'
+
+
+def get_response(request, etag):
+    """
+    Returns the cached response of the request or None.
+    """
+    cache = get_cache()
+    if cache is None or not is_cacheable(request):
+        return None
+    cached = cache.get(get_key(request, etag))
+    if cached is None:
+        return None
+    content, content_type = cached
+    return HttpResponse(content, content_type=content_type)
+
+
+def store_response(request, etag, response):
+    """
+    Stores the response in the cache as soon as it is rendered.
+    """
+    cache = get_cache()
+    if cache is None or not is_cacheable(request):
+        return
+    key = get_key(request, etag)
+
+    def store(rendered_response):
+        cache.set(key, (rendered_response.content, rendered_response['Content-Type']), settings.RESPONSE_CACHE_TIMEOUT)
+
+    response.add_post_render_callback(store)
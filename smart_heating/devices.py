@@ -0,0 +1,116 @@
+"""
+Copyright 2016 Michael Spiegel, Wilhelm Kleiminger
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+In-process index of the devices by MAC address and RFID.
+
+Every gateway and thermostat looks up its device by MAC address on boot. The index maps the canonical MAC
+addresses to the RFIDs of a device model, so lookups of unknown or many addresses don't query the device
+table. The index is versioned by the change marker of the model, which every device write touches, so a
+write in any process invalidates it. Writes in this process also drop it immediately.
+"""
+
+import bisect
+
+from smart_heating import markers
+from smart_heating.models import ChangeMarker, mac_separators_re, normalize_mac
+
+# Maximum number of devices returned by a prefix search
+SEARCH_LIMIT = 20
+
+# Maximum number of MAC addresses of a batch lookup
+MAX_LOOKUP_MACS = 100
+
+# Index of each device model
+_indexes = {}
+
+
+def normalize_mac_prefix(value):
+    """
+    Returns the canonical form of the beginning of a MAC address, e.g. 'aa:bb:c' for 'AA-BB-C', or None.
+    """
+    digits = mac_separators_re.sub('', value).lower()
+    if len(digits) > 12 or any(digit not in '0123456789abcdef' for digit in digits):
+        return None
+    return ':'.join(digits[index:index + 2] for index in range(0, len(digits), 2))
+
+
+def get_prefix_range(keys, prefix):
+    """
+    Returns the keys of the sorted list starting with the prefix.
+    """
+    start = bisect.bisect_left(keys, prefix)
+    end = start
+    while end < len(keys) and keys[end].startswith(prefix):
+        end += 1
+    return keys[start:end]
+
+
+class DeviceIndex:
+    """
+    RFIDs of the devices by their canonical MAC address, with sorted keys for prefix searches.
+    """
+
+    def __init__(self, version, rows):
+        self.version = version
+        self.by_mac = dict(rows)
+        self.macs = sorted(self.by_mac)
+        self.rfids = sorted(self.by_mac.values())
+
+    def get(self, mac):
+        """
+        Returns the RFID of the device with the MAC address, or None.
+        """
+        normalized = normalize_mac(mac)
+        return self.by_mac.get(normalized) if normalized is not None else None
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        """
+        Returns the RFIDs of the devices whose RFID or MAC address starts with the query, in RFID order.
+        """
+        query = query.strip()
+        if not query:
+            return []
+        rfids = set(get_prefix_range(self.rfids, query))
+        mac_prefix = normalize_mac_prefix(query)
+        if mac_prefix:
+            rfids.update(self.by_mac[mac] for mac in get_prefix_range(self.macs, mac_prefix))
+        return sorted(rfids)[:limit]
+
+
+def get_version(model):
+    version = ChangeMarker.objects.filter(key=markers.get_model_key(model)).values_list('version', flat=True)
+    return version[0] if version else 0
+
+
+def get_index(model):
+    """
+    Returns the up to date index of the device model. Reads the version of the index with a single query and
+    reloads the index if the devices were written since.
+    """
+    version = get_version(model)
+    index = _indexes.get(model)
+    if index is None or index.version != version:
+        index = DeviceIndex(version, list(model.objects.values_list('mac', 'pk')))
+        _indexes[model] = index
+    return index
+
+
+def clear_index(sender, **kwargs):
+    """
+    Drops the index of the device model after a write. Connected to the signals of the device models.
+    """
+    _indexes.pop(sender, None)
@@ -0,0 +1,144 @@
+"""
+Copyright 2016 Michael Spiegel, Wilhelm Kleiminger
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Reduces time series of (x, y) points to a target number of points.
+
+The series are consumed as iterators and only the points of the current and the next bucket are
+kept in memory. The total number of points must be known in advance to determine the buckets.
+"""
+
+from itertools import islice
+
+LTTB = 'lttb'
+MIN_MAX = 'minmax'
+MODES = (LTTB, MIN_MAX)
+
+
+def get_bucket_bounds(index, bucket_size, count):
+    """
+    Returns the (start, end) indices of the bucket with the given index.
+
+    The first and the last point of the series are not part of any bucket.
+    """
+    start = int(index * bucket_size) + 1
+    end = min(int((index + 1) * bucket_size) + 1, count - 1)
+    return start, end
+
+
+def lttb(points, count, threshold):
+    """
+    Downsamples the points with the Largest-Triangle-Three-Buckets algorithm.
+
+    Keeps the first and the last point and selects the point of each bucket that forms the largest
+    triangle with the previously selected point and the average of the next bucket.
+    Yields at most `threshold` points.
+    """
+    points = iter(points)
+    if threshold >= count or threshold < 2:
+        yield from points
+        return
+    # The series may end early if points were deleted after counting them
+    first = next(points, None)
+    if first is None:
+        return
+    if threshold == 2:
+        # No buckets between the first and the last point
+        last = first
+        for last in points:
+            pass
+        yield first
+        if last is not first:
+            yield last
+        return
+
+    bucket_size = (count - 2) / (threshold - 2)
+    selected = first
+    yield selected
+
+    start, end = get_bucket_bounds(0, bucket_size, count)
+    bucket = list(islice(points, end - start))
+    for index in range(threshold - 2):
+        if index < threshold - 3:
+            start, end = get_bucket_bounds(index + 1, bucket_size, count)
+            next_bucket = list(islice(points, end - start))
+        else:
+            # The last point is the third vertex of the last bucket
+            next_bucket = list(islice(points, 1))
+        if not next_bucket:
+            # The series ended early, keep its last point
+            if bucket:
+                yield bucket[-1]
+            return
+        average_x = sum(point[0] for point in next_bucket) / len(next_bucket)
+        average_y = sum(point[1] for point in next_bucket) / len(next_bucket)
+
+        selected_x, selected_y = selected
+        max_area = -1
+        for point in bucket:
+            # Twice the area of the triangle, which doesn't change the maximum
+            area = abs((selected_x - average_x) * (point[1] - selected_y) -
+                       (selected_x - point[0]) * (average_y - selected_y))
+            if area > max_area:
+                max_area = area
+                candidate = point
+        selected = candidate
+        yield selected
+        bucket = next_bucket
+
+    yield bucket[0]
+
+
+def min_max(points, count, threshold):
+    """
+    Downsamples the points by the minimum and the maximum of each bucket.
+
+    The series is divided into `threshold // 2` buckets. The minimum and the maximum of each bucket
+    are yielded in the order of the series. Yields at most `threshold` points.
+    """
+    points = iter(points)
+    buckets = threshold // 2
+    if threshold >= count or buckets < 1:
+        yield from points
+        return
+
+    bucket_size = count / buckets
+    for index in range(buckets):
+        size = int((index + 1) * bucket_size) - int(index * bucket_size)
+        minimum = maximum = None
+        for position, point in enumerate(islice(points, size)):
+            if minimum is None or point[1] < minimum[1][1]:
+                minimum = (position, point)
+            if maximum is None or point[1] > maximum[1][1]:
+                maximum = (position, point)
+        if minimum is None:
+            continue
+        if minimum[0] == maximum[0]:
+            yield minimum[1]
+        else:
+            for position, point in sorted([minimum, maximum], key=lambda entry: entry[0]):
+                yield point
+
+
+def downsample(points, count, threshold, mode=LTTB):
+    """
+    Downsamples the points with the given mode.
+    """
+    if mode == LTTB:
+        return lttb(points, count, threshold)
+    if mode == MIN_MAX:
+        return min_max(points, count, threshold)
+    raise ValueError('Unknown downsampling mode: %s' % mode)
@@ -0,0 +1,126 @@
+"""
+Copyright 2016 Michael Spiegel, Wilhelm Kleiminger
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Streams the temperatures or meta entries of a set of thermostats as CSV or newline delimited JSON.
+
+The entries are read in chunks along the (thermostat, datetime) index, so the memory usage doesn't
+depend on the length of the history.
+"""
+
+import csv
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+
+from smart_heating.archive import TieredTemperatures
+from smart_heating.filters import filter_time_range
+from smart_heating.models import Temperature, ThermostatMetaEntry
+
+CSV = 'csv'
+NDJSON = 'ndjson'
+FORMATS = (CSV, NDJSON)
+
+# Model and exported fields of each series
+SERIES = OrderedDict([
+    ('temperature', (Temperature, ('datetime', 'value'))),
+    ('meta_entry', (ThermostatMetaEntry, ('datetime', 'rssi', 'uptime', 'battery'))),
+])
+
+SERIES_QUERY_PARAM = 'series'
+
+datetime_field = serializers.DateTimeField()
+
+
+class Echo:
+    """
+    File-like object which returns the written value instead of buffering it.
+    """
+
+    def write(self, value):
+        return value
+
+
+def get_series(request):
+    """
+    Returns the series given by the `series` query parameter, temperatures by default.
+    """
+    series = request.query_params.get(SERIES_QUERY_PARAM) or 'temperature'
+    if series not in SERIES:
+        raise ValidationError({SERIES_QUERY_PARAM: ['Expected one of: %s.' % ', '.join(SERIES)]})
+    return series
+
+
+def get_rows(model, fields, thermostat_pks, start=None, end=None, chunk_size=None):
+    """
+    Yields (thermostat_pk, field values...) tuples of the entries of the thermostats ordered by thermostat
+    and datetime.
+
+    Each chunk continues after the datetime of the previous chunk instead of using an offset.
+    """
+    if chunk_size is None:
+        chunk_size = settings.EXPORT_CHUNK_SIZE
+    for thermostat_pk in thermostat_pks:
+        if model is Temperature:
+            # Include the archived temperatures
+            temperatures = filter_time_range(TieredTemperatures(thermostat_pk), start, end)
+            yield from ((thermostat_pk,) + reading for reading in temperatures.readings(chunk_size))
+            continue
+        queryset = filter_time_range(model.objects.filter(thermostat_id=thermostat_pk), start, end)
+        queryset = queryset.order_by('datetime').values_list(*fields)
+        after = None
+        while True:
+            chunk = queryset if after is None else queryset.filter(datetime__gt=after)
+            chunk = list(chunk[:chunk_size])
+            for row in chunk:
+                yield (thermostat_pk,) + row
+            if len(chunk) < chunk_size:
+                break
+            after = chunk[-1][0]
+
+
+def format_value(value):
+    if hasattr(value, 'isoformat'):
+        return datetime_field.to_representation(value)
+    return value
+
+
+def stream_series(series, export_format, thermostat_pks, start=None, end=None):
+    """
+    Yields the CSV or NDJSON lines of the series of the thermostats in chunks.
+    """
+    model, fields = SERIES[series]
+    columns = ('thermostat',) + fields
+    rows = get_rows(model, fields, thermostat_pks, start, end)
+    if export_format == CSV:
+        writer = csv.writer(Echo())
+        lines = (writer.writerow([format_value(value) for value in row]) for row in rows)
+        yield writer.writerow(columns)
+    else:
+        lines = (json.dumps(OrderedDict(zip(columns, (format_value(value) for value in row)))) + '\n'
+                 for row in rows)
+
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= settings.EXPORT_CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
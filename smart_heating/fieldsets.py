@@ -0,0 +1,163 @@
+"""
+Copyright 2016 Michael Spiegel, Wilhelm Kleiminger
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Sparse fieldsets and depth control of the representations.
+
+`?fields=rfid,room.name` restricts the representation to the given fields, where nested fields are
+separated by dots. `?depth=1` embeds nested objects up to the given level and represents deeper ones by
+their url, unless they are listed in `?expand=room.residence`. The unused fields are removed from the
+serializers before the representation is built, so their related objects and urls aren't looked up.
+"""
+
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+
+from smart_heating import relations
+
+FIELDS_QUERY_PARAM = 'fields'
+EXPAND_QUERY_PARAM = 'expand'
+DEPTH_QUERY_PARAM = 'depth'
+
+
+def parse_paths(value):
+    """
+    Parses a comma separated list of dotted field paths into a set of tuples.
+    """
+    return set(tuple(path.strip().split('.')) for path in value.split(',') if path.strip())
+
+
+class Selection:
+    """
+    Fields, expanded objects and depth requested by the query parameters.
+    """
+
+    def __init__(self, fields=None, expand=(), depth=None):
+        self.fields = fields
+        self.expand = set(expand)
+        self.depth = depth
+
+    @classmethod
+    def from_request(cls, request):
+        """
+        Returns the selection of the request. Memoised on the request.
+
+        Requests which modify objects are represented with all fields.
+        """
+        if not hasattr(request, '_field_selection'):
+            if request.method not in SAFE_METHODS:
+                request._field_selection = cls()
+                return request._field_selection
+            params = request.query_params
+            fields = params.get(FIELDS_QUERY_PARAM)
+            depth = params.get(DEPTH_QUERY_PARAM)
+            if depth is not None and depth != '':
+                try:
+                    depth = int(depth)
+                except ValueError:
+                    raise ValidationError({DEPTH_QUERY_PARAM: ['A valid integer is required.']})
+                if depth < 0:
+                    raise ValidationError({DEPTH_QUERY_PARAM: ['Ensure this value is greater than or equal to 0.']})
+            else:
+                depth = None
+            request._field_selection = cls(fields=parse_paths(fields) if fields else None,
+                                           expand=parse_paths(params.get(EXPAND_QUERY_PARAM, '')), depth=depth)
+        return request._field_selection
+
+    def get_field_names(self, path, names):
+        """
+        Returns the selected names of the fields of the object at the path.
+        """
+        if self.fields is None or any(path[:len(selected)] == selected for selected in self.fields):
+            return list(names)
+        selected = set(selected[len(path)] for selected in self.fields
+                       if len(selected) > len(path) and selected[:len(path)] == path)
+        return [name for name in names if name in selected]
+
+    def is_expanded(self, path):
+        """
+        Checks if the nested object at the path is embedded rather than represented by its url.
+
+        Selecting or expanding a field of a nested object expands the object.
+        """
+        if self.depth is None or len(path) <= self.depth:
+            return True
+        return any(len(selected) > len(path) and selected[:len(path)] == path for selected in self.fields or ()) or \
+            any(expanded[:len(path)] == path for expanded in self.expand)
+
+
+def get_selection(serializer):
+    """
+    Returns the selection of the request in the context of the serializer, or None.
+    """
+    request = serializer.context.get('request')
+    if request is None:
+        return None
+    return Selection.from_request(request)
+
+
+def get_path(serializer):
+    """
+    Returns the names of the fields leading from the root serializer to the serializer.
+    """
+    path = []
+    while getattr(serializer, 'parent', None) is not None:
+        if serializer.field_name:
+            path.append(serializer.field_name)
+        serializer = serializer.parent
+    return tuple(reversed(path))
+
+
+def get_url_view_name(serializer):
+    """
+    Returns the view name of the url field of a serializer, or None.
+    """
+    url_field = serializer._declared_fields.get('url')
+    if url_field is not None:
+        return url_field.view_name
+    meta = getattr(serializer, 'Meta', None)
+    if isinstance(serializer, serializers.HyperlinkedModelSerializer) and 'url' in getattr(meta, 'fields', ()):
+        return '%s-detail' % meta.model._meta.object_name.lower()
+    return None
+
+
+def collapse(field):
+    """
+    Returns a field representing the objects of a nested serializer by their url, or None if they don't have one.
+    """
+    many = isinstance(field, serializers.ListSerializer)
+    view_name = get_url_view_name(field.child if many else field)
+    if view_name is None:
+        return None
+    kwargs = {'many': True} if many else {}
+    return relations.HierarchicalHyperlinkedRelatedField(view_name=view_name, source=field.source, read_only=True,
+                                                         **kwargs)
+
+
+def select_fields(fields, path, selection):
+    """
+    Returns the selected fields of the object at the path. Nested objects beyond the depth are collapsed.
+    """
+    selected = type(fields)()
+    for name in selection.get_field_names(path, fields):
+        field = fields[name]
+        if isinstance(field, serializers.BaseSerializer) and not selection.is_expanded(path + (name,)):
+            field = collapse(field)
+            if field is None:
+                continue
+        selected[name] = field
+    return selected
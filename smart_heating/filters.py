@@ -0,0 +1,125 @@
+"""
+Copyright 2016 Michael Spiegel, Wilhelm Kleiminger
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import datetime
+import re
+
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import filters
+from rest_framework.exceptions import ValidationError
+from rest_framework.utils.urls import replace_query_param
+
+FROM_QUERY_PARAM = 'from'
+TO_QUERY_PARAM = 'to'
+TIME_RANGE_QUERY_PARAMS = (FROM_QUERY_PARAM, TO_QUERY_PARAM)
+AT_QUERY_PARAM = 'at'
+
+INVALID_DATETIME_MESSAGE = 'Expected an ISO 8601 datetime or milliseconds since the epoch.'
+
+epoch_milliseconds_re = re.compile(r'^-?\d+$')
+# An unescaped plus sign of the UTC offset is decoded to a space in query strings
+decoded_utc_offset_re = re.compile(r' (\d{2}(?::?\d{2})?)$')
+
+
+def parse_datetime_param(value):
+    """
+    Parses an ISO 8601 datetime or milliseconds since the epoch.
+
+    Naive datetimes are interpreted in the current time zone. Returns None if the value is invalid.
+    """
+    value = value.strip()
+    if epoch_milliseconds_re.match(value):
+        try:
+            return datetime.datetime.fromtimestamp(int(value) / 1000, timezone.utc)
+        except (OverflowError, ValueError, OSError):
+            return None
+    try:
+        parsed = parse_datetime(decoded_utc_offset_re.sub(r'+\1', value))
+    except ValueError:
+        return None
+    if parsed is not None and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, timezone.get_current_timezone())
+    return parsed
+
+
+def get_time_range(request):
+    """
+    Returns the (start, end) tuple given by the `from` and `to` query parameters.
+
+    Missing bounds are None. Raises a validation error if a bound is invalid.
+    """
+    bounds = []
+    for param in TIME_RANGE_QUERY_PARAMS:
+        value = request.query_params.get(param)
+        if value is None or value == '':
+            bounds.append(None)
+            continue
+        bound = parse_datetime_param(value)
+        if bound is None:
+            raise ValidationError({param: [INVALID_DATETIME_MESSAGE]})
+        bounds.append(bound)
+    return tuple(bounds)
+
+
+def get_time(request):
+    """
+    Returns the time given by the `at` query parameter, or now.
+
+    Raises a validation error if the time is invalid.
+    """
+    value = request.query_params.get(AT_QUERY_PARAM)
+    if value is None or value == '':
+        return timezone.now()
+    parsed = parse_datetime_param(value)
+    if parsed is None:
+        raise ValidationError({AT_QUERY_PARAM: [INVALID_DATETIME_MESSAGE]})
+    return parsed
+
+
+def filter_time_range(queryset, start, end, field='datetime'):
+    """
+    Restricts the queryset to the entries with start <= datetime < end.
+    """
+    if start is not None:
+        queryset = queryset.filter(**{field + '__gte': start})
+    if end is not None:
+        queryset = queryset.filter(**{field + '__lt': end})
+    return queryset
+
+
+def add_time_range_query_params(url, request):
+    """
+    Adds the time range query parameters of the request to the url.
+    """
+    for param in TIME_RANGE_QUERY_PARAMS:
+        value = request.query_params.get(param)
+        if value is not None:
+            url = replace_query_param(url, param, value)
+    return url
+
+
+class TimeRangeFilter(filters.BaseFilterBackend):
+    """
+    Filters time series by the `from` (inclusive) and `to` (exclusive) query parameters.
+
+    Both accept an ISO 8601 datetime or milliseconds since the epoch. The filter is served by
+    the (thermostat, datetime) index.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        start, end = get_time_range(request)
+        return filter_time_range(queryset, start, end)
@@ -0,0 +1,244 @@
+"""
+Copyright 2016 Michael Spiegel, Wilhelm Kleiminger
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Versioned configuration of the local communication gateways.
+
+The configuration of a residence consists of its rooms, thermostats, thermostat devices and heating tables.
+Its version is the change marker `markers.get_config_key(residence_pk)`, which the signals touch on each
+write of these objects, so it increases monotonically. Gateways long-poll the version instead of
+polling every collection.
+
+A blocked long-poll occupies a worker thread, so the server must run threaded workers, as the development
+server started by `scripts/restart_server.sh` does. Behind a WSGI server, e.g. gunicorn with
+`--worker-class gthread`, each worker thread serves at most one waiting gateway at a time. The blocked
+long-polls of a process share a single version query per `GATEWAY_CONFIG_POLL_INTERVAL`, see `Poller`.
+"""
+
+import collections
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Prefetch
+from rest_framework.exceptions import ValidationError
+
+from smart_heating import markers
+from smart_heating.models import ChangeMarker, Residence, Room, Thermostat, HeatingTableEntry, ThermostatDevice
+
+SINCE_VERSION_QUERY_PARAM = 'since_version'
+WAIT_QUERY_PARAM = 'wait'
+
+CONFIG_MODELS = (Residence, Room, Thermostat, HeatingTableEntry, ThermostatDevice)
+
+
+def get_residence_pks(instance):
+    """
+    Returns the primary keys of the residences whose configuration contains the object.
+    """
+    model = type(instance)
+    if model is Residence:
+        residence_pks = [instance.pk]
+    elif model is Room:
+        residence_pks = [instance.residence_id]
+    elif model is Thermostat:
+        residence_pks = Room.objects.filter(pk=instance.room_id).values_list('residence_id', flat=True)
+    elif model is HeatingTableEntry:
+        residence_pks = Thermostat.objects.filter(pk=instance.thermostat_id).values_list('room__residence_id',
+                                                                                         flat=True)
+    elif model is ThermostatDevice:
+        # Related to the thermostat by its RFID
+        residence_pks = Thermostat.objects.filter(pk=instance.pk).values_list('room__residence_id', flat=True)
+    else:
+        residence_pks = []
+    return set(residence_pks)
+
+
+def remember_previous_residences(instance):
+    """
+    Remembers the residences of an object before it is updated, since an update may move it to another residence.
+
+    Only rooms, thermostats and heating table entries refer to a residence by a writable field.
+    """
+    if instance.pk is None or type(instance) not in (Room, Thermostat, HeatingTableEntry):
+        return
+    previous = type(instance).objects.filter(pk=instance.pk).first()
+    instance._previous_config_residence_pks = get_residence_pks(previous) if previous is not None else set()
+
+
+def touch(instance):
+    """
+    Increments the configuration version of the residences of a written object.
+    """
+    touch_residences(get_residence_pks(instance) | getattr(instance, '_previous_config_residence_pks', set()))
+
+
+def touch_residences(residence_pks, keys=()):
+    """
+    Increments the configuration version of the residences, together with the other markers given by `keys`,
+    and wakes up the long-polls waiting in this process.
+    """
+    keys = list(keys) + [markers.get_config_key(residence_pk) for residence_pk in residence_pks]
+    if not keys:
+        return
+    markers.touch(keys)
+    poller.notify()
+
+
+def get_versions(residence_pks):
+    """
+    Returns a dict of the configuration versions of the residences, read with a single query.
+    """
+    residence_pks_by_key = dict((markers.get_config_key(residence_pk), residence_pk) for residence_pk in residence_pks)
+    versions = dict.fromkeys(residence_pks, 0)
+    for key, version in ChangeMarker.objects.filter(key__in=list(residence_pks_by_key)).values_list('key', 'version'):
+        versions[residence_pks_by_key[key]] = version
+    return versions
+
+
+def get_version(residence_pk):
+    return get_versions([residence_pk])[residence_pk]
+
+
+def get_etag(residence_pk, version, variant=''):
+    source = '%s=%d;%s' % (markers.get_config_key(residence_pk), version, variant)
+    return hashlib.md5(source.encode()).hexdigest()
+
+
+def get_poll_params(request):
+    """
+    Returns the (since_version, wait) tuple of the long-poll query parameters.
+
+    `since_version` is None without long-poll. `wait` is the number of seconds to block, limited to
+    `GATEWAY_CONFIG_MAX_WAIT`. Raises a validation error if a parameter isn't a non-negative integer.
+    """
+    params = []
+    for param, default in ((SINCE_VERSION_QUERY_PARAM, None), (WAIT_QUERY_PARAM, 0)):
+        value = request.query_params.get(param, '')
+        if value == '':
+            params.append(default)
+        elif not value.isdigit():
+            raise ValidationError({param: ['Expected a non-negative integer.']})
+        else:
+            params.append(int(value))
+    since_version, wait = params
+    return since_version, min(wait, settings.GATEWAY_CONFIG_MAX_WAIT)
+
+
+class Poller:
+    """
+    Reads the configuration versions of all residences long-polled in this process.
+
+    One of the waiting threads at a time reads the versions of all waited-on residences with a single query,
+    every `GATEWAY_CONFIG_POLL_INTERVAL` seconds or as soon as a write in this process calls `notify()`,
+    and wakes up the others. The query runs on the database connection of the polling thread.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        # Number of waiting threads per residence
+        self.waiting = collections.Counter()
+        self.versions = {}
+        self.polling = False
+        # Number of the last started and the last finished poll
+        self.started = 0
+        self.finished = 0
+        # Monotonic start time of the last poll, None to poll without waiting for the interval
+        self.polled = None
+
+    def notify(self):
+        with self.condition:
+            self.polled = None
+            self.condition.notify_all()
+
+    def poll(self):
+        """
+        Reads the versions of the waited-on residences. Must be called with the condition acquired.
+        """
+        self.polling = True
+        self.polled = time.monotonic()
+        self.started += 1
+        number = self.started
+        residence_pks = list(self.waiting)
+        self.condition.release()
+        try:
+            versions = get_versions(residence_pks)
+        finally:
+            self.condition.acquire()
+            self.polling = False
+            self.condition.notify_all()
+        self.versions = versions
+        self.finished = number
+
+    def wait(self, residence_pk, since_version, wait):
+        deadline = time.monotonic() + wait
+        with self.condition:
+            self.waiting[residence_pk] += 1
+            # The version is only current once a poll started after this thread began waiting
+            current = self.started + 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    if self.finished >= current:
+                        version = self.versions[residence_pk]
+                        if version > since_version or now >= deadline:
+                            return version
+                    if self.polling:
+                        # Woken up at the end of the poll, which is awaited regardless of the deadline
+                        self.condition.wait(None if self.finished < current else deadline - now)
+                    elif self.finished < current or self.polled is None or \
+                            now >= self.polled + settings.GATEWAY_CONFIG_POLL_INTERVAL:
+                        self.poll()
+                    else:
+                        self.condition.wait(min(deadline, self.polled + settings.GATEWAY_CONFIG_POLL_INTERVAL) - now)
+            finally:
+                self.waiting[residence_pk] -= 1
+                if not self.waiting[residence_pk]:
+                    del self.waiting[residence_pk]
+
+
+poller = Poller()
+
+
+def wait_for_version(residence_pk, since_version, wait):
+    """
+    Blocks until the configuration version of the residence is greater than `since_version` or `wait`
+    seconds passed. Returns the current version.
+
+    The version is read by the poller every `GATEWAY_CONFIG_POLL_INTERVAL` seconds, so writes of other
+    processes are noticed as well.
+    """
+    return poller.wait(residence_pk, since_version, wait)
+
+
+def get_config(residence_pk):
+    """
+    Returns the residence with its rooms, thermostats and heating tables, or None if it doesn't exist.
+
+    The device of each thermostat is set as its `device` attribute. Runs a constant number of queries.
+    """
+    residence = Residence.objects.filter(pk=residence_pk).prefetch_related(
+        Prefetch('rooms', queryset=Room.objects.select_related('residence')),
+        'rooms__thermostats', 'rooms__thermostats__heating_table_entries').first()
+    if residence is None:
+        return None
+    thermostats = [thermostat for room in residence.rooms.all() for thermostat in room.thermostats.all()]
+    thermostat_devices = ThermostatDevice.objects.in_bulk([thermostat.pk for thermostat in thermostats]) \
+        if thermostats else {}
+    for thermostat in thermostats:
+        thermostat.device = thermostat_devices.get(thermostat.pk)
+    return residence
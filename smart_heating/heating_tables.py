@@ -0,0 +1,114 @@
+"""
+Copyright 2016 Michael Spiegel, Wilhelm Kleiminger
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Bulk replacement and copies of the weekly heating tables of thermostats.
+
+A table is validated in memory. The difference to the stored entries is applied with a single delete, a
+single bulk insert and one update per distinct temperature, in one transaction. Bulk writes don't send
+signals, so the change markers and the gateway configuration versions are touched explicitly.
+"""
+
+from collections import defaultdict, OrderedDict
+
+from django.db import transaction
+
+from smart_heating import gateway_config, markers
+from smart_heating.models import HeatingTableEntry, Thermostat
+from smart_heating.serializers import HeatingTableItemSerializer
+
+DUPLICATE_MESSAGE = 'An entry with this day and time is given more than once.'
+
+
+def get_key(day, time):
+    # Days are stored as strings
+    return str(day), time
+
+
+def validate_table(items, partial=False):
+    """
+    Validates a list of heating table items.
+
+    Returns a ({(day, time): temperature}, errors) tuple, where errors is None if all items are valid and
+    otherwise a list of the errors of each item. With `partial`, a temperature of None removes the entry.
+    """
+    table = OrderedDict()
+    errors = []
+    for item in items:
+        serializer = HeatingTableItemSerializer(data=item, partial_table=partial)
+        if not serializer.is_valid():
+            errors.append(serializer.errors)
+            continue
+        key = get_key(serializer.validated_data['day'], serializer.validated_data['time'])
+        if key in table:
+            errors.append({'non_field_errors': [DUPLICATE_MESSAGE]})
+            continue
+        table[key] = serializer.validated_data['temperature']
+        errors.append({})
+    return table, errors if any(errors) else None
+
+
+def apply_table(thermostat_pks, residence_pks, table, partial=False):
+    """
+    Applies the table to each of the thermostats of the residences in a single transaction.
+
+    Without `partial` the table replaces the stored entries, otherwise the given entries are added,
+    updated or, with a temperature of None, removed. Returns True if any entry changed.
+    """
+    thermostat_pks = list(OrderedDict.fromkeys(thermostat_pks))
+    with transaction.atomic():
+        # Serialises concurrent edits of the same tables
+        list(Thermostat.objects.select_for_update().filter(pk__in=thermostat_pks).values_list('pk', flat=True))
+        stored = defaultdict(dict)
+        for pk, thermostat_pk, day, time, temperature in HeatingTableEntry.objects.filter(
+                thermostat_id__in=thermostat_pks).values_list('pk', 'thermostat_id', 'day', 'time', 'temperature'):
+            stored[thermostat_pk][get_key(day, time)] = (pk, temperature)
+
+        created = []
+        updated = defaultdict(list)
+        deleted = []
+        for thermostat_pk in thermostat_pks:
+            entries = stored[thermostat_pk]
+            for key, temperature in table.items():
+                if key not in entries:
+                    if temperature is not None:
+                        created.append(HeatingTableEntry(thermostat_id=thermostat_pk, day=key[0], time=key[1],
+                                                         temperature=temperature))
+                elif temperature is None:
+                    deleted.append(entries[key][0])
+                elif entries[key][1] != temperature:
+                    updated[temperature].append(entries[key][0])
+            if not partial:
+                deleted.extend(pk for key, (pk, temperature) in entries.items() if key not in table)
+
+        if deleted:
+            HeatingTableEntry.objects.filter(pk__in=deleted).delete()
+        for temperature, pks in updated.items():
+            HeatingTableEntry.objects.filter(pk__in=pks).update(temperature=temperature)
+        HeatingTableEntry.objects.bulk_create(created)
+
+        changed_pks = set(deleted).union(pk for pks in updated.values() for pk in pks)
+        changed_thermostat_pks = set(thermostat_pk for thermostat_pk, entries in stored.items()
+                                     if any(pk in changed_pks for pk, temperature in entries.values()))
+        changed_thermostat_pks.update(entry.thermostat_id for entry in created)
+        if not changed_thermostat_pks:
+            return False
+        keys = [markers.get_object_key(HeatingTableEntry, pk) for pk in changed_pks]
+        keys.extend(markers.get_collection_key(HeatingTableEntry, Thermostat, thermostat_pk)
+                    for thermostat_pk in changed_thermostat_pks)
+        keys.append(markers.get_model_key(HeatingTableEntry))
+        gateway_config.touch_residences(residence_pks, keys)
+        return True
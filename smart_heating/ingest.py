@@ -0,0 +1,202 @@
+"""
+Copyright 2016 Michael Spiegel, Wilhelm Kleiminger
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Bulk ingestion of measurements sent by the local communication gateways.
+"""
+
+from collections import OrderedDict
+
+from django.db import IntegrityError, transaction
+from rest_framework import serializers, status
+
+from smart_heating import latest, markers, rollups
+from smart_heating.models import Temperature, ThermostatMetaEntry, Thermostat
+from smart_heating.serializers import TemperatureItemSerializer, GatewayTemperatureItemSerializer, \
+    GatewayThermostatMetaEntryItemSerializer
+
+# Not defined by rest_framework.status
+HTTP_207_MULTI_STATUS = 207
+
+DUPLICATE_MESSAGE = 'An entry with this datetime already exists.'
+UNKNOWN_THERMOSTAT_MESSAGE = 'The thermostat does not belong to this residence.'
+
+# Fields identifying an entry. Items colliding with a stored entry or a previous item are rejected.
+UNIQUE_FIELDS = ('thermostat_id', 'datetime')
+
+datetime_field = serializers.DateTimeField()
+
+
+def get_bulk_response_status(results):
+    """
+    Returns the HTTP status of a bulk request based on the status of its items.
+    """
+    created = [result for result in results if result['status'] == status.HTTP_201_CREATED]
+    if len(created) == len(results):
+        return status.HTTP_201_CREATED
+    if len(created) == 0:
+        return status.HTTP_400_BAD_REQUEST
+    return HTTP_207_MULTI_STATUS
+
+
+def get_error_result(errors):
+    return OrderedDict([
+        ('status', status.HTTP_400_BAD_REQUEST),
+        ('errors', errors),
+    ])
+
+
+def validate_items(serializer_class, items, thermostat_pk=None, thermostat_pks=None):
+    """
+    Validates each item with the given serializer class.
+
+    The thermostat is either given by `thermostat_pk` or by the `thermostat` field of each item, which
+    must be contained in `thermostat_pks`.
+    Returns a list of (validated_data, error_result) tuples in the order of the items.
+    """
+    validated = []
+    for item in items:
+        serializer = serializer_class(data=item)
+        if not serializer.is_valid():
+            validated.append((None, get_error_result(serializer.errors)))
+            continue
+        data = dict(serializer.validated_data)
+        if thermostat_pk is None:
+            thermostat_pk_of_item = data.pop('thermostat')
+            if thermostat_pk_of_item not in thermostat_pks:
+                validated.append((None, get_error_result({'thermostat': [UNKNOWN_THERMOSTAT_MESSAGE]})))
+                continue
+            data['thermostat_id'] = thermostat_pk_of_item
+        else:
+            data['thermostat_id'] = thermostat_pk
+        validated.append((data, None))
+    return validated
+
+
+def get_existing_keys(model, items):
+    """
+    Returns the unique fields of the stored entries colliding with the items, with a single range query
+    instead of one uniqueness query per item.
+    """
+    if not items:
+        return set()
+    datetimes = [data['datetime'] for data in items]
+    thermostat_pks = set(data['thermostat_id'] for data in items)
+    queryset = model.objects.filter(thermostat_id__in=thermostat_pks, datetime__range=(min(datetimes), max(datetimes)))
+    return set(queryset.values_list(*UNIQUE_FIELDS))
+
+
+def insert(model, instances, results):
+    """
+    Inserts the (index, instance) tuples with a single bulk insert and returns the inserted instances.
+
+    If a concurrent request, e.g. a retried upload, stored one of the entries since the uniqueness check,
+    the instances are inserted one by one and the result of each duplicate is replaced by an error.
+    """
+    try:
+        with transaction.atomic():
+            model.objects.bulk_create([instance for index, instance in instances])
+        return [instance for index, instance in instances]
+    except IntegrityError:
+        pass
+    inserted = []
+    for index, instance in instances:
+        try:
+            with transaction.atomic():
+                model.objects.bulk_create([instance])
+        except IntegrityError:
+            results[index] = get_error_result({'datetime': [DUPLICATE_MESSAGE]})
+        else:
+            inserted.append(instance)
+    return inserted
+
+
+def bulk_create(model, validated):
+    """
+    Inserts all valid items with a single bulk insert.
+
+    Returns a list of per-item results in the order of the items.
+    """
+    existing = get_existing_keys(model, [data for data, error_result in validated if data is not None])
+
+    results = []
+    instances = []
+    for data, result in validated:
+        if data is not None:
+            key = tuple(data[field] for field in UNIQUE_FIELDS)
+            if key in existing:
+                result = get_error_result({'datetime': [DUPLICATE_MESSAGE]})
+            else:
+                existing.add(key)
+                instances.append((len(results), model(**data)))
+                result = OrderedDict([
+                    ('status', status.HTTP_201_CREATED),
+                    ('datetime', datetime_field.to_representation(data['datetime'])),
+                ])
+        results.append(result)
+
+    entries_created(model, insert(model, instances, results))
+    return results
+
+
+def entries_created(model, entries):
+    """
+    Updates the data derived from temperatures or meta entries after the entries were stored.
+    """
+    if model is Temperature:
+        rollups.add_temperatures(entries)
+    latest.entries_created(model, entries)
+    if entries:
+        markers.touch_collections(model, set(entry.thermostat_id for entry in entries))
+
+
+def entries_changed(model, thermostat_pk, datetimes):
+    """
+    Updates the data derived from temperatures or meta entries after the entries of a thermostat at the
+    given datetimes were updated or deleted.
+    """
+    if model is Temperature:
+        rollups.rebuild_buckets(thermostat_pk, datetimes)
+    latest.refresh(model, thermostat_pk)
+    markers.touch_collections(model, [thermostat_pk])
+
+
+def bulk_create_temperatures(thermostat, items):
+    """
+    Validates a list of temperature items of a thermostat and inserts all valid ones with a single bulk insert.
+    """
+    validated = validate_items(TemperatureItemSerializer, items, thermostat_pk=thermostat.pk)
+    with transaction.atomic():
+        return bulk_create(Temperature, validated)
+
+
+def gateway_upload(residence, data):
+    """
+    Inserts the temperatures and meta entries of all thermostats of a residence.
+
+    The thermostats of the residence are resolved with a single query. Each item names its thermostat
+    by RFID. Returns a dictionary of per-item results for each list.
+    """
+    thermostat_pks = set(Thermostat.objects.filter(room__residence=residence).values_list('pk', flat=True))
+    temperatures = validate_items(GatewayTemperatureItemSerializer, data.get('temperatures', []),
+                                  thermostat_pks=thermostat_pks)
+    meta_entries = validate_items(GatewayThermostatMetaEntryItemSerializer, data.get('meta_entries', []),
+                                  thermostat_pks=thermostat_pks)
+    with transaction.atomic():
+        return OrderedDict([
+            ('temperatures', bulk_create(Temperature, temperatures)),
+            ('meta_entries', bulk_create(ThermostatMetaEntry, meta_entries)),
+        ])
@@ -0,0 +1,137 @@
+"""
+Copyright 2016 Michael Spiegel, Wilhelm Kleiminger
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Maintains the latest temperature and meta entry of each thermostat.
+
+The cache only moves forward in time: an entry replaces the cached one if it is at least as recent,
+so backfilled entries don't hide newer ones. Updated entries refresh the cache from the table. Deleting
+the cached entry leaves a dangling reference, which refreshes the cache on the next read. The entries
+are only read from the database, `smart_heating.archive` keeps the latest temperature of each thermostat.
+"""
+
+from django.db import transaction
+from django.db.models import Max, Q
+
+from smart_heating.models import LatestReading, Temperature, ThermostatMetaEntry
+
+# Name of the cache field of each model
+FIELDS = {
+    Temperature: 'temperature',
+    ThermostatMetaEntry: 'meta_entry',
+}
+
+
+def entries_created(model, entries):
+    """
+    Updates the cache after temperatures or meta entries were stored.
+    """
+    newest = {}
+    for entry in entries:
+        if entry.thermostat_id not in newest or entry.datetime > newest[entry.thermostat_id].datetime:
+            newest[entry.thermostat_id] = entry
+    if not newest:
+        return
+
+    field = FIELDS[model]
+    with transaction.atomic():
+        cached = dict(LatestReading.objects.filter(pk__in=newest.keys()).values_list('pk', field + '_datetime'))
+        LatestReading.objects.bulk_create([LatestReading(thermostat_id=thermostat_pk) for thermostat_pk in newest
+                                           if thermostat_pk not in cached])
+        candidates = dict((thermostat_pk, entry) for thermostat_pk, entry in newest.items()
+                          if cached.get(thermostat_pk) is None or cached[thermostat_pk] <= entry.datetime)
+
+        # Bulk inserted entries don't know their primary key
+        unsaved = [entry for entry in candidates.values() if entry.pk is None]
+        if unsaved:
+            pks = model.objects.filter(thermostat_id__in=[entry.thermostat_id for entry in unsaved],
+                                       datetime__in=[entry.datetime for entry in unsaved])
+            pks = dict(((thermostat_pk, date), pk)
+                       for thermostat_pk, date, pk in pks.values_list('thermostat_id', 'datetime', 'pk'))
+            for entry in unsaved:
+                entry.pk = pks.get((entry.thermostat_id, entry.datetime))
+
+        for thermostat_pk, entry in candidates.items():
+            # Compare and set: a concurrently stored newer entry is kept
+            LatestReading.objects.filter(
+                Q(**{field + '_datetime__isnull': True}) | Q(**{field + '_datetime__lte': entry.datetime}),
+                pk=thermostat_pk).update(**{field: entry.pk, field + '_datetime': entry.datetime})
+
+
+def refresh(model, thermostat_pk):
+    """
+    Reads the latest temperature or meta entry of a thermostat from the table and returns it.
+    """
+    field = FIELDS[model]
+    entry = model.objects.filter(thermostat_id=thermostat_pk).order_by('-datetime').first()
+    if entry is None:
+        LatestReading.objects.filter(pk=thermostat_pk).update(**{field: None, field + '_datetime': None})
+    else:
+        LatestReading.objects.update_or_create(thermostat_id=thermostat_pk, defaults={
+            field: entry,
+            field + '_datetime': entry.datetime,
+        })
+    return entry
+
+
+def refresh_many(model, thermostat_pks):
+    """
+    Reads the latest temperatures or meta entries of the thermostats from the table with two queries and
+    returns a dictionary of {thermostat pk: entry}. Thermostats without entries are missing.
+    """
+    field = FIELDS[model]
+    newest = dict(model.objects.filter(thermostat_id__in=thermostat_pks).order_by().values('thermostat_id')
+                  .annotate(latest=Max('datetime')).values_list('thermostat_id', 'latest'))
+    entries = {}
+    if newest:
+        for entry in model.objects.filter(thermostat_id__in=list(newest), datetime__in=set(newest.values())):
+            if newest[entry.thermostat_id] == entry.datetime:
+                entries[entry.thermostat_id] = entry
+    with transaction.atomic():
+        for thermostat_pk in thermostat_pks:
+            entry = entries.get(thermostat_pk)
+            LatestReading.objects.filter(pk=thermostat_pk).update(**{
+                field: entry.pk if entry is not None else None,
+                field + '_datetime': entry.datetime if entry is not None else None,
+            })
+    return entries
+
+
+def is_deleted(reading, field):
+    """
+    Checks if the cached entry of a reading, loaded with `select_related`, was deleted.
+    """
+    entry = getattr(reading, field)
+    cached_datetime = getattr(reading, field + '_datetime')
+    return cached_datetime is not None and (entry is None or entry.datetime != cached_datetime)
+
+
+def get_latest(model, thermostat):
+    """
+    Returns the latest temperature or meta entry of the thermostat or None.
+    """
+    field = FIELDS[model]
+    try:
+        reading = LatestReading.objects.select_related(field).get(pk=thermostat.pk)
+    except LatestReading.DoesNotExist:
+        return None
+    entry = getattr(reading, field)
+    if is_deleted(reading, field):
+        entry = refresh(model, thermostat.pk)
+    if entry is not None:
+        # Avoid fetching the thermostat again for the url
+        entry.thermostat = thermostat
+    return entry
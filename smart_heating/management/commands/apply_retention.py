@@ -0,0 +1,33 @@
+"""
+Copyright 2016 Michael Spiegel, Wilhelm Kleiminger
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from django.core.management.base import BaseCommand
+
+from smart_heating import retention
+
+
+class Command(BaseCommand):
+    help = 'Compacts and removes old temperatures and meta entries according to the retention policies.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('thermostats', nargs='*', metavar='thermostat',
+                            help='RFID of a thermostat to apply the policies to. Defaults to all thermostats.')
+
+    def handle(self, *args, **options):
+        for model, policy in retention.get_policies():
+            result = retention.apply(model, policy, thermostat_pks=options['thermostats'] or None)
+            self.stdout.write('%s: compacted %d entries into %d, removed %d.' % (
+                model.__name__, result.compacted, result.created, result.removed))
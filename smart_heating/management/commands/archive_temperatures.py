@@ -0,0 +1,39 @@
+"""
+Copyright 2016 Michael Spiegel, Wilhelm Kleiminger
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from smart_heating import archive
+from smart_heating.filters import parse_datetime_param
+
+
+class Command(BaseCommand):
+    help = 'Moves the temperatures of old months from the database into the compressed archive.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('thermostats', nargs='*', metavar='thermostat',
+                            help='RFID of a thermostat to archive. Defaults to all thermostats.')
+        parser.add_argument('--before', help='Archive the months ending before this ISO 8601 datetime. '
+                                             'Defaults to TEMPERATURE_ARCHIVE_AGE_DAYS ago.')
+
+    def handle(self, *args, **options):
+        before = None
+        if options['before']:
+            before = parse_datetime_param(options['before'])
+            if before is None:
+                raise CommandError('Invalid datetime: %s' % options['before'])
+        archived = archive.archive_temperatures(before, options['thermostats'] or None)
+        self.stdout.write('Archived %d temperatures.' % archived)
@@ -0,0 +1,154 @@
+"""
+Copyright 2016 Michael Spiegel, Wilhelm Kleiminger
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Change markers of objects and collections.
+
+Each write touches the marker of the written object, of the collection containing it and of its model.
+Writes of temperatures and meta entries only touch the collection of their thermostat, a marker of the
+whole model would serialise all concurrent uploads on a single row.
+A response is validated by the markers of the requested object or collection and of its parents in the
+URL, so an entity tag and a modification time are computed with a single query.
+"""
+
+import hashlib
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.http import http_date, parse_http_date_safe, parse_etags, quote_etag
+
+from smart_heating.models import ChangeMarker, Residence, User, Room, Thermostat, Temperature, ThermostatMetaEntry, \
+    HeatingTableEntry, OccupancyPredictionEntry, RaspberryDevice, ThermostatDevice
+
+# Parents of hierarchical urls by their url keyword argument
+URL_KWARGS = (
+    ('residence_pk', Residence),
+    ('room_pk', Room),
+    ('thermostat_pk', Thermostat),
+)
+
+# Parent field of the models nested in the hierarchy
+PARENT_FIELDS = {
+    User: 'residence',
+    Room: 'residence',
+    Thermostat: 'room',
+    Temperature: 'thermostat',
+    ThermostatMetaEntry: 'thermostat',
+    HeatingTableEntry: 'thermostat',
+    OccupancyPredictionEntry: 'user',
+}
+
+# Models touched by signals. The time series are touched by `smart_heating.ingest`.
+TRACKED_MODELS = (Residence, User, Room, Thermostat, HeatingTableEntry, OccupancyPredictionEntry,
+                  RaspberryDevice, ThermostatDevice)
+
+
+def get_model_key(model):
+    return model._meta.model_name
+
+
+def get_object_key(model, pk):
+    return '%s:%s' % (get_model_key(model), pk)
+
+
+def get_collection_key(model, parent_model=None, parent_pk=None):
+    if parent_model is None:
+        return get_model_key(model)
+    return '%s:%s' % (get_object_key(parent_model, parent_pk), get_model_key(model))
+
+
+def get_config_key(residence_pk):
+    """
+    Returns the key of the gateway configuration of a residence, see `smart_heating.gateway_config`.
+    """
+    return '%s:config' % get_object_key(Residence, residence_pk)
+
+
+def get_instance_keys(instance):
+    """
+    Returns the keys of the object, its collection and its model.
+    """
+    model = type(instance)
+    keys = [get_object_key(model, instance.pk), get_model_key(model)]
+    if model in PARENT_FIELDS:
+        parent_field = model._meta.get_field(PARENT_FIELDS[model])
+        keys.append(get_collection_key(model, parent_field.rel.to, getattr(instance, parent_field.attname)))
+    return keys
+
+
+def touch(keys):
+    """
+    Increments the versions of the markers and sets their modification time to now.
+    """
+    keys = set(keys)
+    now = timezone.now()
+    with transaction.atomic():
+        updated = ChangeMarker.objects.filter(key__in=keys).update(version=F('version') + 1, modified=now)
+        if updated == len(keys):
+            return
+        existing = set(ChangeMarker.objects.filter(key__in=keys).values_list('key', flat=True))
+        try:
+            with transaction.atomic():
+                ChangeMarker.objects.bulk_create([ChangeMarker(key=key, version=1, modified=now)
+                                                  for key in keys - existing])
+        except IntegrityError:
+            # Created concurrently
+            ChangeMarker.objects.filter(key__in=keys - existing).update(version=F('version') + 1, modified=now)
+
+
+def touch_collections(model, thermostat_pks):
+    """
+    Touches the collections of temperatures or meta entries of the thermostats.
+    """
+    touch([get_collection_key(model, Thermostat, thermostat_pk) for thermostat_pk in thermostat_pks])
+
+
+def get_validators(keys, variant=''):
+    """
+    Returns the entity tag and the modification time, or None, of the given markers.
+
+    The variant distinguishes different representations of the same markers, e.g. the response format.
+    """
+    markers = dict((key, (version, modified)) for key, version, modified in
+                   ChangeMarker.objects.filter(key__in=set(keys)).values_list('key', 'version', 'modified'))
+    source = ';'.join('%s=%d' % (key, markers.get(key, (0, None))[0]) for key in sorted(set(keys)))
+    etag = hashlib.md5((source + ';' + variant).encode()).hexdigest()
+    modified_times = [modified for version, modified in markers.values()]
+    return etag, max(modified_times) if modified_times else None
+
+
+def is_not_modified(request, etag, last_modified):
+    """
+    Checks the `If-None-Match` and `If-Modified-Since` headers of a request against the validators.
+
+    `If-Modified-Since` is ignored if `If-None-Match` is given.
+    """
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        etags = parse_etags(if_none_match)
+        return '*' in etags or etag in etags
+    if_modified_since = request.META.get('HTTP_IF_MODIFIED_SINCE')
+    if if_modified_since is not None and last_modified is not None:
+        if_modified_since = parse_http_date_safe(if_modified_since)
+        return if_modified_since is not None and int(last_modified.timestamp()) <= if_modified_since
+    return False
+
+
+def set_validator_headers(response, etag, last_modified):
+    response['ETag'] = quote_etag(etag)
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class AlterTemperatureKey(migrations.SeparateDatabaseAndState):
+    """
+    Applies the operations with a single copy of the temperature table on SQLite.
+
+    SQLite can't alter a primary key in place, so each operation would copy the whole table.
+    Instead the final table is created and filled once. Other databases apply the operations one by one.
+    """
+
+    def __init__(self, operations):
+        super().__init__(database_operations=operations, state_operations=operations)
+
+    def deconstruct(self):
+        return self.__class__.__name__, [], {'operations': self.state_operations}
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'sqlite':
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+        model = to_state.apps.get_model(app_label, 'temperature')
+        table = model._meta.db_table
+        quote = schema_editor.quote_name
+        schema_editor.execute('ALTER TABLE %s RENAME TO %s' % (quote(table), quote(table + '__old')))
+        schema_editor.create_model(model)
+        # Insert in index order, the ids are assigned by the database
+        schema_editor.execute('INSERT INTO %(table)s ("datetime", "value", "thermostat_id") '
+                              'SELECT "datetime", "value", "thermostat_id" FROM %(old_table)s '
+                              'ORDER BY "thermostat_id", "datetime"' % {'table': quote(table),
+                                                                        'old_table': quote(table + '__old')})
+        schema_editor.execute('DROP TABLE %s' % quote(table + '__old'))
+
+
+class Migration(migrations.Migration):
+    """
+    Replaces the datetime primary key of temperatures by an auto incremented id and a unique
+    (thermostat, datetime) index.
+    """
+
+    dependencies = [
+        ('smart_heating', '0012_thermostat_name'),
+    ]
+
+    operations = [
+        AlterTemperatureKey(operations=[
+            migrations.AlterField(
+                model_name='temperature',
+                name='datetime',
+                field=models.DateTimeField(),
+            ),
+            migrations.AddField(
+                model_name='temperature',
+                name='id',
+                field=models.AutoField(primary_key=True, serialize=False),
+                preserve_default=False,
+            ),
+            migrations.AlterUniqueTogether(
+                name='temperature',
+                unique_together=set([('thermostat', 'datetime')]),
+            ),
+        ]),
+    ]
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smart_heating', '0013_temperature_thermostat_datetime_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TemperatureRollup',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', primary_key=True, serialize=False, auto_created=True)),
+                ('bucket', models.CharField(max_length=4, choices=[('hour', 'Hour'), ('day', 'Day')])),
+                ('start', models.DateTimeField()),
+                ('count', models.IntegerField()),
+                ('sum', models.FloatField()),
+                ('min', models.FloatField()),
+                ('max', models.FloatField()),
+                ('first', models.FloatField()),
+                ('first_datetime', models.DateTimeField()),
+                ('last', models.FloatField()),
+                ('last_datetime', models.DateTimeField()),
+                ('thermostat', models.ForeignKey(related_name='temperature_rollups', to='smart_heating.Thermostat')),
+            ],
+            options={
+                'ordering': ('start',),
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='temperaturerollup',
+            unique_together=set([('thermostat', 'bucket', 'start')]),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.db.models.deletion
+
+
+def fill_latest_readings(apps, schema_editor):
+    Thermostat = apps.get_model('smart_heating', 'Thermostat')
+    Temperature = apps.get_model('smart_heating', 'Temperature')
+    ThermostatMetaEntry = apps.get_model('smart_heating', 'ThermostatMetaEntry')
+    LatestReading = apps.get_model('smart_heating', 'LatestReading')
+    for thermostat_pk in Thermostat.objects.values_list('pk', flat=True):
+        temperature = Temperature.objects.filter(thermostat_id=thermostat_pk).order_by('-datetime').first()
+        meta_entry = ThermostatMetaEntry.objects.filter(thermostat_id=thermostat_pk).order_by('-datetime').first()
+        LatestReading.objects.create(
+            thermostat_id=thermostat_pk,
+            temperature=temperature,
+            temperature_datetime=temperature.datetime if temperature is not None else None,
+            meta_entry=meta_entry,
+            meta_entry_datetime=meta_entry.datetime if meta_entry is not None else None,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smart_heating', '0014_temperaturerollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LatestReading',
+            fields=[
+                ('thermostat', models.OneToOneField(primary_key=True, serialize=False, related_name='latest_reading', to='smart_heating.Thermostat')),
+                ('temperature_datetime', models.DateTimeField(null=True)),
+                ('meta_entry_datetime', models.DateTimeField(null=True)),
+                ('meta_entry', models.ForeignKey(null=True, related_name='+', on_delete=django.db.models.deletion.DO_NOTHING, to='smart_heating.ThermostatMetaEntry', db_constraint=False)),
+                ('temperature', models.ForeignKey(null=True, related_name='+', on_delete=django.db.models.deletion.DO_NOTHING, to='smart_heating.Temperature', db_constraint=False)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.RunPython(fill_latest_readings, migrations.RunPython.noop),
+    ]
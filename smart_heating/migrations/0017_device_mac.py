@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import logging
+import re
+
+from django.db import models, migrations
+import django.core.validators
+
+logger = logging.getLogger(__name__)
+
+
+# Copy of smart_heating.models.normalize_mac at the time of this migration
+def normalize_mac(value):
+    digits = re.sub(r'[\s:.\-]', '', value).lower()
+    if not re.match(r'^[0-9a-f]{12}$', digits):
+        return None
+    return ':'.join(digits[index:index + 2] for index in range(0, 12, 2))
+
+
+def normalize_macs(apps, schema_editor):
+    # MAC addresses which aren't valid are kept unchanged. If several MAC addresses have the same canonical
+    # form, the first device by RFID gets it and the others keep their MAC address and are reported.
+    for model_name in ('RaspberryDevice', 'ThermostatDevice'):
+        model = apps.get_model('smart_heating', model_name)
+        devices = list(model.objects.order_by('rfid').values_list('rfid', 'mac'))
+        taken = set(mac for rfid, mac in devices)
+        for rfid, mac in devices:
+            normalized = normalize_mac(mac)
+            if normalized is None or normalized == mac:
+                continue
+            if normalized in taken:
+                logger.warning('%s %s keeps the MAC address %s, %s belongs to another device.',
+                               model_name, rfid, mac, normalized)
+                continue
+            model.objects.filter(rfid=rfid).update(mac=normalized)
+            taken.discard(mac)
+            taken.add(normalized)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smart_heating', '0016_changemarker'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='raspberrydevice',
+            name='mac',
+            field=models.CharField(max_length=17, unique=True, validators=[django.core.validators.RegexValidator('^([0-9a-f]{2}:){5}[0-9a-f]{2}$', 'Enter a MAC address of the form aa:bb:cc:dd:ee:ff.')]),
+        ),
+        migrations.AlterField(
+            model_name='thermostatdevice',
+            name='mac',
+            field=models.CharField(max_length=17, unique=True, validators=[django.core.validators.RegexValidator('^([0-9a-f]{2}:){5}[0-9a-f]{2}$', 'Enter a MAC address of the form aa:bb:cc:dd:ee:ff.')]),
+        ),
+        migrations.RunPython(normalize_macs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smart_heating', '0017_device_mac'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BatteryForecast',
+            fields=[
+                ('thermostat', models.OneToOneField(primary_key=True, serialize=False, related_name='battery_forecast', to='smart_heating.Thermostat')),
+                ('computed', models.DateTimeField()),
+                ('count', models.IntegerField()),
+                ('battery', models.IntegerField()),
+                ('slope', models.FloatField()),
+                ('empty_date', models.DateTimeField(null=True)),
+                ('confidence', models.FloatField()),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
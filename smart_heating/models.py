@@ -14,14 +14,34 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import re
 from abc import ABCMeta, abstractmethod
+from operator import attrgetter, itemgetter
 
+from django.apps import apps
 from django.core import validators
 from django.db import models
 
 
 alpha_numeric_validator = validators.RegexValidator(r'^[0-9a-zA-Z]+$', 'Only alphanumeric characters are allowed.')
 rfid_validator = alpha_numeric_validator
+mac_validator = validators.RegexValidator(r'^([0-9a-f]{2}:){5}[0-9a-f]{2}$',
+                                          'Enter a MAC address of the form aa:bb:cc:dd:ee:ff.')
+
+mac_separators_re = re.compile(r'[\s:.\-]')
+mac_digits_re = re.compile(r'^[0-9a-f]{12}$')
+
+
+def normalize_mac(value):
+    """
+    Returns the canonical form aa:bb:cc:dd:ee:ff of a MAC address, or None if the value isn't a MAC address.
+
+    Accepts upper and lower case digits separated by colons, hyphens, dots or not at all.
+    """
+    digits = mac_separators_re.sub('', value).lower()
+    if not mac_digits_re.match(digits):
+        return None
+    return ':'.join(digits[index:index + 2] for index in range(0, 12, 2))
 
 
 class Model(models.Model):
@@ -117,21 +137,65 @@ class Thermostat(Model):
 class Temperature(Model):
     """
     Represents a temperature.
+
+    A temperature is identified by its thermostat and datetime. The datetime is used in the URL.
     """
-    datetime = models.DateTimeField(primary_key=True)
+    id = models.AutoField(primary_key=True)
+    datetime = models.DateTimeField()
     value = models.FloatField()
     thermostat = models.ForeignKey('Thermostat', related_name='temperatures')
 
     class Meta:
+        # The unique index on (thermostat, datetime) serves the per thermostat queries ordered by datetime
+        unique_together = ('thermostat', 'datetime')
         ordering = ('datetime',)
 
     def get_recursive_pks(self):
         pks = self.thermostat.get_recursive_pks()
-        assert (self.pk == self.datetime)
         pks.append(self.datetime.isoformat())
         return pks
 
 
+class TemperatureRollup(Model):
+    """
+    Represents the aggregated temperatures of a thermostat within an hour or a day.
+
+    Rollups are maintained while temperatures are stored, see `smart_heating.rollups`.
+    """
+    HOUR = 'hour'
+    DAY = 'day'
+
+    BUCKET_CHOICES = [
+        (HOUR, 'Hour'),
+        (DAY, 'Day'),
+    ]
+
+    thermostat = models.ForeignKey('Thermostat', related_name='temperature_rollups')
+    bucket = models.CharField(max_length=4, choices=BUCKET_CHOICES)
+    start = models.DateTimeField()
+    count = models.IntegerField()
+    sum = models.FloatField()
+    min = models.FloatField()
+    max = models.FloatField()
+    first = models.FloatField()
+    first_datetime = models.DateTimeField()
+    last = models.FloatField()
+    last_datetime = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('thermostat', 'bucket', 'start')
+        ordering = ('start',)
+
+    @property
+    def average(self):
+        return self.sum / self.count
+
+    def get_recursive_pks(self):
+        pks = self.thermostat.get_recursive_pks()
+        pks.append(self.pk)
+        return pks
+
+
 class ThermostatMetaEntry(Model):
     """
     Represents a thermistat meta entry containing signal strength, uptime and battery level.
@@ -153,6 +217,48 @@ class ThermostatMetaEntry(Model):
         return pks
 
 
+class LatestReading(Model):
+    """
+    Represents the latest temperature and meta entry of a thermostat.
+
+    This is a denormalised cache maintained while temperatures and meta entries are stored,
+    see `smart_heating.latest`. The references aren't constrained, so deletes of temperatures and meta entries
+    don't update the cache and keep their fast path. A deleted entry is detected when the cache is read.
+    """
+    thermostat = models.OneToOneField('Thermostat', primary_key=True, related_name='latest_reading')
+    temperature = models.ForeignKey('Temperature', null=True, on_delete=models.DO_NOTHING, db_constraint=False,
+                                    related_name='+')
+    temperature_datetime = models.DateTimeField(null=True)
+    meta_entry = models.ForeignKey('ThermostatMetaEntry', null=True, on_delete=models.DO_NOTHING,
+                                   db_constraint=False, related_name='+')
+    meta_entry_datetime = models.DateTimeField(null=True)
+
+    def get_recursive_pks(self):
+        return self.thermostat.get_recursive_pks()
+
+
+class BatteryForecast(Model):
+    """
+    Represents the projected battery depletion of a thermostat.
+
+    Computed from the recent meta entries of all thermostats at once, see `smart_heating.battery`.
+    """
+    thermostat = models.OneToOneField('Thermostat', primary_key=True, related_name='battery_forecast')
+    computed = models.DateTimeField()
+    # Number of meta entries the forecast is based on
+    count = models.IntegerField()
+    # Latest battery level and the fitted change per day
+    battery = models.IntegerField()
+    slope = models.FloatField()
+    # Projected date of reaching `BATTERY_EMPTY_LEVEL`, None if the level doesn't decrease
+    empty_date = models.DateTimeField(null=True)
+    # Coefficient of determination of the fitted trend, between 0 and 1
+    confidence = models.FloatField()
+
+    def get_recursive_pks(self):
+        return self.thermostat.get_recursive_pks()
+
+
 class Device(Model):
     """
     Base class for a physical device with an RFID number and MAC address.
@@ -160,56 +266,115 @@ class Device(Model):
     __metaclass__ = ABCMeta
 
     rfid = models.CharField(primary_key=True, max_length=100, validators=[rfid_validator])
-    mac = models.CharField(max_length=17, unique=True)
+    # Stored in canonical form, see `normalize_mac`
+    mac = models.CharField(max_length=17, unique=True, validators=[mac_validator])
 
     class Meta:
         abstract = True
 
+    def save(self, *args, **kwargs):
+        self.mac = normalize_mac(self.mac) or self.mac
+        super().save(*args, **kwargs)
+
     def get_recursive_pks(self):
         return [self.pk]
 
 
-class RaspberryDevice(Device):
+class BatchRelation:
     """
-    Represents a physical Raspberry Pi device.
+    Descriptor of the object or the list of objects related to an object by a value other than a foreign key,
+    e.g. by the RFID.
+
+    `resolve(instances, queryset)` returns a dictionary of {instance pk: related value} for many instances
+    with a constant number of queries. Instances without related value are missing in the dictionary and
+    relate to None. The descriptor supports `prefetch_related()`, with a custom queryset of `Prefetch`.
     """
-    @property
-    def residence(self):
-        residences = Residence.objects.filter(rfid=self.rfid)
-        assert (0 <= len(residences) <= 1)
-        if len(residences) > 0:
-            return residences[0]
-        else:
-            return None
 
-    @property
-    def thermostat_devices(self):
+    def __init__(self, name, related_model, resolve):
+        self.name = name
+        self.related_model = related_model
+        self.resolve = resolve
+        self.cache_name = '_%s_cache' % name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        if not self.is_cached(instance):
+            self.resolve_many([instance])
+        cached = getattr(instance, self.cache_name)
+        return cached[1] if cached is not None else None
+
+    def is_cached(self, instance):
+        return hasattr(instance, self.cache_name)
+
+    def get_related_model(self):
+        return apps.get_model('smart_heating', self.related_model) if isinstance(self.related_model, str) \
+            else self.related_model
+
+    def get_values(self, instances, queryset=None):
+        if queryset is None:
+            queryset = self.get_related_model().objects.all()
+        return self.resolve(instances, queryset)
+
+    def resolve_many(self, instances, queryset=None):
         """
-        :return: Thermostat devices associated to the Raspberry Pi.
+        Resolves and caches the related values of the instances. Returns a dictionary of {instance pk: value}.
         """
-        residence = self.residence
-        if residence is None:
-            return None
-        rooms = Room.objects.filter(residence=residence)
-        room_pks = [room.pk for room in rooms]
-        thermostats = Thermostat.objects.filter(room__in=room_pks)
-        thermostat_rfids = [thermostat.rfid for thermostat in thermostats]
-        thermostat_devices = ThermostatDevice.objects.filter(rfid__in=thermostat_rfids)
-        return thermostat_devices
+        values = self.get_values(instances, queryset)
+        for instance in instances:
+            setattr(instance, self.cache_name, (instance.pk, values[instance.pk]) if instance.pk in values else None)
+        return values
+
+    def get_prefetch_queryset(self, instances, queryset=None):
+        # The cached (instance pk, value) tuples are the prefetched objects
+        values = self.get_values(instances, queryset)
+        return list(values.items()), itemgetter(0), attrgetter('pk'), True, self.cache_name
+
+
+def resolve_by_pk(instances, queryset):
+    """
+    Resolves the objects whose primary key is the primary key of the instances.
+    """
+    return dict((obj.pk, obj) for obj in queryset.filter(pk__in=set(instance.pk for instance in instances)))
+
+
+def resolve_thermostat_devices(raspberry_devices, queryset):
+    """
+    Resolves the thermostat devices of the residences of the Raspberry Pi devices.
+
+    The thermostats of all residences are joined in a single query, their devices are read with a second query.
+    """
+    residence_rfids = {}
+    values = {}
+    for residence_rfid, thermostat_rfid in Residence.objects.filter(
+            rfid__in=set(device.pk for device in raspberry_devices)).values_list('rfid', 'rooms__thermostats__rfid'):
+        values[residence_rfid] = []
+        if thermostat_rfid is not None:
+            residence_rfids[thermostat_rfid] = residence_rfid
+    if residence_rfids:
+        for thermostat_device in queryset.filter(rfid__in=list(residence_rfids)):
+            values[residence_rfids[thermostat_device.rfid]].append(thermostat_device)
+    return values
+
+
+class RaspberryDevice(Device):
+    """
+    Represents a physical Raspberry Pi device.
+
+    The residence and the thermostat devices are related by the RFID of the residence.
+    """
+    residence = BatchRelation('residence', Residence, resolve_by_pk)
+    # Thermostat devices associated to the Raspberry Pi, or None without residence
+    thermostat_devices = BatchRelation('thermostat_devices', 'ThermostatDevice', resolve_thermostat_devices)
 
 
 class ThermostatDevice(Device):
     """
     Represents a physical thermostat device.
+
+    The thermostat is related by its RFID.
     """
-    @property
-    def thermostat(self):
-        thermostats = Thermostat.objects.filter(rfid=self.rfid)
-        assert (0 <= len(thermostats) <= 1)
-        if len(thermostats) > 0:
-            return thermostats[0]
-        else:
-            return None
+    thermostat = BatchRelation('thermostat', Thermostat, resolve_by_pk)
 
 
 class TimetableEntry(Model):
@@ -275,3 +440,17 @@ class OccupancyPredictionEntry(TimetableEntry):
         pks = self.user.get_recursive_pks()
         pks.append(self.pk)
         return pks
+
+
+class ChangeMarker(Model):
+    """
+    Represents the version and modification time of an object or a collection.
+
+    Used to validate conditional requests without rendering the response.
+    """
+    key = models.CharField(primary_key=True, max_length=255)
+    version = models.PositiveIntegerField(default=0)
+    modified = models.DateTimeField()
+
+    def get_recursive_pks(self):
+        return [self.pk]
@@ -18,25 +18,22 @@ from collections import OrderedDict
 
 from rest_framework import pagination
 from rest_framework.response import Response
-from rest_framework.reverse import reverse
 
+from smart_heating.filters import add_time_range_query_params
+from smart_heating.relations import build_url
 
-class BasePagination(pagination.LimitOffsetPagination):
+
+class PaginationMixin:
     """
     Base class for pagination with customizable, additional fields.
     """
-    default_limit = 100
 
     def __init__(self, kwargs):
         self.kwargs = kwargs
 
     def get_paginated_response(self, data):
         # Prepended meta data
-        response_data = OrderedDict([
-            ('count', self.count),
-            ('next_url', self.get_next_link()),
-            ('previous_url', self.get_previous_link())
-        ])
+        response_data = self.get_pagination_meta_data()
         # Custom data
         response_data.update(self.get_custom_pagination_response_data(data))
         # Appended meta data
@@ -45,6 +42,12 @@ class BasePagination(pagination.LimitOffsetPagination):
         ]))
         return Response(response_data)
 
+    def get_pagination_meta_data(self):
+        return OrderedDict([
+            ('next_url', self.get_next_link()),
+            ('previous_url', self.get_previous_link())
+        ])
+
     def get_custom_pagination_response_data(self, data):
         """
         Override this method in a custom pagination sub class
@@ -52,7 +55,32 @@ class BasePagination(pagination.LimitOffsetPagination):
         return OrderedDict()
 
 
-class TemperaturePagination(BasePagination):
+class BasePagination(PaginationMixin, pagination.LimitOffsetPagination):
+    """
+    Base class for limit and offset based pagination with customizable, additional fields.
+    """
+    default_limit = 100
+
+    def get_pagination_meta_data(self):
+        response_data = OrderedDict([
+            ('count', self.count),
+        ])
+        response_data.update(super().get_pagination_meta_data())
+        return response_data
+
+
+class BaseCursorPagination(PaginationMixin, pagination.CursorPagination):
+    """
+    Base class for cursor based pagination over the datetime with customizable, additional fields.
+
+    Each page is selected by the datetime of its neighbour instead of an offset and there is no
+    count, so every page is fetched with the same cost. The links stay valid while new entries arrive.
+    """
+    page_size = 100
+    ordering = 'datetime'
+
+
+class TemperaturePaginationMixin:
     """
     Custom pagination that includes urls to the chart and the latest temperature entry.
     """
@@ -60,12 +88,14 @@ class TemperaturePagination(BasePagination):
     def __init__(self, kwargs):
         self.latest_temperature_url = None
         self.chart_url = None
-        super(TemperaturePagination, self).__init__(kwargs)
+        super().__init__(kwargs)
 
     def paginate_queryset(self, queryset, request, view=None):
-        self.latest_temperature_url = reverse('temperature-latest', kwargs=self.kwargs, request=request)
-        self.chart_url = reverse('temperature-chart', kwargs=self.kwargs, request=request)
-        return super(TemperaturePagination, self).paginate_queryset(queryset, request, view)
+        self.latest_temperature_url = build_url('temperature-latest', kwargs=self.kwargs, request=request)
+        # The chart shows the same time range as the list
+        self.chart_url = add_time_range_query_params(
+            build_url('temperature-chart', kwargs=self.kwargs, request=request), request)
+        return super().paginate_queryset(queryset, request, view)
 
     def get_custom_pagination_response_data(self, data):
         return OrderedDict([
@@ -74,20 +104,36 @@ class TemperaturePagination(BasePagination):
         ])
 
 
-class ThermostatMetaEntriesPagination(BasePagination):
+class TemperaturePagination(TemperaturePaginationMixin, BasePagination):
+    pass
+
+
+class TemperatureCursorPagination(TemperaturePaginationMixin, BaseCursorPagination):
+    pass
+
+
+class ThermostatMetaEntriesPaginationMixin:
     """
     Custom pagination that includes the url to the latest temperature entry.
     """
 
     def __init__(self, kwargs):
         self.latest_entry_url = None
-        super(ThermostatMetaEntriesPagination, self).__init__(kwargs)
+        super().__init__(kwargs)
 
     def paginate_queryset(self, queryset, request, view=None):
-        self.latest_entry_url = reverse('thermostatmetaentry-latest', kwargs=self.kwargs, request=request)
-        return super(ThermostatMetaEntriesPagination, self).paginate_queryset(queryset, request, view)
+        self.latest_entry_url = build_url('thermostatmetaentry-latest', kwargs=self.kwargs, request=request)
+        return super().paginate_queryset(queryset, request, view)
 
     def get_custom_pagination_response_data(self, data):
         return OrderedDict([
             ('latest_entry_url', self.latest_entry_url),
         ])
+
+
+class ThermostatMetaEntriesPagination(ThermostatMetaEntriesPaginationMixin, BasePagination):
+    pass
+
+
+class ThermostatMetaEntriesCursorPagination(ThermostatMetaEntriesPaginationMixin, BaseCursorPagination):
+    pass
@@ -0,0 +1,187 @@
+"""
+Copyright 2016 Michael Spiegel, Wilhelm Kleiminger
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Plans the `select_related()`, `prefetch_related()` and `only()` calls of a queryset from the fields of
+a serializer.
+
+The serializer is inspected after the sparse fieldset of the request was applied, see
+`smart_heating.fieldsets`, so only the requested fields are loaded. Nested objects of a forward relation are
+joined, nested lists are prefetched with a planned queryset of their own. Hierarchical urls join the parents
+of the object, see `smart_heating.markers.PARENT_FIELDS`. Batch relations of the devices are prefetched like reverse
+relations. Other fields which aren't backed by a model field load all fields of their object.
+"""
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+from smart_heating import markers, relations
+from smart_heating.models import BatchRelation
+
+
+class Plan:
+    """
+    Related objects to join and to prefetch and fields to load of a queryset.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.select_related = []
+        self.prefetches = []
+        self.fields = set()
+
+    def apply(self, queryset):
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        if self.prefetches:
+            queryset = queryset.prefetch_related(*self.prefetches)
+        return queryset.only(*self.fields)
+
+    def join(self, path):
+        if path not in self.select_related:
+            self.select_related.append(path)
+
+    def load(self, path):
+        self.fields.add(path)
+
+    def load_all(self, model, prefix):
+        for field in model._meta.concrete_fields:
+            self.load(prefix + field.name)
+
+
+def get_model_field(model, name):
+    try:
+        return model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+
+
+def is_joinable(model_field):
+    """
+    Checks if the relation can be joined, i.e. if it relates to a single object.
+    """
+    return model_field.many_to_one or model_field.one_to_one
+
+
+def join_parents(plan, model, prefix, exclude=()):
+    """
+    Joins the parents required to build the hierarchical url of the objects at the prefix.
+    """
+    while model in markers.PARENT_FIELDS:
+        name = markers.PARENT_FIELDS[model]
+        plan.load(prefix + name)
+        if not prefix and name in exclude:
+            break
+        plan.join(prefix + name)
+        model = model._meta.get_field(name).related_model
+        prefix += name + '__'
+        plan.load(prefix + model._meta.pk.name)
+
+
+def add_url(plan, field, model, prefix, exclude=()):
+    """
+    Adds the fields required by the url of the objects at the prefix.
+    """
+    if isinstance(field, (relations.HierarchicalHyperlinkedIdentityField,
+                          relations.HierarchicalHyperlinkedRelatedField)):
+        join_parents(plan, model, prefix, exclude)
+
+
+def get_child_plan(related_model, serializer_field, match_field=None):
+    """
+    Returns the plan of the prefetched objects of a relation.
+
+    `match_field` is the foreign key matching the prefetched objects to their instances, if it isn't the primary key.
+    """
+    plan = Plan(related_model)
+    plan.load(related_model._meta.pk.name)
+    if match_field is not None:
+        plan.load(match_field)
+    if isinstance(serializer_field, serializers.ListSerializer):
+        add_serializer(plan, serializer_field.child, related_model)
+    elif isinstance(serializer_field, serializers.BaseSerializer):
+        add_serializer(plan, serializer_field, related_model)
+    elif isinstance(serializer_field, serializers.ManyRelatedField):
+        add_url(plan, serializer_field.child_relation, related_model, '')
+    else:
+        add_url(plan, serializer_field, related_model, '')
+    return plan
+
+
+def prefetch(plan, lookup, related_model, serializer_field, match_field=None):
+    """
+    Prefetches the related objects with a planned queryset.
+    """
+    child_plan = get_child_plan(related_model, serializer_field, match_field)
+    plan.prefetches.append(Prefetch(lookup, queryset=child_plan.apply(related_model.objects.all())))
+
+
+def add_serializer(plan, serializer, model, prefix='', exclude=()):
+    """
+    Adds the related objects and fields required by the fields of the serializer of the objects at the prefix.
+
+    `exclude` contains the forward relations of the root objects which are set by the view.
+    """
+    plan.load(prefix + model._meta.pk.name)
+    for field in serializer.fields.values():
+        if field.source == '*':
+            if isinstance(field, serializers.HyperlinkedIdentityField):
+                add_url(plan, field, model, prefix, exclude)
+            elif isinstance(field, serializers.BaseSerializer):
+                add_serializer(plan, field, model, prefix, exclude)
+            else:
+                plan.load_all(model, prefix)
+            continue
+
+        name = field.source_attrs[0]
+        model_field = get_model_field(model, name) if len(field.source_attrs) == 1 else None
+        if model_field is None:
+            descriptor = getattr(model, name, None)
+            if len(field.source_attrs) == 1 and isinstance(descriptor, BatchRelation):
+                prefetch(plan, prefix + name, descriptor.get_related_model(), field)
+            else:
+                plan.load_all(model, prefix)
+        elif not model_field.is_relation:
+            plan.load(prefix + name)
+        elif is_joinable(model_field):
+            if model_field.concrete:
+                plan.load(prefix + name)
+            if (not prefix and name in exclude) or \
+                    not isinstance(field, (serializers.BaseSerializer, serializers.HyperlinkedRelatedField)):
+                continue
+            related_model = model_field.related_model
+            plan.join(prefix + name)
+            plan.load(prefix + name + '__' + related_model._meta.pk.name)
+            if isinstance(field, serializers.BaseSerializer):
+                add_serializer(plan, field, related_model, prefix + name + '__')
+            else:
+                add_url(plan, field, related_model, prefix + name + '__')
+        elif isinstance(field, (serializers.ListSerializer, serializers.ManyRelatedField)):
+            # The prefetched objects of a reverse relation are matched by their foreign key
+            prefetch(plan, prefix + name, model_field.related_model, field,
+                     None if model_field.concrete else model_field.field.name)
+        else:
+            plan.load_all(model, prefix)
+
+
+def plan_queryset(queryset, serializer, exclude=()):
+    """
+    Returns the queryset with the related objects and fields required by the serializer.
+    """
+    plan = Plan(queryset.model)
+    add_serializer(plan, serializer, queryset.model, exclude=exclude)
+    return plan.apply(queryset)
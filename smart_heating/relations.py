@@ -14,8 +14,116 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import re
+from functools import lru_cache
+
+from django.core.urlresolvers import NoReverseMatch, get_resolver, get_script_prefix, get_urlconf, RFC3986_SUBDELIMS
+from django.utils.encoding import force_text
+from django.utils.http import urlquote
 from rest_framework import serializers
-from rest_framework.reverse import reverse
+
+# Characters of the `pchar` definition of RFC 3986 which aren't quoted, as in `django.core.urlresolvers`
+SAFE_URL_CHARACTERS = RFC3986_SUBDELIMS + '/~:@'
+
+
+class URLTemplate:
+    """
+    Precompiled url pattern of a view, which is filled with the url arguments without running the url resolver.
+
+    Follows `RegexURLResolver._reverse_with_prefix` of Django 1.8, check it when upgrading Django. Script
+    prefixes with arguments aren't supported.
+    """
+
+    def __init__(self, result, params, pattern, defaults):
+        self.result = result
+        self.params = params
+        self.regex = re.compile('^' + pattern, re.UNICODE)
+        # Extra keyword arguments of the url pattern
+        self.defaults = defaults
+
+    def matches(self, kwargs):
+        """
+        Checks if the keyword arguments select this pattern, given its extra keyword arguments.
+        """
+        if set(kwargs) | set(self.defaults) != set(self.params) | set(self.defaults):
+            return False
+        return all(kwargs.get(param, value) == value for param, value in self.defaults.items())
+
+    def expand(self, subs):
+        """
+        Returns the path of the url, relative to the script prefix.
+
+        Raises NoReverseMatch if the arguments don't match the pattern, like `reverse()`.
+        """
+        subs = dict((param, force_text(value)) for param, value in subs.items())
+        if not self.regex.search(self.result % subs):
+            raise NoReverseMatch("Arguments '%s' don't match the url pattern '%s'." % (subs, self.regex.pattern))
+        path = self.result % dict((param, urlquote(value, safe=SAFE_URL_CHARACTERS))
+                                  for param, value in subs.items())
+        # Don't allow construction of scheme relative urls
+        if path.startswith('/'):
+            path = '%2F' + path[1:]
+        return path
+
+
+@lru_cache(maxsize=None)
+def get_url_templates(resolver, view_name):
+    """
+    Returns the url templates of the view name in the order tried by `reverse()`.
+
+    The templates are compiled once per url resolver, which is replaced if the url configuration changes.
+    """
+    return [URLTemplate(result, params, pattern, defaults)
+            for possibility, pattern, defaults in resolver.reverse_dict.getlist(view_name)
+            for result, params in possibility]
+
+
+def get_url_root(request):
+    """
+    Returns the scheme and host of the request. Memoised on the request.
+    """
+    if not hasattr(request, '_url_root'):
+        request._url_root = '%s://%s' % (request.scheme, request.get_host())
+    return request._url_root
+
+
+def build_url(view_name, args=None, kwargs=None, request=None, format=None):
+    """
+    Same as `rest_framework.reverse.reverse`, but fills a precompiled url template of the view.
+
+    Either positional `args` or `kwargs` are given. A `format` is appended as the `format` argument of
+    the format suffix patterns. Returns an absolute url if the request is given.
+    """
+    templates = get_url_templates(get_resolver(get_urlconf()), view_name)
+    if kwargs is None:
+        subs = None
+        args = list(args or [])
+        if format is not None:
+            args.append(format)
+    else:
+        subs = dict(kwargs)
+        if format is not None:
+            subs['format'] = format
+
+    for template in templates:
+        if subs is None:
+            if len(template.params) != len(args):
+                continue
+            template_subs = dict(zip(template.params, args))
+        else:
+            if not template.matches(subs):
+                continue
+            template_subs = subs
+        try:
+            path = template.expand(template_subs)
+        except NoReverseMatch:
+            continue
+        url = urlquote(get_script_prefix()) + path
+        if request is not None:
+            return get_url_root(request) + url
+        return url
+    raise NoReverseMatch("Reverse for '%s' with arguments '%s' and keyword arguments '%s' not found." % (
+        view_name, args, kwargs))
 
 
 class HierarchicalHyperlinkedIdentityField(serializers.HyperlinkedIdentityField):
@@ -23,8 +131,24 @@ class HierarchicalHyperlinkedIdentityField(serializers.HyperlinkedIdentityField)
     Hyperlinked identity field for hierarchical urls.
 
     Calls `get_recursive_pks` on the associated object to collect its parent primary
-    keys required to build the hierarchical URL.
+    keys required to build the hierarchical URL. The hierarchical viewsets attach the parents
+    resolved from the request url to the objects, so collecting the primary keys doesn't query the database.
     """
     def get_url(self, obj, view_name, request, format):
         args = obj.get_recursive_pks()
-        return reverse(view_name, args=args, request=request, format=format)
+        return build_url(view_name, args=args, request=request, format=format)
+
+
+class HierarchicalHyperlinkedRelatedField(serializers.HyperlinkedRelatedField):
+    """
+    Read only hyperlinked related field for hierarchical urls.
+
+    Like `HierarchicalHyperlinkedIdentityField`, but represents the related object of the given source.
+    """
+    def use_pk_only_optimization(self):
+        # The parents of the related object are required to build its url
+        return False
+
+    def get_url(self, obj, view_name, request, format):
+        args = obj.get_recursive_pks()
+        return build_url(view_name, args=args, request=request, format=format)
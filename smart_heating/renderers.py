@@ -0,0 +1,61 @@
+"""
+Copyright 2016 Michael Spiegel, Wilhelm Kleiminger
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import csv
+import io
+import json
+
+from rest_framework import renderers
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class CSVRenderer(renderers.BaseRenderer):
+    """
+    Selects CSV exports with `?format=csv` or the `text/csv` media type.
+
+    Exports are streamed by the view. Only other responses, e.g. errors, are rendered here as a header
+    row of the keys and a row of the values.
+    """
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return ''
+        if not isinstance(data, dict):
+            data = {'detail': data}
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(data.keys())
+        writer.writerow(data.values())
+        return output.getvalue()
+
+
+class NDJSONRenderer(renderers.BaseRenderer):
+    """
+    Selects newline delimited JSON exports with `?format=ndjson` or the `application/x-ndjson` media type.
+
+    Exports are streamed by the view. Only other responses, e.g. errors, are rendered here as a single line.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return ''
+        return json.dumps(data, cls=JSONEncoder) + '\n'
@@ -0,0 +1,236 @@
+"""
+Copyright 2016 Michael Spiegel, Wilhelm Kleiminger
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Applies the retention policies of temperatures and meta entries.
+
+The entries of a tier are compacted to one entry per bucket of the tier's resolution: temperatures are
+replaced by their average at the start of the bucket, of meta entries the latest one is kept. Buckets
+with a single entry are already compacted, so applying a policy again only touches new buckets.
+Entries older than the last tier are removed. The work is split into short transactions.
+
+Archived temperatures keep their full resolution, compaction skips the archived months of a thermostat,
+see `smart_heating.archive`. The removal includes the archive. The rollups of compacted buckets are
+recomputed.
+"""
+
+import datetime
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils import timezone
+
+from smart_heating import archive, markers, rollups
+from smart_heating.archive import EPOCH
+from smart_heating.models import Temperature, ThermostatMetaEntry, Thermostat
+
+
+class Result:
+    """
+    Number of compacted, created and removed entries.
+    """
+
+    def __init__(self):
+        self.compacted = 0
+        self.created = 0
+        self.removed = 0
+
+
+def get_policies():
+    return [
+        (Temperature, settings.TEMPERATURE_RETENTION),
+        (ThermostatMetaEntry, settings.THERMOSTAT_META_ENTRY_RETENTION),
+    ]
+
+
+def get_bucket_start(date, resolution):
+    """
+    Returns the start of the bucket of `resolution` seconds containing the datetime, aligned to the epoch.
+    """
+    seconds = (date - EPOCH) // datetime.timedelta(seconds=1)
+    return EPOCH + datetime.timedelta(seconds=seconds - seconds % resolution)
+
+
+def get_tiers(policy, now):
+    """
+    Returns the (start, end, resolution) time ranges of the policy from the oldest to the most recent tier
+    and the datetime before which entries are removed, or None.
+
+    The ranges are aligned to the resolutions, so no bucket spans two tiers.
+    """
+    previous_age = 0
+    previous_resolution = None
+    ends = []
+    for age, resolution in policy:
+        if age is not None and age <= previous_age:
+            raise ImproperlyConfigured('The ages of a retention policy must increase.')
+        if resolution is not None and previous_resolution is not None and resolution % previous_resolution:
+            raise ImproperlyConfigured('Each resolution of a retention policy must be a multiple of the previous one.')
+        end = now - datetime.timedelta(days=previous_age)
+        ends.append(get_bucket_start(end, resolution) if resolution is not None else end)
+        previous_age = age
+        previous_resolution = resolution or previous_resolution
+        if age is None:
+            break
+
+    last_age, last_resolution = policy[len(ends) - 1]
+    remove_before = None
+    if last_age is not None:
+        remove_before = now - datetime.timedelta(days=last_age)
+        if last_resolution is not None:
+            remove_before = get_bucket_start(remove_before, last_resolution)
+
+    tiers = []
+    start = remove_before
+    for end, (age, resolution) in reversed(list(zip(ends, policy))):
+        tiers.append((start, end, resolution))
+        start = end
+    return tiers, remove_before
+
+
+def compact_temperatures(bucket_start, entries):
+    """
+    Returns the pks of the temperatures to remove and the temperatures to create for a bucket.
+    """
+    value = sum(entry[2] for entry in entries) / len(entries)
+    return [entry[0] for entry in entries], [Temperature(thermostat_id=entries[0][3], datetime=bucket_start,
+                                                         value=value)]
+
+
+def compact_meta_entries(bucket_start, entries):
+    """
+    Returns the pks of the meta entries to remove and the meta entries to create for a bucket.
+    """
+    return [entry[0] for entry in entries[:-1]], []
+
+
+# Read fields and compaction of each model
+COMPACTIONS = {
+    Temperature: (('pk', 'datetime', 'value', 'thermostat_id'), compact_temperatures),
+    ThermostatMetaEntry: (('pk', 'datetime'), compact_meta_entries),
+}
+
+
+def get_buckets(queryset, fields, resolution, chunk_size):
+    """
+    Yields the (bucket_start, entries) tuples of the queryset in order, where entries are tuples of the fields.
+
+    The entries are read in chunks.
+    """
+    queryset = queryset.order_by('datetime').values_list(*fields)
+    bucket_start = None
+    entries = []
+    after = None
+    while True:
+        chunk = list((queryset if after is None else queryset.filter(datetime__gt=after))[:chunk_size])
+        for entry in chunk:
+            start = get_bucket_start(entry[1], resolution)
+            if start != bucket_start:
+                if entries:
+                    yield bucket_start, entries
+                bucket_start = start
+                entries = []
+            entries.append(entry)
+        if len(chunk) < chunk_size:
+            break
+        after = chunk[-1][1]
+    if entries:
+        yield bucket_start, entries
+
+
+def compact(model, thermostat_pk, start, end, resolution, result, chunk_size):
+    """
+    Compacts the entries of a thermostat with start <= datetime < end to the resolution.
+    """
+    fields, compaction = COMPACTIONS[model]
+    queryset = model.objects.filter(thermostat_id=thermostat_pk, datetime__lt=end)
+    if start is not None:
+        queryset = queryset.filter(datetime__gte=start)
+
+    removed = []
+    created = []
+    # Datetimes of the removed and created entries
+    changed = []
+
+    def flush():
+        with transaction.atomic():
+            model.objects.filter(pk__in=removed).delete()
+            model.objects.bulk_create(created)
+            if model is Temperature:
+                rollups.rebuild_buckets(thermostat_pk, changed)
+        result.compacted += len(removed)
+        result.created += len(created)
+        del removed[:]
+        del created[:]
+        del changed[:]
+
+    for bucket_start, entries in get_buckets(queryset, fields, resolution, chunk_size):
+        if len(entries) < 2:
+            continue
+        bucket_removed, bucket_created = compaction(bucket_start, entries)
+        removed.extend(bucket_removed)
+        created.extend(bucket_created)
+        changed.append(bucket_start)
+        changed.extend(entry[1] for entry in entries)
+        if len(removed) >= chunk_size:
+            flush()
+    if removed:
+        flush()
+
+
+def remove(model, thermostat_pk, before, result, chunk_size):
+    """
+    Removes the entries of a thermostat older than the datetime.
+    """
+    queryset = model.objects.filter(thermostat_id=thermostat_pk, datetime__lt=before)
+    while True:
+        with transaction.atomic():
+            pks = list(queryset.values_list('pk', flat=True)[:chunk_size])
+            model.objects.filter(pk__in=pks).delete()
+        result.removed += len(pks)
+        if len(pks) < chunk_size:
+            break
+    if model is Temperature:
+        result.removed += archive.remove_temperatures(thermostat_pk, before)
+
+
+def apply(model, policy, now=None, thermostat_pks=None, chunk_size=None):
+    """
+    Applies the retention policy to the entries of the model and returns the result.
+    """
+    if now is None:
+        now = timezone.now()
+    if chunk_size is None:
+        chunk_size = settings.RETENTION_CHUNK_SIZE
+    if thermostat_pks is None:
+        thermostat_pks = Thermostat.objects.order_by('pk').values_list('pk', flat=True)
+
+    tiers, remove_before = get_tiers(policy, now)
+    result = Result()
+    for thermostat_pk in thermostat_pks:
+        changed = result.compacted + result.removed
+        if remove_before is not None:
+            remove(model, thermostat_pk, remove_before, result, chunk_size)
+        horizon = archive.get_horizon(thermostat_pk) if model is Temperature else None
+        for start, end, resolution in tiers:
+            if horizon is not None and (start is None or start < horizon):
+                start = horizon
+            if resolution is not None and (start is None or start < end):
+                compact(model, thermostat_pk, start, end, resolution, result, chunk_size)
+        if result.compacted + result.removed > changed:
+            markers.touch_collections(model, [thermostat_pk])
+    return result
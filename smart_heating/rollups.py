@@ -0,0 +1,229 @@
+"""
+Copyright 2016 Michael Spiegel, Wilhelm Kleiminger
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Maintains the hourly and daily temperature rollups of each thermostat.
+
+New temperatures are merged into the stored rollups. Updated or deleted temperatures require the
+affected buckets to be recomputed from the raw temperatures, since the minimum and maximum can't
+be reverted.
+"""
+
+import datetime
+from collections import OrderedDict
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from smart_heating.archive import TieredTemperatures
+from smart_heating.models import TemperatureRollup, Thermostat
+
+BUCKETS = (TemperatureRollup.HOUR, TemperatureRollup.DAY)
+
+BUCKET_DURATIONS = {
+    TemperatureRollup.HOUR: datetime.timedelta(hours=1),
+    TemperatureRollup.DAY: datetime.timedelta(days=1),
+}
+
+# Number of rollups written per query by `rebuild`
+BATCH_SIZE = 500
+
+AGGREGATE_FIELDS = ('count', 'sum', 'min', 'max', 'first', 'first_datetime', 'last', 'last_datetime')
+
+
+def get_bucket_start(date, bucket):
+    """
+    Returns the start of the bucket containing the datetime. Buckets are aligned in UTC.
+    """
+    date = date.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    if bucket == TemperatureRollup.DAY:
+        date = date.replace(hour=0)
+    return date
+
+
+class Aggregate:
+    """
+    Count, sum, minimum, maximum, first and last value of a set of temperatures.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+        self.first = None
+        self.first_datetime = None
+        self.last = None
+        self.last_datetime = None
+
+    @classmethod
+    def from_rollup(cls, rollup):
+        result = cls()
+        for field in AGGREGATE_FIELDS:
+            setattr(result, field, getattr(rollup, field))
+        return result
+
+    def add(self, date, value):
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        # Temperatures may arrive out of order
+        if self.first_datetime is None or date < self.first_datetime:
+            self.first = value
+            self.first_datetime = date
+        if self.last_datetime is None or date >= self.last_datetime:
+            self.last = value
+            self.last_datetime = date
+
+    def merge(self, other):
+        self.count += other.count
+        self.sum += other.sum
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        if self.first_datetime is None or other.first_datetime < self.first_datetime:
+            self.first = other.first
+            self.first_datetime = other.first_datetime
+        if self.last_datetime is None or other.last_datetime >= self.last_datetime:
+            self.last = other.last
+            self.last_datetime = other.last_datetime
+
+    def apply_to(self, rollup):
+        for field in AGGREGATE_FIELDS:
+            setattr(rollup, field, getattr(self, field))
+        return rollup
+
+
+def aggregate(readings):
+    """
+    Aggregates (thermostat_pk, datetime, value) readings into a dictionary of
+    {(thermostat_pk, bucket, start): Aggregate}.
+    """
+    aggregates = OrderedDict()
+    for thermostat_pk, date, value in readings:
+        for bucket in BUCKETS:
+            key = (thermostat_pk, bucket, get_bucket_start(date, bucket))
+            if key not in aggregates:
+                aggregates[key] = Aggregate()
+            aggregates[key].add(date, value)
+    return aggregates
+
+
+def get_rollups(keys):
+    """
+    Returns the stored rollups of the given (thermostat_pk, bucket, start) keys with a single query.
+    """
+    if not keys:
+        return {}
+    starts = [start for thermostat_pk, bucket, start in keys]
+    rollups = TemperatureRollup.objects.select_for_update().filter(
+        thermostat_id__in=set(thermostat_pk for thermostat_pk, bucket, start in keys),
+        start__range=(min(starts), max(starts)))
+    return dict(((rollup.thermostat_id, rollup.bucket, rollup.start), rollup) for rollup in rollups
+                if (rollup.thermostat_id, rollup.bucket, rollup.start) in keys)
+
+
+def add_temperatures(temperatures):
+    """
+    Merges newly stored temperatures into the rollups.
+    """
+    aggregates = aggregate((temperature.thermostat_id, temperature.datetime, temperature.value)
+                           for temperature in temperatures)
+    with transaction.atomic():
+        stored = get_rollups(aggregates.keys())
+        created = []
+        for key, new_aggregate in aggregates.items():
+            if key in stored:
+                rollup = stored[key]
+                merged = Aggregate.from_rollup(rollup)
+                merged.merge(new_aggregate)
+                merged.apply_to(rollup).save()
+            else:
+                created.append((key, new_aggregate))
+        create_rollups(created)
+
+
+def rebuild_buckets(thermostat_pk, datetimes):
+    """
+    Recomputes the rollups of the buckets containing the given datetimes from the raw and archived temperatures.
+    """
+    hours = set(get_bucket_start(date, TemperatureRollup.HOUR) for date in datetimes)
+    days = set(get_bucket_start(date, TemperatureRollup.DAY) for date in datetimes)
+    with transaction.atomic():
+        for day in days:
+            # The day contains all affected hours of that day
+            end = day + BUCKET_DURATIONS[TemperatureRollup.DAY]
+            temperatures = TieredTemperatures(thermostat_pk).filter(datetime__gte=day, datetime__lt=end)
+            readings = ((thermostat_pk, date, value) for date, value in temperatures.readings())
+            affected = set([(thermostat_pk, TemperatureRollup.DAY, day)])
+            affected.update((thermostat_pk, TemperatureRollup.HOUR, hour) for hour in hours if day <= hour < end)
+            TemperatureRollup.objects.filter(
+                Q(bucket=TemperatureRollup.DAY, start=day) |
+                Q(bucket=TemperatureRollup.HOUR, start__in=[key[2] for key in affected
+                                                            if key[1] == TemperatureRollup.HOUR]),
+                thermostat_id=thermostat_pk).delete()
+            create_rollups([(key, new_aggregate) for key, new_aggregate in aggregate(readings).items()
+                            if key in affected])
+
+
+def rebuild(thermostat_pks=None):
+    """
+    Recomputes the rollups of the given thermostats, or of all thermostats, from the raw temperatures.
+
+    The temperatures are streamed in index order from the database and the archive, so only the currently
+    open buckets are held in memory.
+    Returns the number of rollups written.
+    """
+    rollups = TemperatureRollup.objects.all()
+    if thermostat_pks is None:
+        thermostat_pks = Thermostat.objects.order_by('pk').values_list('pk', flat=True)
+    else:
+        rollups = rollups.filter(thermostat_id__in=thermostat_pks)
+    readings = ((thermostat_pk, date, value) for thermostat_pk in thermostat_pks
+                for date, value in TieredTemperatures(thermostat_pk).readings())
+
+    written = 0
+    with transaction.atomic():
+        rollups.delete()
+        open_buckets = {}
+        completed = []
+        for thermostat_pk, date, value in readings:
+            for bucket in BUCKETS:
+                key = (thermostat_pk, bucket, get_bucket_start(date, bucket))
+                if bucket not in open_buckets or open_buckets[bucket][0] != key:
+                    if bucket in open_buckets:
+                        completed.append(open_buckets[bucket])
+                    open_buckets[bucket] = (key, Aggregate())
+                open_buckets[bucket][1].add(date, value)
+            if len(completed) >= BATCH_SIZE:
+                written += create_rollups(completed)
+                completed = []
+        completed.extend(open_buckets.values())
+        written += create_rollups(completed)
+    return written
+
+
+def create_rollups(aggregates):
+    """
+    Stores a list of ((thermostat_pk, bucket, start), Aggregate) tuples as new rollups.
+    """
+    TemperatureRollup.objects.bulk_create([
+        new_aggregate.apply_to(TemperatureRollup(thermostat_id=key[0], bucket=key[1], start=key[2]))
+        for key, new_aggregate in aggregates])
+    return len(aggregates)
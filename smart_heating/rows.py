@@ -0,0 +1,68 @@
+"""
+Copyright 2016 Michael Spiegel, Wilhelm Kleiminger
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Read only rows of temperatures and meta entries.
+
+The lists of time series are read as named tuples of the serialized fields instead of model instances.
+"""
+
+from collections import namedtuple
+
+from smart_heating.models import Temperature, ThermostatMetaEntry
+
+TemperatureRow = namedtuple('TemperatureRow', ('datetime', 'value'))
+ThermostatMetaEntryRow = namedtuple('ThermostatMetaEntryRow', ('id', 'datetime', 'rssi', 'uptime', 'battery'))
+
+ROW_TYPES = {
+    Temperature: TemperatureRow,
+    ThermostatMetaEntry: ThermostatMetaEntryRow,
+}
+
+
+class RowQuerySet:
+    """
+    Queryset-like wrapper of a queryset, which yields the rows as named tuples.
+
+    Supports filtering, ordering, counting, slicing and iteration, as used by the time range filter
+    and the paginations.
+    """
+
+    def __init__(self, queryset, row_type=None):
+        self.queryset = queryset
+        self.row_type = row_type if row_type is not None else ROW_TYPES[queryset.model]
+
+    def filter(self, *args, **kwargs):
+        return RowQuerySet(self.queryset.filter(*args, **kwargs), self.row_type)
+
+    def order_by(self, *fields):
+        return RowQuerySet(self.queryset.order_by(*fields), self.row_type)
+
+    def count(self):
+        return self.queryset.count()
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        values = self.queryset.values_list(*self.row_type._fields)[index]
+        if not isinstance(index, slice):
+            return self.row_type._make(values)
+        return [self.row_type._make(row) for row in values]
+
+    def __iter__(self):
+        for row in self.queryset.values_list(*self.row_type._fields):
+            yield self.row_type._make(row)
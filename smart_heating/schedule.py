@@ -0,0 +1,164 @@
+"""
+Copyright 2016 Michael Spiegel, Wilhelm Kleiminger
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Evaluates the weekly heating schedule of a thermostat.
+
+A heating table is compiled into the sorted seconds of the week of its entries, so the entry in effect
+and the next change of the setpoint are found by binary search. The compiled schedules are cached in
+the process and reloaded when the change marker of the heating table changes, see `smart_heating.markers`.
+"""
+
+import bisect
+import datetime
+from collections import defaultdict, namedtuple
+
+from django.utils import timezone
+
+from smart_heating import markers
+from smart_heating.models import ChangeMarker, HeatingTableEntry, Thermostat
+
+SECONDS_PER_WEEK = 7 * 24 * 60 * 60
+
+# Heating table entry loaded for the cache, without model instance
+ScheduleEntry = namedtuple('ScheduleEntry', ('day', 'time', 'temperature'))
+
+# Compiled schedule and the (version, modification time) of its heating table by thermostat pk
+_schedules = {}
+
+
+def get_week_position(entry):
+    return int(entry.day), entry.time
+
+
+def get_second_of_week(day, time):
+    return ((int(day) * 24 + time.hour) * 60 + time.minute) * 60 + time.second
+
+
+def make_local(value):
+    """
+    Attaches the current time zone to a naive local datetime.
+    """
+    tz = timezone.get_current_timezone()
+    if hasattr(tz, 'localize'):
+        return tz.normalize(tz.localize(value))
+    return value.replace(tzinfo=tz)
+
+
+class CompiledSchedule:
+    """
+    Heating table entries sorted by their position in the week.
+
+    Times are evaluated in the current time zone. An entry is in effect from its day and time until the
+    next entry. The last entry of the week is in effect until the first entry of the next week.
+    """
+
+    def __init__(self, entries):
+        self.entries = sorted(entries, key=get_week_position)
+        self.positions = [get_second_of_week(entry.day, entry.time) for entry in self.entries]
+
+    def get_position(self, now):
+        now = timezone.localtime(now)
+        return get_second_of_week(now.weekday(), now.time())
+
+    def get_index(self, position):
+        # -1 selects the last entry of the previous week
+        return bisect.bisect_right(self.positions, position) - 1
+
+    def get_entry(self, now):
+        """
+        Returns the entry in effect at the given time, or None if there are no entries.
+        """
+        if not self.entries:
+            return None
+        return self.entries[self.get_index(self.get_position(now))]
+
+    def get_setpoint(self, now):
+        entry = self.get_entry(now)
+        return entry.temperature if entry is not None else None
+
+    def get_next_change(self, now):
+        """
+        Returns the (datetime, entry) tuple of the next entry with a different temperature than the entry
+        in effect at the given time, or None if the setpoint never changes.
+        """
+        if not self.entries:
+            return None
+        position = self.get_position(now)
+        index = self.get_index(position)
+        current = self.entries[index]
+        for offset in range(1, len(self.entries)):
+            candidate = (index + offset) % len(self.entries)
+            if self.entries[candidate].temperature != current.temperature:
+                seconds = (self.positions[candidate] - position) % SECONDS_PER_WEEK
+                local_now = timezone.localtime(now).replace(microsecond=0, tzinfo=None)
+                return make_local(local_now + datetime.timedelta(seconds=seconds)), self.entries[candidate]
+        return None
+
+
+def get_current_entry(entries, now=None):
+    """
+    Returns the heating table entry in effect at the given time, or now, or None if there are no entries.
+    """
+    return CompiledSchedule(entries).get_entry(now if now is not None else timezone.now())
+
+
+def get_current_setpoint(entries, now=None):
+    """
+    Returns the temperature of the heating table entry in effect, or None if there are no entries.
+    """
+    entry = get_current_entry(entries, now)
+    return entry.temperature if entry is not None else None
+
+
+def get_schedule_key(thermostat_pk):
+    return markers.get_collection_key(HeatingTableEntry, Thermostat, thermostat_pk)
+
+
+def get_schedules(thermostat_pks):
+    """
+    Returns a dictionary of the compiled schedules by thermostat pk.
+
+    Reads the versions of the heating tables with a single query and the changed heating tables with a
+    second query, if any.
+    """
+    keys = dict((thermostat_pk, get_schedule_key(thermostat_pk)) for thermostat_pk in thermostat_pks)
+    versions = dict((key, (version, modified)) for key, version, modified in ChangeMarker.objects.filter(
+        key__in=keys.values()).values_list('key', 'version', 'modified'))
+    stale = [thermostat_pk for thermostat_pk, key in keys.items()
+             if thermostat_pk not in _schedules or _schedules[thermostat_pk][0] != versions.get(key)]
+    if stale:
+        entries = defaultdict(list)
+        for thermostat_pk, day, time, temperature in HeatingTableEntry.objects.filter(
+                thermostat_id__in=stale).values_list('thermostat_id', 'day', 'time', 'temperature'):
+            entries[thermostat_pk].append(ScheduleEntry(day, time, temperature))
+        for thermostat_pk in stale:
+            _schedules[thermostat_pk] = (versions.get(keys[thermostat_pk]), CompiledSchedule(entries[thermostat_pk]))
+    return dict((thermostat_pk, _schedules[thermostat_pk][1]) for thermostat_pk in keys)
+
+
+def get_setpoint_state(thermostat_pk, compiled_schedule, now):
+    """
+    Returns the setpoint of the thermostat at the given time and its next change.
+    """
+    next_change = compiled_schedule.get_next_change(now)
+    return {
+        'thermostat': thermostat_pk,
+        'datetime': now,
+        'setpoint': compiled_schedule.get_setpoint(now),
+        'next_change': {'datetime': next_change[0], 'setpoint': next_change[1].temperature}
+        if next_change is not None else None,
+    }
@@ -14,14 +14,47 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+from collections import OrderedDict
+
 from rest_framework import serializers
-from rest_framework.validators import UniqueTogetherValidator
+from rest_framework.validators import UniqueTogetherValidator, UniqueValidator
 
-from smart_heating import relations
+from smart_heating import fieldsets, relations
 from smart_heating.models import *
 
+datetime_field = serializers.DateTimeField()
+
+
+class MACAddressField(serializers.CharField):
+    """
+    A MAC address, converted to its canonical form aa:bb:cc:dd:ee:ff.
+    """
+    default_error_messages = {
+        'invalid': 'Enter a valid MAC address.',
+    }
+
+    def to_internal_value(self, data):
+        mac = normalize_mac(super().to_internal_value(data))
+        if mac is None:
+            self.fail('invalid')
+        return mac
+
 
-class HierarchicalSerializer(serializers.HyperlinkedModelSerializer):
+class SelectableFieldsMixin:
+    """
+    Restricts the fields to the sparse fieldset and the depth requested by the query parameters,
+    see `smart_heating.fieldsets`.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selection = fieldsets.get_selection(self)
+        if selection is None or (selection.fields is None and selection.depth is None):
+            return fields
+        return fieldsets.select_fields(fields, fieldsets.get_path(self), selection)
+
+
+class HierarchicalSerializer(SelectableFieldsMixin, serializers.HyperlinkedModelSerializer):
     """
     Retrieves extra data from the context and includes it to the internal value,
     as if it was included in the passed data for .create(), .update(), etc.
@@ -33,7 +66,7 @@ class HierarchicalSerializer(serializers.HyperlinkedModelSerializer):
         return ret
 
 
-class ResidenceSerializer(serializers.HyperlinkedModelSerializer):
+class ResidenceSerializer(SelectableFieldsMixin, serializers.HyperlinkedModelSerializer):
     """
     Converts a residence object to its string representation and vice versa.
     """
@@ -117,6 +150,30 @@ class HeatingTableEntrySerializer(HierarchicalSerializer):
                                               fields=('day', 'time', 'thermostat'))]
 
 
+class HeatingTableItemSerializer(serializers.Serializer):
+    """
+    Validates a single entry of a bulk heating table edit, see `smart_heating.heating_tables`.
+
+    Contrary to the model serializer no database queries are run. With `partial_table`, a temperature
+    of null removes the entry.
+    """
+    day = serializers.ChoiceField(choices=HeatingTableEntry.DAY_IN_WEEK_CHOICES)
+    time = serializers.TimeField()
+    temperature = serializers.FloatField(min_value=5, max_value=30)
+
+    def __init__(self, *args, partial_table=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['temperature'].allow_null = partial_table
+
+
+class HeatingTableCopySerializer(serializers.Serializer):
+    """
+    Validates the RFIDs of the thermostats a heating table is copied to. Null copies it to all thermostats.
+    """
+    thermostats = serializers.ListField(child=serializers.CharField(validators=[rfid_validator]), required=False,
+                                        allow_null=True)
+
+
 class TemperatureSerializer(HierarchicalSerializer):
     """
     Converts a temperature entry object to its string representation and vice versa.
@@ -130,6 +187,36 @@ class TemperatureSerializer(HierarchicalSerializer):
         fields = ('datetime', 'url', 'value', 'thermostat')
 
 
+class TemperatureRollupSerializer(SelectableFieldsMixin, serializers.ModelSerializer):
+    """
+    Converts a temperature rollup object to its string representation.
+    """
+    average = serializers.ReadOnlyField()
+
+    class Meta:
+        model = TemperatureRollup
+        fields = ('start', 'count', 'sum', 'average', 'min', 'max', 'first', 'first_datetime', 'last',
+                  'last_datetime')
+
+
+class TemperatureItemSerializer(serializers.Serializer):
+    """
+    Validates a single temperature item of a bulk upload.
+
+    Contrary to the model serializer no database queries are run. The uniqueness of the datetime is
+    checked once for the whole upload.
+    """
+    datetime = serializers.DateTimeField()
+    value = serializers.FloatField()
+
+
+class GatewayTemperatureItemSerializer(TemperatureItemSerializer):
+    """
+    Validates a single temperature item of a gateway upload, which includes the RFID of its thermostat.
+    """
+    thermostat = serializers.CharField()
+
+
 class ThermostatMetaEntrySerializer(HierarchicalSerializer):
     """
     Converts a thermostat meta entry object to its string representation and vice versa.
@@ -142,11 +229,125 @@ class ThermostatMetaEntrySerializer(HierarchicalSerializer):
         extra_kwargs = {'thermostat': {}}
 
 
-class ThermostatDeviceSerializer(serializers.HyperlinkedModelSerializer):
+class RowSerializer(serializers.BaseSerializer):
+    """
+    Base class to convert the read only rows of a thermostat's time series to the representation of
+    the model serializer.
+
+    The rows are named tuples of the field values. Each field is represented by the `get_<field name>`
+    method. The urls are built from the thermostat in the `extra_data` of the context, without model
+    instances or serializer fields for each row.
+    """
+    detail_view_name = None
+    field_names = ()
+
+    def get_representation_fields(self):
+        """
+        Returns the (name, method) tuples of the selected fields.
+        """
+        if not hasattr(self, '_representation_fields'):
+            names = self.field_names
+            selection = fieldsets.get_selection(self)
+            if selection is not None:
+                names = selection.get_field_names(fieldsets.get_path(self), names)
+            self._representation_fields = [(name, getattr(self, 'get_' + name)) for name in names]
+        return self._representation_fields
+
+    def get_thermostat_pks(self):
+        if not hasattr(self, '_thermostat_pks'):
+            self._thermostat_pks = self.context['extra_data']['thermostat'].get_recursive_pks()
+        return self._thermostat_pks
+
+    def build_url(self, view_name, args):
+        return relations.build_url(view_name, args=args, request=self.context.get('request'),
+                                   format=self.context.get('format'))
+
+    def get_detail_url(self, lookup_value):
+        return self.build_url(self.detail_view_name, self.get_thermostat_pks() + [lookup_value])
+
+    def to_representation(self, row):
+        return OrderedDict((name, get_value(row)) for name, get_value in self.get_representation_fields())
+
+
+class TemperatureRowSerializer(RowSerializer):
+    """
+    Converts a `TemperatureRow` to the representation of `TemperatureSerializer`.
+    """
+    detail_view_name = 'temperature-detail'
+    field_names = ('datetime', 'url', 'value', 'thermostat')
+
+    def get_datetime(self, row):
+        return datetime_field.to_representation(row.datetime)
+
+    def get_url(self, row):
+        return self.get_detail_url(row.datetime.isoformat())
+
+    def get_value(self, row):
+        return float(row.value)
+
+    def get_thermostat(self, row):
+        # The same for all rows, represented like `SimpleThermostatSerializer`
+        if not hasattr(self, '_thermostat'):
+            url = self.build_url('thermostat-detail', self.get_thermostat_pks())
+            path = fieldsets.get_path(self) + ('thermostat',)
+            selection = fieldsets.get_selection(self)
+            if selection is None or selection.is_expanded(path):
+                names = ['url'] if selection is None else selection.get_field_names(path, ['url'])
+                self._thermostat = OrderedDict([('url', url)] if names else [])
+            else:
+                self._thermostat = url
+        return self._thermostat
+
+
+class ThermostatMetaEntryItemSerializer(serializers.Serializer):
+    """
+    Validates a single thermostat meta entry item of a bulk upload without querying the database.
+    """
+    datetime = serializers.DateTimeField()
+    rssi = serializers.IntegerField(required=False, allow_null=True)
+    uptime = serializers.IntegerField(required=False, allow_null=True)
+    battery = serializers.IntegerField(required=False, allow_null=True)
+
+
+class GatewayThermostatMetaEntryItemSerializer(ThermostatMetaEntryItemSerializer):
+    """
+    Validates a single thermostat meta entry item of a gateway upload, which includes the RFID of its thermostat.
+    """
+    thermostat = serializers.CharField()
+
+
+class ThermostatMetaEntryRowSerializer(RowSerializer):
+    """
+    Converts a `ThermostatMetaEntryRow` to the representation of `ThermostatMetaEntrySerializer`.
+    """
+    detail_view_name = 'thermostatmetaentry-detail'
+    field_names = ('id', 'url', 'datetime', 'rssi', 'uptime', 'battery')
+
+    def get_id(self, row):
+        return row.id
+
+    def get_url(self, row):
+        return self.get_detail_url(row.id)
+
+    def get_datetime(self, row):
+        return datetime_field.to_representation(row.datetime)
+
+    def get_rssi(self, row):
+        return row.rssi
+
+    def get_uptime(self, row):
+        return row.uptime
+
+    def get_battery(self, row):
+        return row.battery
+
+
+class ThermostatDeviceSerializer(SelectableFieldsMixin, serializers.HyperlinkedModelSerializer):
     """
     Converts a thermostat device object to its string representation and vice versa.
     """
     url = relations.HierarchicalHyperlinkedIdentityField(view_name='thermostatdevice-detail', read_only=True)
+    mac = MACAddressField(validators=[UniqueValidator(queryset=ThermostatDevice.objects.all())])
     thermostat = ThermostatSerializer(read_only=True)
 
     class Meta:
@@ -154,14 +355,158 @@ class ThermostatDeviceSerializer(serializers.HyperlinkedModelSerializer):
         fields = ('rfid', 'mac', 'url', 'thermostat')
 
 
-class RaspberryDeviceSerializer(serializers.HyperlinkedModelSerializer):
+class RaspberryDeviceSerializer(SelectableFieldsMixin, serializers.HyperlinkedModelSerializer):
     """
     Converts a Raspberry Pi device object to its string representation and vice versa.
     """
     url = relations.HierarchicalHyperlinkedIdentityField(view_name='raspberrydevice-detail', read_only=True)
+    mac = MACAddressField(validators=[UniqueValidator(queryset=RaspberryDevice.objects.all())])
     residence = ResidenceSerializer(read_only=True)
     thermostat_devices = ThermostatDeviceSerializer(read_only=True, many=True)
 
     class Meta:
         model = RaspberryDevice
         fields = ('rfid', 'mac', 'url', 'residence', 'thermostat_devices')
+
+
+class SetpointChangeSerializer(serializers.Serializer):
+    """
+    Converts the next change of a heating table setpoint to its representation.
+    """
+    datetime = serializers.DateTimeField()
+    setpoint = serializers.FloatField()
+
+
+class SetpointSerializer(serializers.Serializer):
+    """
+    Converts the setpoint of a thermostat at a time and its next change to their representation,
+    see `smart_heating.schedule.get_setpoint_state`.
+    """
+    thermostat = serializers.CharField()
+    datetime = serializers.DateTimeField()
+    setpoint = serializers.FloatField(allow_null=True)
+    next_change = SetpointChangeSerializer(allow_null=True)
+
+
+class BatteryForecastSerializer(SelectableFieldsMixin, serializers.ModelSerializer):
+    """
+    Converts a battery forecast object to its representation.
+    """
+    thermostat = serializers.CharField(source='thermostat_id', read_only=True)
+    thermostat_url = relations.HierarchicalHyperlinkedIdentityField(source='thermostat', view_name='thermostat-detail',
+                                                                    read_only=True)
+
+    class Meta:
+        model = BatteryForecast
+        fields = ('thermostat', 'thermostat_url', 'computed', 'count', 'battery', 'slope', 'empty_date', 'confidence')
+
+
+class DashboardTemperatureSerializer(SelectableFieldsMixin, serializers.ModelSerializer):
+    """
+    Converts the latest temperature of a thermostat to its representation in the residence dashboard.
+    """
+
+    class Meta:
+        model = Temperature
+        fields = ('datetime', 'value')
+
+
+class DashboardThermostatMetaEntrySerializer(SelectableFieldsMixin, serializers.ModelSerializer):
+    """
+    Converts the latest meta entry of a thermostat to its representation in the residence dashboard.
+    """
+
+    class Meta:
+        model = ThermostatMetaEntry
+        fields = ('datetime', 'rssi', 'uptime', 'battery')
+
+
+class DashboardThermostatSerializer(SelectableFieldsMixin, serializers.HyperlinkedModelSerializer):
+    """
+    Converts a thermostat object to its current state in the residence dashboard.
+
+    Expects the `latest_temperature`, `latest_meta_entry` and `setpoint` attributes to be set on the object.
+    """
+    url = relations.HierarchicalHyperlinkedIdentityField(view_name='thermostat-detail', read_only=True)
+    latest_temperature = DashboardTemperatureSerializer(read_only=True)
+    latest_meta_entry = DashboardThermostatMetaEntrySerializer(read_only=True)
+    setpoint = serializers.ReadOnlyField()
+
+    class Meta:
+        model = Thermostat
+        fields = ('rfid', 'url', 'name', 'latest_temperature', 'latest_meta_entry', 'setpoint')
+
+
+class DashboardRoomSerializer(SelectableFieldsMixin, serializers.HyperlinkedModelSerializer):
+    """
+    Converts a room object with its thermostats to its representation in the residence dashboard.
+    """
+    url = relations.HierarchicalHyperlinkedIdentityField(view_name='room-detail', read_only=True)
+    thermostats = DashboardThermostatSerializer(read_only=True, many=True)
+
+    class Meta:
+        model = Room
+        fields = ('id', 'url', 'name', 'thermostats')
+
+
+class GatewayConfigHeatingTableEntrySerializer(serializers.ModelSerializer):
+    """
+    Converts a heating table entry to its representation in the gateway configuration.
+    """
+
+    class Meta:
+        model = HeatingTableEntry
+        fields = ('id', 'day', 'time', 'temperature')
+
+
+class GatewayConfigThermostatDeviceSerializer(serializers.ModelSerializer):
+    """
+    Converts a thermostat device to its representation in the gateway configuration.
+    """
+
+    class Meta:
+        model = ThermostatDevice
+        fields = ('rfid', 'mac')
+
+
+class GatewayConfigThermostatSerializer(serializers.HyperlinkedModelSerializer):
+    """
+    Converts a thermostat with its device and heating table to its representation in the gateway configuration.
+
+    Expects the `device` attribute to be set on the object.
+    """
+    url = relations.HierarchicalHyperlinkedIdentityField(view_name='thermostat-detail', read_only=True)
+    device = GatewayConfigThermostatDeviceSerializer(read_only=True)
+    heating_table = GatewayConfigHeatingTableEntrySerializer(source='heating_table_entries', read_only=True,
+                                                             many=True)
+
+    class Meta:
+        model = Thermostat
+        fields = ('rfid', 'url', 'name', 'device', 'heating_table')
+
+
+class GatewayConfigRoomSerializer(serializers.HyperlinkedModelSerializer):
+    """
+    Converts a room with its thermostats to its representation in the gateway configuration.
+    """
+    url = relations.HierarchicalHyperlinkedIdentityField(view_name='room-detail', read_only=True)
+    thermostats = GatewayConfigThermostatSerializer(read_only=True, many=True)
+
+    class Meta:
+        model = Room
+        fields = ('id', 'url', 'name', 'thermostats')
+
+
+class GatewayConfigSerializer(serializers.HyperlinkedModelSerializer):
+    """
+    Converts a residence to the configuration of its gateway.
+
+    Expects the `config_version` attribute to be set on the object, see `smart_heating.gateway_config`.
+    """
+    version = serializers.ReadOnlyField(source='config_version')
+    url = relations.HierarchicalHyperlinkedIdentityField(view_name='residence-detail', read_only=True)
+    rooms = GatewayConfigRoomSerializer(read_only=True, many=True)
+
+    class Meta:
+        model = Residence
+        fields = ('version', 'rfid', 'url', 'rooms')
@@ -19,3 +19,51 @@ from project.settings import BASE_DIR
 TEMPLATE_DIRS = (
     BASE_DIR + '/smart_heating/templates/',
 )
+
+# Maximum number of points of the temperature chart. Longer series are downsampled.
+TEMPERATURE_CHART_POINTS = 2000
+
+# Number of entries read per query and written per chunk by the streaming exports
+EXPORT_CHUNK_SIZE = 2000
+
+# Directory of the archived temperatures
+TEMPERATURE_ARCHIVE_DIR = BASE_DIR + '/archive/temperatures/'
+# Temperatures of months ending before this many days ago are moved to the archive
+TEMPERATURE_ARCHIVE_AGE_DAYS = 90
+# Archived values are quantised to 1 / TEMPERATURE_ARCHIVE_SCALE degrees
+TEMPERATURE_ARCHIVE_SCALE = 100
+
+# Retention policies as lists of (age in days, resolution in seconds) tiers, ordered by age. Entries younger
+# than the age of a tier and older than the previous tier are kept in the resolution of the tier, where None
+# keeps all entries. An age of None keeps the entries forever, otherwise older entries are removed.
+# Each resolution must be a multiple of the previous one.
+TEMPERATURE_RETENTION = [
+    (30, None),
+    (365, 15 * 60),
+    (None, 24 * 60 * 60),
+]
+THERMOSTAT_META_ENTRY_RETENTION = [
+    (30, None),
+    (None, 60 * 60),
+]
+# Number of entries compacted or removed per transaction
+RETENTION_CHUNK_SIZE = 500
+
+# Alias of the cache storing rendered responses of the read endpoints, e.g. 'default', or None to disable it
+RESPONSE_CACHE = None
+# Seconds until a cached response expires. Responses are invalidated on writes regardless.
+RESPONSE_CACHE_TIMEOUT = 10 * 60
+
+# Maximum number of seconds a long-poll of the gateway configuration blocks
+GATEWAY_CONFIG_MAX_WAIT = 60
+# Seconds between the version checks of a blocked long-poll. Writes in the same process wake it up earlier.
+GATEWAY_CONFIG_POLL_INTERVAL = 1
+
+# Days of meta entries the battery forecasts are fitted to
+BATTERY_FORECAST_DAYS = 30
+# Minimum number of battery levels of a thermostat to forecast its depletion
+BATTERY_FORECAST_MIN_ENTRIES = 3
+# Battery level of an empty battery, in the unit of the meta entries (millivolts)
+BATTERY_EMPTY_LEVEL = 2200
+# Projected empty dates further in the future are discarded as unreliable
+BATTERY_FORECAST_HORIZON_DAYS = 5 * 365
@@ -0,0 +1,86 @@
+"""
+Copyright 2016 Michael Spiegel, Wilhelm Kleiminger
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Keeps the data derived from temperatures and meta entries up to date when single entries are saved and
+touches the change markers of the other models on writes. Device writes drop the device index,
+see `smart_heating.devices`, and writes of the gateway configuration increase its version, see
+`smart_heating.gateway_config`.
+
+Bulk inserts of temperatures and meta entries don't send signals and update the derived data explicitly,
+see `smart_heating.ingest`. Their deletes aren't handled here to keep cascading deletes fast.
+"""
+
+from django.db.models.signals import pre_save, post_save, post_delete
+
+from smart_heating import devices, gateway_config, ingest, markers
+from smart_heating.models import Temperature, ThermostatMetaEntry, RaspberryDevice, ThermostatDevice
+
+TIME_SERIES_MODELS = (Temperature, ThermostatMetaEntry)
+
+
+def remember_previous_datetime(sender, instance, raw=False, **kwargs):
+    if raw or instance.pk is None:
+        return
+    # The buckets of the previous datetime are affected as well
+    instance._previous_datetime = sender.objects.filter(pk=instance.pk).values_list('datetime', flat=True).first()
+
+
+def entry_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        ingest.entries_created(sender, [instance])
+    else:
+        datetimes = [instance.datetime]
+        if getattr(instance, '_previous_datetime', None) is not None:
+            datetimes.append(instance._previous_datetime)
+        ingest.entries_changed(sender, instance.thermostat_id, datetimes)
+
+
+for model in TIME_SERIES_MODELS:
+    pre_save.connect(remember_previous_datetime, sender=model)
+    post_save.connect(entry_saved, sender=model)
+
+
+def touch_markers(sender, instance, raw=False, **kwargs):
+    if not raw:
+        markers.touch(markers.get_instance_keys(instance))
+
+
+for model in markers.TRACKED_MODELS:
+    post_save.connect(touch_markers, sender=model)
+    post_delete.connect(touch_markers, sender=model)
+
+for model in (RaspberryDevice, ThermostatDevice):
+    post_save.connect(devices.clear_index, sender=model)
+    post_delete.connect(devices.clear_index, sender=model)
+
+
+def remember_previous_config_residences(sender, instance, raw=False, **kwargs):
+    if not raw:
+        gateway_config.remember_previous_residences(instance)
+
+
+def touch_config(sender, instance, raw=False, **kwargs):
+    if not raw:
+        gateway_config.touch(instance)
+
+
+for model in gateway_config.CONFIG_MODELS:
+    pre_save.connect(remember_previous_config_residences, sender=model)
+    post_save.connect(touch_config, sender=model)
+    post_delete.connect(touch_config, sender=model)
@@ -15,12 +15,13 @@ limitations under the License.
 """
 
 import datetime
+from unittest import mock
 
 from rest_framework import status
 from rest_framework.test import APITestCase
 from django.utils import timezone
 
-from smart_heating import models
+from smart_heating import ingest, models
 
 
 class ViewRootTestCase(APITestCase):
@@ -494,6 +495,28 @@ class ViewTemperatureTestCase(APITestCase):
         self.assertEqual(temperature.value, 25.3)
         self.assertEqual(temperature.thermostat, self.thermostat)
 
+    def test_create_temperature_with_same_datetime_in_separate_thermostat(self):
+        second_thermostat = models.Thermostat.objects.create(room=self.room, rfid='5b')
+        date = datetime.datetime(2015, 5, 13, 7, 0, 0, 0, timezone.get_current_timezone())
+        models.Temperature.objects.create(thermostat=self.thermostat, datetime=date, value=36.1)
+
+        temperature_data = {'datetime': date.isoformat(), 'value': 25.3}
+        response = self.client.post('/residence/3/room/1/thermostat/5b/temperature/', temperature_data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        response = self.client.get('/residence/3/room/1/thermostat/5b/temperature/%s/' % date.isoformat())
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data.get('value'), 25.3)
+
+    def test_create_temperature_duplicate(self):
+        date = datetime.datetime(2015, 5, 13, 7, 0, 0, 0, timezone.get_current_timezone())
+        models.Temperature.objects.create(thermostat=self.thermostat, datetime=date, value=36.1)
+
+        temperature_data = {'datetime': date.isoformat(), 'value': 25.3}
+        response = self.client.post('/residence/3/room/1/thermostat/5/temperature/', temperature_data)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_update_temperature(self):
         date = datetime.datetime(2015, 5, 13, 7, 0, 0, 0, timezone.get_current_timezone())
         temperature = models.Temperature.objects.create(thermostat=self.thermostat, datetime=date, value=36.1)
@@ -537,6 +560,109 @@ class ViewTemperatureTestCase(APITestCase):
 
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
+    def test_bulk_create_temperatures(self):
+        date0 = datetime.datetime(2015, 5, 13, 7, 0, 0, 0, timezone.get_current_timezone())
+        date1 = datetime.datetime(2015, 5, 13, 7, 1, 0, 0, timezone.get_current_timezone())
+        data = [{'datetime': date0.isoformat(), 'value': 21.5}, {'datetime': date1.isoformat(), 'value': 21.7}]
+        response = self.client.post('/residence/3/room/1/thermostat/5/temperature/bulk/', data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        self.assertEqual([result.get('status') for result in response.data], [201, 201])
+        self.assertEqual(response.data[0].get('datetime'), '2015-05-13T07:00:00Z')
+        self.assertEqual(models.Temperature.objects.filter(thermostat=self.thermostat).count(), 2)
+
+    def test_bulk_create_temperatures_reports_invalid_items(self):
+        date0 = datetime.datetime(2015, 5, 13, 7, 0, 0, 0, timezone.get_current_timezone())
+        date1 = datetime.datetime(2015, 5, 13, 7, 1, 0, 0, timezone.get_current_timezone())
+        models.Temperature.objects.create(thermostat=self.thermostat, datetime=date0, value=21.0)
+        data = [{'datetime': date0.isoformat(), 'value': 21.5},
+                {'datetime': date1.isoformat(), 'value': 'warm'},
+                {'datetime': date1.isoformat(), 'value': 21.7},
+                {'datetime': date1.isoformat(), 'value': 21.8}]
+        response = self.client.post('/residence/3/room/1/thermostat/5/temperature/bulk/', data, format='json')
+
+        self.assertEqual(response.status_code, 207, response.data)
+        self.assertEqual([result.get('status') for result in response.data], [400, 400, 201, 400])
+        self.assertIn('datetime', response.data[0].get('errors'))
+        self.assertIn('value', response.data[1].get('errors'))
+        self.assertEqual(models.Temperature.objects.get(datetime=date1).value, 21.7)
+
+    def test_bulk_create_temperatures_stored_concurrently(self):
+        date0 = datetime.datetime(2015, 5, 13, 7, 0, 0, 0, timezone.get_current_timezone())
+        date1 = datetime.datetime(2015, 5, 13, 7, 1, 0, 0, timezone.get_current_timezone())
+        models.Temperature.objects.create(thermostat=self.thermostat, datetime=date0, value=21.0)
+        data = [{'datetime': date0.isoformat(), 'value': 21.5}, {'datetime': date1.isoformat(), 'value': 21.7}]
+        # The duplicate is stored after the uniqueness check, e.g. by a retried upload
+        with mock.patch.object(ingest, 'get_existing_keys', return_value=set()):
+            response = self.client.post('/residence/3/room/1/thermostat/5/temperature/bulk/', data, format='json')
+
+        self.assertEqual(response.status_code, 207, response.data)
+        self.assertEqual([result.get('status') for result in response.data], [400, 201])
+        self.assertIn('datetime', response.data[0].get('errors'))
+        self.assertEqual(models.Temperature.objects.get(datetime=date0).value, 21.0)
+        self.assertEqual(models.Temperature.objects.get(datetime=date1).value, 21.7)
+
+    def test_bulk_create_temperatures_of_unrelated_room_404(self):
+        unrelated_room = models.Room.objects.create(residence=self.residence, name='Unrelated Room')
+        date = datetime.datetime(2015, 5, 13, 7, 0, 0, 0, timezone.get_current_timezone())
+        data = [{'datetime': date.isoformat(), 'value': 21.5}]
+        response = self.client.post('/residence/3/room/%s/thermostat/5/temperature/bulk/' % unrelated_room.pk, data,
+                                    format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(models.Temperature.objects.count(), 0)
+
+    def test_list_temperatures_with_cursor(self):
+        date = datetime.datetime(2015, 5, 13, 7, 0, 0, 0, timezone.get_current_timezone())
+        models.Temperature.objects.bulk_create([
+            models.Temperature(thermostat=self.thermostat, datetime=date + datetime.timedelta(minutes=i), value=i)
+            for i in range(150)])
+
+        response = self.client.get('/residence/3/room/1/thermostat/5/temperature/?cursor=')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('count', response.data)
+        self.assertEqual(response.data.get('previous_url'), None)
+        self.assertEqual(response.data.get('latest_temperature_url'),
+                         'http://testserver/residence/3/room/1/thermostat/5/temperature/latest/')
+        self.assertEqual(len(response.data.get('results')), 100)
+        self.assertEqual(response.data.get('results')[0].get('value'), 0)
+
+        # New readings don't shift the next page
+        models.Temperature.objects.create(thermostat=self.thermostat, datetime=date - datetime.timedelta(days=1),
+                                          value=-1)
+        response = self.client.get(response.data.get('next_url'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([result.get('value') for result in response.data.get('results')], list(range(100, 150)))
+        self.assertEqual(response.data.get('next_url'), None)
+
+        response = self.client.get(response.data.get('previous_url'))
+        self.assertEqual([result.get('value') for result in response.data.get('results')], list(range(0, 100)))
+
+    def test_list_temperatures_in_time_range(self):
+        date = datetime.datetime(2015, 5, 13, 7, 0, 0, 0, timezone.get_current_timezone())
+        models.Temperature.objects.bulk_create([
+            models.Temperature(thermostat=self.thermostat, datetime=date + datetime.timedelta(hours=i), value=i)
+            for i in range(5)])
+        start = date + datetime.timedelta(hours=1)
+        end = date + datetime.timedelta(hours=3)
+
+        response = self.client.get('/residence/3/room/1/thermostat/5/temperature/',
+                                   {'from': start.isoformat(), 'to': int(end.timestamp() * 1000)})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data.get('count'), 2)
+        self.assertEqual([result.get('value') for result in response.data.get('results')], [1, 2])
+        self.assertIn('from=', response.data.get('chart_url'))
+        self.assertIn('to=', response.data.get('chart_url'))
+
+    def test_list_temperatures_with_invalid_time_range(self):
+        response = self.client.get('/residence/3/room/1/thermostat/5/temperature/', {'from': 'yesterday'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('from', response.data)
+
 
 class ViewHeatingTableEntryTestCase(APITestCase):
     def setUp(self):
@@ -0,0 +1,133 @@
+"""
+Copyright 2016 Michael Spiegel, Wilhelm Kleiminger
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import datetime
+
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from smart_heating import markers, models
+
+
+class ConditionalGetTestCase(APITestCase):
+    def setUp(self):
+        self.residence = models.Residence.objects.create(rfid='3')
+        self.room = models.Room.objects.create(residence=self.residence, name='fancy room name')
+        self.thermostat = models.Thermostat.objects.create(room=self.room, rfid='5', name='window')
+        self.date = datetime.datetime(2015, 5, 13, 7, 0, 0, 0, timezone.utc)
+
+    def assertNotModified(self, url, response):
+        etag_response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(etag_response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(etag_response.content, b'')
+        self.assertEqual(etag_response['ETag'], response['ETag'])
+
+    def assertModified(self, url, response):
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, status.HTTP_200_OK)
+
+    def test_heating_table_not_modified(self):
+        url = '/residence/3/room/1/thermostat/5/heating_table/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('Last-Modified', response)
+        self.assertNotModified(url, response)
+        since_response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(since_response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        models.HeatingTableEntry.objects.create(thermostat=self.thermostat, day=models.HeatingTableEntry.MONDAY,
+                                                time=datetime.time(6, 0), temperature=21.0)
+        self.assertModified(url, response)
+
+    def test_changes_of_parents_modify_nested_representations(self):
+        url = '/residence/3/room/1/thermostat/5/'
+        response = self.client.get(url)
+        self.assertNotModified(url, response)
+
+        self.room.name = 'new room name'
+        self.room.save()
+        self.assertModified(url, response)
+
+    def test_temperatures_only_modify_their_thermostat(self):
+        models.Thermostat.objects.create(room=self.room, rfid='6', name='door')
+        url = '/residence/3/room/1/thermostat/5/temperature/latest/'
+        other_url = '/residence/3/room/1/thermostat/6/temperature/'
+        models.Temperature.objects.create(thermostat=self.thermostat, datetime=self.date, value=20.0)
+        response = self.client.get(url)
+        other_response = self.client.get(other_url)
+
+        data = [{'datetime': (self.date + datetime.timedelta(minutes=1)).isoformat(), 'value': 21.0}]
+        self.client.post('/residence/3/room/1/thermostat/5/temperature/bulk/', data, format='json')
+
+        self.assertModified(url, response)
+        self.assertNotModified(other_url, other_response)
+
+    def test_deleted_meta_entry_modifies_list(self):
+        meta_entry = models.ThermostatMetaEntry.objects.create(thermostat=self.thermostat, datetime=self.date)
+        url = '/residence/3/room/1/thermostat/5/meta_entry/'
+        response = self.client.get(url)
+
+        self.client.delete('%s%d/' % (url, meta_entry.pk))
+        self.assertModified(url, response)
+
+    def test_updated_meta_entry_is_modified(self):
+        meta_entry = models.ThermostatMetaEntry.objects.create(thermostat=self.thermostat, datetime=self.date, rssi=-50)
+        url = '/residence/3/room/1/thermostat/5/meta_entry/%d/' % meta_entry.pk
+        response = self.client.get(url)
+        self.assertNotModified(url, response)
+
+        data = {'datetime': self.date.isoformat(), 'rssi': -60, 'uptime': 10, 'battery': 3000}
+        self.assertEqual(self.client.put(url, data, format='json').status_code, status.HTTP_200_OK)
+        self.assertModified(url, response)
+
+    def test_deleted_meta_entry_is_not_found(self):
+        meta_entry = models.ThermostatMetaEntry.objects.create(thermostat=self.thermostat, datetime=self.date)
+        url = '/residence/3/room/1/thermostat/5/meta_entry/%d/' % meta_entry.pk
+        response = self.client.get(url)
+
+        self.client.delete(url)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code,
+                         status.HTTP_404_NOT_FOUND)
+
+    def test_missing_parent_is_not_found(self):
+        # A wildcard matches any entity tag
+        response = self.client.get('/residence/3/room/1/thermostat/6/temperature/', HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_representations_have_different_etags(self):
+        url = '/residence/3/room/1/'
+        self.assertNotEqual(self.client.get(url, {'format': 'json'})['ETag'],
+                            self.client.get(url, {'format': 'api'})['ETag'])
+
+    def test_time_ranges_have_different_etags(self):
+        url = '/residence/3/room/1/thermostat/5/temperature/'
+        self.assertNotEqual(self.client.get(url, {'from': self.date.isoformat()})['ETag'],
+                            self.client.get(url, {'to': self.date.isoformat()})['ETag'])
+
+    def test_temperatures_do_not_touch_a_model_marker(self):
+        models.Temperature.objects.create(thermostat=self.thermostat, datetime=self.date, value=20.0)
+        self.assertFalse(models.ChangeMarker.objects.filter(key=markers.get_model_key(models.Temperature)).exists())
+
+    def test_device_lookup_not_modified(self):
+        models.ThermostatDevice.objects.create(rfid='5', mac='00:00:00:00:00:05')
+        url = '/device/thermostat/lookup/?mac=00:00:00:00:00:05'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotModified(url, response)
+
+        self.thermostat.name = 'new name'
+        self.thermostat.save()
+        self.assertModified(url, response)
@@ -0,0 +1,131 @@
+"""
+Copyright 2016 Michael Spiegel, Wilhelm Kleiminger
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import datetime
+
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from smart_heating import models, schedule
+
+
+class ViewResidenceDashboardTestCase(APITestCase):
+    def setUp(self):
+        self.residence = models.Residence.objects.create(rfid='3')
+        self.room = models.Room.objects.create(residence=self.residence, name='fancy room name')
+        self.thermostat = models.Thermostat.objects.create(room=self.room, rfid='5', name='window')
+        self.date = datetime.datetime(2015, 5, 13, 7, 0, 0, 0, timezone.utc)
+
+    def add_thermostat(self, rfid):
+        room = models.Room.objects.create(residence=self.residence, name='room %s' % rfid)
+        thermostat = models.Thermostat.objects.create(room=room, rfid=rfid, name='thermostat %s' % rfid)
+        models.Temperature.objects.create(thermostat=thermostat, datetime=self.date, value=20.0)
+        models.ThermostatMetaEntry.objects.create(thermostat=thermostat, datetime=self.date, rssi=-50)
+        models.HeatingTableEntry.objects.create(thermostat=thermostat, day=models.HeatingTableEntry.MONDAY,
+                                                time=datetime.time(6, 0), temperature=21.0)
+
+    def test_dashboard(self):
+        models.Temperature.objects.create(thermostat=self.thermostat, datetime=self.date, value=21.5)
+        models.Temperature.objects.create(thermostat=self.thermostat, datetime=self.date - datetime.timedelta(hours=1),
+                                          value=20.0)
+        models.ThermostatMetaEntry.objects.create(thermostat=self.thermostat, datetime=self.date, rssi=-40,
+                                                  uptime=10, battery=3300)
+        models.HeatingTableEntry.objects.create(thermostat=self.thermostat, day=models.HeatingTableEntry.MONDAY,
+                                                time=datetime.time(0, 0), temperature=18.0)
+
+        response = self.client.get('/residence/3/dashboard/')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 1)
+        room = response.data[0]
+        self.assertEqual(room['name'], 'fancy room name')
+        self.assertTrue(room['url'].endswith('/residence/3/room/1/'))
+        thermostat = room['thermostats'][0]
+        self.assertEqual(thermostat['rfid'], '5')
+        self.assertTrue(thermostat['url'].endswith('/residence/3/room/1/thermostat/5/'))
+        self.assertEqual(thermostat['latest_temperature']['value'], 21.5)
+        self.assertEqual(thermostat['latest_meta_entry']['battery'], 3300)
+        self.assertEqual(thermostat['setpoint'], 18.0)
+
+    def test_dashboard_without_readings(self):
+        response = self.client.get('/residence/3/dashboard/')
+
+        thermostat = response.data[0]['thermostats'][0]
+        self.assertIsNone(thermostat['latest_temperature'])
+        self.assertIsNone(thermostat['latest_meta_entry'])
+        self.assertIsNone(thermostat['setpoint'])
+
+    def test_dashboard_refreshes_deleted_readings(self):
+        models.Temperature.objects.create(thermostat=self.thermostat, datetime=self.date, value=21.5)
+        models.Temperature.objects.create(thermostat=self.thermostat, datetime=self.date - datetime.timedelta(hours=1),
+                                          value=20.0)
+        models.ThermostatMetaEntry.objects.create(thermostat=self.thermostat, datetime=self.date, rssi=-40)
+        self.add_thermostat('6')
+        models.Temperature.objects.filter(datetime=self.date).delete()
+        models.ThermostatMetaEntry.objects.filter(thermostat=self.thermostat).delete()
+
+        response = self.client.get('/residence/3/dashboard/')
+
+        thermostats = dict((thermostat['rfid'], thermostat) for room in response.data
+                           for thermostat in room['thermostats'])
+        self.assertEqual(thermostats['5']['latest_temperature']['value'], 20.0)
+        self.assertIsNone(thermostats['5']['latest_meta_entry'])
+        self.assertIsNone(thermostats['6']['latest_temperature'])
+        self.assertEqual(thermostats['6']['latest_meta_entry']['rssi'], -50)
+        self.assertEqual(models.LatestReading.objects.get(pk='5').temperature_datetime,
+                         self.date - datetime.timedelta(hours=1))
+
+    def test_dashboard_of_unknown_residence(self):
+        response = self.client.get('/residence/4/dashboard/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_dashboard_with_constant_queries(self):
+        self.add_thermostat('6')
+        with self.assertNumQueries(4):
+            self.client.get('/residence/3/dashboard/')
+
+        self.add_thermostat('7')
+        self.add_thermostat('8')
+        with self.assertNumQueries(4):
+            response = self.client.get('/residence/3/dashboard/')
+        self.assertEqual(len(response.data), 4)
+
+
+class ScheduleTestCase(APITestCase):
+    def setUp(self):
+        residence = models.Residence.objects.create(rfid='3')
+        room = models.Room.objects.create(residence=residence, name='fancy room name')
+        self.thermostat = models.Thermostat.objects.create(room=room, rfid='5')
+        for day, hour, temperature in [(models.HeatingTableEntry.MONDAY, 6, 21.0),
+                                       (models.HeatingTableEntry.MONDAY, 22, 17.0),
+                                       (models.HeatingTableEntry.FRIDAY, 8, 19.0)]:
+            models.HeatingTableEntry.objects.create(thermostat=self.thermostat, day=day, time=datetime.time(hour),
+                                                    temperature=temperature)
+
+    def get_setpoint(self, *args):
+        entries = self.thermostat.heating_table_entries.all()
+        return schedule.get_current_setpoint(entries, datetime.datetime(*args, tzinfo=timezone.utc))
+
+    def test_current_setpoint(self):
+        # 2015-05-11 is a Monday
+        self.assertEqual(self.get_setpoint(2015, 5, 11, 6, 0), 21.0)
+        self.assertEqual(self.get_setpoint(2015, 5, 11, 23, 0), 17.0)
+        self.assertEqual(self.get_setpoint(2015, 5, 14, 12, 0), 17.0)
+        self.assertEqual(self.get_setpoint(2015, 5, 16, 12, 0), 19.0)
+
+    def test_current_setpoint_wraps_around_the_week(self):
+        self.assertEqual(self.get_setpoint(2015, 5, 11, 5, 59), 19.0)
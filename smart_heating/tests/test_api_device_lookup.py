@@ -0,0 +1,130 @@
+"""
+Copyright 2016 Michael Spiegel, Wilhelm Kleiminger
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from smart_heating import devices, models
+
+
+class NormalizeMacTestCase(TestCase):
+    def test_normalize_mac(self):
+        for value in ('AA:BB:CC:00:11:22', 'aa-bb-cc-00-11-22', 'aabb.cc00.1122', 'AABBCC001122',
+                      ' aa:bb:cc:00:11:22 '):
+            self.assertEqual(models.normalize_mac(value), 'aa:bb:cc:00:11:22')
+
+    def test_normalize_invalid_mac(self):
+        for value in ('', 'aa:bb:cc:00:11', 'aa:bb:cc:00:11:22:33', 'gg:bb:cc:00:11:22'):
+            self.assertIsNone(models.normalize_mac(value))
+
+    def test_normalize_mac_prefix(self):
+        self.assertEqual(devices.normalize_mac_prefix('AA-BB-C'), 'aa:bb:c')
+        self.assertEqual(devices.normalize_mac_prefix('aabbcc'), 'aa:bb:cc')
+        self.assertIsNone(devices.normalize_mac_prefix('room'))
+
+    def test_save_normalizes_mac(self):
+        device = models.ThermostatDevice.objects.create(rfid='5', mac='00-00-00-00-00-0A')
+        self.assertEqual(models.ThermostatDevice.objects.get(pk=device.pk).mac, '00:00:00:00:00:0a')
+
+
+class DeviceLookupTestCase(APITestCase):
+    def setUp(self):
+        residence = models.Residence.objects.create(rfid='3')
+        room = models.Room.objects.create(residence=residence, name='room')
+        for rfid in ('5', '6', '56'):
+            models.Thermostat.objects.create(room=room, rfid=rfid)
+            models.ThermostatDevice.objects.create(rfid=rfid, mac='00:00:00:00:00:%02d' % int(rfid))
+        models.RaspberryDevice.objects.create(rfid='3', mac='b8:27:eb:00:00:01')
+
+    def test_lookup_normalizes_mac(self):
+        response = self.client.get('/device/thermostat/lookup/', {'mac': '00-00-00-00-00-05'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['rfid'], '5')
+
+        response = self.client.get('/device/raspberry/lookup/', {'mac': 'B827EB000001'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['rfid'], '3')
+
+    def test_lookup_of_invalid_mac(self):
+        response = self.client.get('/device/thermostat/lookup/', {'mac': 'invalid'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('mac', response.data)
+
+    def test_lookup_of_unknown_mac(self):
+        devices.get_index(models.ThermostatDevice)
+        with self.assertNumQueries(2):
+            # Change markers and the version of the index
+            response = self.client.get('/device/thermostat/lookup/', {'mac': '00:00:00:00:00:99'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_batch_lookup(self):
+        response = self.client.get('/device/thermostat/lookup/?mac=00:00:00:00:00:06&mac=00-00-00-00-00-99'
+                                   '&mac=00:00:00:00:00:05')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(response.data), ['00:00:00:00:00:06', '00:00:00:00:00:99', '00:00:00:00:00:05'])
+        self.assertEqual(response.data['00:00:00:00:00:06']['rfid'], '6')
+        self.assertIsNone(response.data['00:00:00:00:00:99'])
+        self.assertEqual(response.data['00:00:00:00:00:05']['rfid'], '5')
+
+    def test_batch_lookup_with_constant_queries(self):
+        devices.get_index(models.ThermostatDevice)
+        url = '/device/thermostat/lookup/?mac=00:00:00:00:00:05&mac=00:00:00:00:00:06&mac=00:00:00:00:00:56'
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Change markers, version of the index, devices and their thermostats joined with rooms and residences
+        self.assertEqual(len(context.captured_queries), 4)
+
+    def test_index_is_invalidated_by_writes(self):
+        url = '/device/thermostat/lookup/'
+        self.assertEqual(self.client.get(url, {'mac': '00:00:00:00:00:05'}).status_code, status.HTTP_200_OK)
+
+        models.ThermostatDevice.objects.filter(pk='5').get().delete()
+        self.assertEqual(self.client.get(url, {'mac': '00:00:00:00:00:05'}).status_code, status.HTTP_404_NOT_FOUND)
+
+        response = self.client.post('/device/thermostat/', {'rfid': '5', 'mac': '00:00:00:00:00:AB'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['mac'], '00:00:00:00:00:ab')
+        self.assertEqual(self.client.get(url, {'mac': '00:00:00:00:00:ab'}).data['rfid'], '5')
+
+    def test_index_is_reloaded_on_new_version(self):
+        index = devices.get_index(models.ThermostatDevice)
+        self.assertIs(devices.get_index(models.ThermostatDevice), index)
+        # A write of another process only touches the change marker
+        models.ChangeMarker.objects.filter(key='thermostatdevice').update(version=index.version + 1)
+        self.assertIsNot(devices.get_index(models.ThermostatDevice), index)
+
+    def test_create_with_duplicate_mac(self):
+        response = self.client.post('/device/thermostat/', {'rfid': '7', 'mac': '00-00-00-00-00-05'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('mac', response.data)
+
+    def test_search(self):
+        response = self.client.get('/device/thermostat/search/', {'q': '5'})
+        self.assertEqual([device['rfid'] for device in response.data], ['5', '56'])
+
+        response = self.client.get('/device/thermostat/search/', {'q': '00-00-00-00-00-0'})
+        self.assertEqual([device['rfid'] for device in response.data], ['5', '6'])
+
+        response = self.client.get('/device/thermostat/search/', {'q': 'unknown'})
+        self.assertEqual(response.data, [])
+
+    def test_search_without_query(self):
+        response = self.client.get('/device/thermostat/search/')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,85 @@
+"""
+Copyright 2016 Michael Spiegel, Wilhelm Kleiminger
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import datetime
+import json
+
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from smart_heating import models
+
+
+class ViewExportTestCase(APITestCase):
+    def setUp(self):
+        self.residence = models.Residence.objects.create(rfid='3')
+        self.room = models.Room.objects.create(residence=self.residence, name='fancy room name')
+        self.thermostat0 = models.Thermostat.objects.create(room=self.room, rfid='5')
+        self.thermostat1 = models.Thermostat.objects.create(room=self.room, rfid='6')
+        self.date = datetime.datetime(2015, 5, 13, 7, 0, 0, 0, timezone.utc)
+        for thermostat in (self.thermostat0, self.thermostat1):
+            models.Temperature.objects.bulk_create([
+                models.Temperature(thermostat=thermostat, datetime=self.date + datetime.timedelta(minutes=minute),
+                                   value=20.0 + minute) for minute in range(5)])
+
+    def get_content(self, response):
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return b''.join(response.streaming_content).decode()
+
+    def test_export_thermostat_csv(self):
+        response = self.client.get('/residence/3/room/1/thermostat/5/export/', {'format': 'csv'})
+
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('filename="3-1-5-temperature.csv"', response['Content-Disposition'])
+        lines = self.get_content(response).splitlines()
+        self.assertEqual(lines[0], 'thermostat,datetime,value')
+        self.assertEqual(lines[1], '5,2015-05-13T07:00:00Z,20.0')
+        self.assertEqual(len(lines), 6)
+
+    @override_settings(EXPORT_CHUNK_SIZE=2)
+    def test_export_room_ndjson_in_chunks(self):
+        response = self.client.get('/residence/3/room/1/export/', {'format': 'ndjson'})
+
+        rows = [json.loads(line) for line in self.get_content(response).splitlines()]
+        self.assertEqual(len(rows), 10)
+        self.assertEqual([row['thermostat'] for row in rows], ['5'] * 5 + ['6'] * 5)
+        self.assertEqual([row['value'] for row in rows[:5]], [20.0, 21.0, 22.0, 23.0, 24.0])
+
+    def test_export_residence_meta_entries_in_time_range(self):
+        for minute in range(3):
+            models.ThermostatMetaEntry.objects.create(thermostat=self.thermostat1, rssi=-minute,
+                                                      datetime=self.date + datetime.timedelta(minutes=minute))
+
+        response = self.client.get('/residence/3/export/', {
+            'series': 'meta_entry',
+            'from': (self.date + datetime.timedelta(minutes=1)).isoformat(),
+        }, HTTP_ACCEPT='text/csv')
+
+        lines = self.get_content(response).splitlines()
+        self.assertEqual(lines, ['thermostat,datetime,rssi,uptime,battery',
+                                 '6,2015-05-13T07:01:00Z,-1,,',
+                                 '6,2015-05-13T07:02:00Z,-2,,'])
+
+    def test_export_unknown_series(self):
+        response = self.client.get('/residence/3/export/', {'series': 'humidity'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_thermostat_of_other_room(self):
+        models.Room.objects.create(residence=self.residence, name='other room')
+        response = self.client.get('/residence/3/room/2/thermostat/5/export/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
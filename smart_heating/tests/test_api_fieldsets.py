@@ -0,0 +1,107 @@
+"""
+Copyright 2016 Michael Spiegel, Wilhelm Kleiminger
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import datetime
+
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from smart_heating import models
+
+
+class FieldsetsTestCase(APITestCase):
+    def setUp(self):
+        self.residence = models.Residence.objects.create(rfid='3')
+        self.room = models.Room.objects.create(residence=self.residence, name='fancy room name')
+        self.thermostat = models.Thermostat.objects.create(room=self.room, rfid='5', name='window')
+        models.RaspberryDevice.objects.create(rfid='3', mac='00:00:00:00:00:03')
+        models.ThermostatDevice.objects.create(rfid='5', mac='00:00:00:00:00:05')
+        self.thermostat_url = '/residence/3/room/1/thermostat/5/'
+
+    def test_fields(self):
+        response = self.client.get(self.thermostat_url, {'fields': 'rfid,name'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'rfid': '5', 'name': 'window'})
+
+    def test_nested_fields(self):
+        response = self.client.get('/device/thermostat/', {'fields': 'mac, thermostat.name,thermostat.room.residence'})
+
+        residence = {'rfid': '3', 'url': 'http://testserver/residence/3/',
+                     'rooms_url': 'http://testserver/residence/3/room/',
+                     'users_url': 'http://testserver/residence/3/user/'}
+        self.assertEqual(response.data, [{'mac': '00:00:00:00:00:05',
+                                          'thermostat': {'name': 'window', 'room': {'residence': residence}}}])
+
+    def test_unknown_fields_are_ignored(self):
+        response = self.client.get(self.thermostat_url, {'fields': 'rfid,unknown'})
+        self.assertEqual(response.data, {'rfid': '5'})
+
+    def test_depth(self):
+        response = self.client.get(self.thermostat_url, {'depth': '0'})
+
+        self.assertEqual(response.data['room'], 'http://testserver/residence/3/room/1/')
+        self.assertEqual(response.data['temperatures_url'],
+                         'http://testserver/residence/3/room/1/thermostat/5/temperature/')
+
+    def test_depth_with_expand(self):
+        response = self.client.get(self.thermostat_url, {'depth': '0', 'expand': 'room'})
+
+        self.assertEqual(response.data['room']['name'], 'fancy room name')
+        self.assertEqual(response.data['room']['residence'], 'http://testserver/residence/3/')
+
+    def test_depth_of_lists(self):
+        response = self.client.get('/device/raspberry/3/', {'depth': '0'})
+
+        self.assertEqual(response.data['residence'], 'http://testserver/residence/3/')
+        self.assertEqual(response.data['thermostat_devices'], ['http://testserver/device/thermostat/5/'])
+
+    def test_invalid_depth(self):
+        response = self.client.get(self.thermostat_url, {'depth': 'deep'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(self.thermostat_url, {'depth': '-1'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_fields_prune_queries(self):
+        # Change markers and devices
+        with self.assertNumQueries(2):
+            self.client.get('/device/thermostat/', {'fields': 'rfid,mac'})
+        # The thermostat of the device, but neither its room nor its residence
+        with self.assertNumQueries(3):
+            self.client.get('/device/thermostat/', {'fields': 'rfid,thermostat.name'})
+
+    def test_time_series_rows(self):
+        date = datetime.datetime(2015, 5, 13, 7, 0, 0, 0, timezone.utc)
+        models.Temperature.objects.create(thermostat=self.thermostat, datetime=date, value=20.0)
+        url = self.thermostat_url + 'temperature/'
+
+        response = self.client.get(url, {'fields': 'value'})
+        self.assertEqual(response.data['results'], [{'value': 20.0}])
+        response = self.client.get(url, {'fields': 'value,thermostat', 'depth': '0'})
+        self.assertEqual(response.data['results'], [{'value': 20.0, 'thermostat': 'http://testserver' +
+                                                     self.thermostat_url}])
+
+    def test_writes_include_all_fields(self):
+        response = self.client.put(self.thermostat_url + '?fields=rfid', {'rfid': '5', 'name': 'door'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['name'], 'door')
+        self.assertIn('room', response.data)
+
+    def test_entity_tag_depends_on_fields(self):
+        self.assertNotEqual(self.client.get(self.thermostat_url, {'fields': 'rfid'})['ETag'],
+                            self.client.get(self.thermostat_url, {'fields': 'name'})['ETag'])
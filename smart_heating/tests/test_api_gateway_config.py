@@ -0,0 +1,172 @@
+"""
+Copyright 2016 Michael Spiegel, Wilhelm Kleiminger
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import datetime
+import threading
+import time
+from unittest import mock
+
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from smart_heating import gateway_config, models
+
+
+class GatewayConfigTestCase(APITestCase):
+    def setUp(self):
+        self.residence = models.Residence.objects.create(rfid='3')
+        models.RaspberryDevice.objects.create(rfid='3', mac='b8:27:eb:00:00:01')
+        self.room = models.Room.objects.create(residence=self.residence, name='room')
+        for rfid in ('5', '6'):
+            thermostat = models.Thermostat.objects.create(room=self.room, rfid=rfid, name='thermostat ' + rfid)
+            models.HeatingTableEntry.objects.create(thermostat=thermostat, day=models.HeatingTableEntry.MONDAY,
+                                                    time=datetime.time(6, 0), temperature=21.0)
+        models.ThermostatDevice.objects.create(rfid='5', mac='00:00:00:00:00:05')
+        self.other_residence = models.Residence.objects.create(rfid='4')
+        self.url = '/device/raspberry/3/config/'
+
+    def get_version(self):
+        return gateway_config.get_version(self.residence.pk)
+
+    def test_config(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['version'], self.get_version())
+        self.assertEqual(response.data['rfid'], '3')
+        thermostats = response.data['rooms'][0]['thermostats']
+        self.assertEqual([thermostat['rfid'] for thermostat in thermostats], ['5', '6'])
+        self.assertEqual(thermostats[0]['device'], {'rfid': '5', 'mac': '00:00:00:00:00:05'})
+        self.assertIsNone(thermostats[1]['device'])
+        self.assertEqual(thermostats[0]['heating_table'][0]['temperature'], 21.0)
+
+    def test_config_with_constant_queries(self):
+        room = models.Room.objects.create(residence=self.residence, name='other room')
+        models.Thermostat.objects.create(room=room, rfid='7', name='thermostat 7')
+        # Device, version, residence, rooms, thermostats, heating table entries and thermostat devices
+        with self.assertNumQueries(7):
+            self.client.get(self.url)
+
+    def test_config_of_device_without_residence(self):
+        models.RaspberryDevice.objects.create(rfid='9', mac='b8:27:eb:00:00:09')
+        response = self.client.get('/device/raspberry/9/config/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_version_increases_on_writes(self):
+        version = self.get_version()
+        thermostat = models.Thermostat.objects.get(pk='6')
+        entry = models.HeatingTableEntry.objects.get(thermostat=thermostat)
+        entry.temperature = 22.0
+        entry.save()
+        self.assertGreater(self.get_version(), version)
+
+        version = self.get_version()
+        models.ThermostatDevice.objects.create(rfid='6', mac='00:00:00:00:00:06')
+        self.assertGreater(self.get_version(), version)
+
+        version = self.get_version()
+        models.Thermostat.objects.filter(pk='6').get().delete()
+        self.assertGreater(self.get_version(), version)
+
+    def test_version_of_both_residences_increases_on_move(self):
+        room = models.Room.objects.create(residence=self.other_residence, name='other room')
+        version = self.get_version()
+        other_version = gateway_config.get_version(self.other_residence.pk)
+        thermostat = models.Thermostat.objects.get(pk='6')
+        thermostat.room = room
+        thermostat.save()
+        self.assertGreater(self.get_version(), version)
+        self.assertGreater(gateway_config.get_version(self.other_residence.pk), other_version)
+
+    def test_version_of_other_residence_is_unchanged(self):
+        version = self.get_version()
+        models.Room.objects.create(residence=self.other_residence, name='other room')
+        self.assertEqual(self.get_version(), version)
+
+    def test_not_modified(self):
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        models.Room.objects.create(residence=self.residence, name='other room')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['rooms']), 2)
+
+    def test_long_poll(self):
+        version = self.get_version()
+        response = self.client.get(self.url, {'since_version': version - 1, 'wait': 60})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['version'], version)
+
+        response = self.client.get(self.url, {'since_version': version, 'wait': 0})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_long_poll_with_invalid_params(self):
+        for params in ({'since_version': 'a'}, {'since_version': 1, 'wait': -1}):
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(GATEWAY_CONFIG_POLL_INTERVAL=0.01)
+    def test_wait_for_version_times_out(self):
+        version = self.get_version()
+        start = time.monotonic()
+        self.assertEqual(gateway_config.wait_for_version(self.residence.pk, version, 0.05), version)
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+
+    def test_wait_for_version_is_notified(self):
+        version = self.get_version()
+        versions = [{self.residence.pk: version}, {self.residence.pk: version + 1}]
+
+        # The version changes before the notification, without a write of the other thread
+        with mock.patch.object(gateway_config, 'get_versions', side_effect=versions):
+            timer = threading.Timer(0.05, gateway_config.poller.notify)
+            timer.start()
+            start = time.monotonic()
+            self.assertEqual(gateway_config.wait_for_version(self.residence.pk, version, 60), version + 1)
+            self.assertLess(time.monotonic() - start, 1)
+            timer.join()
+
+    def test_long_polls_share_a_query(self):
+        polled = []
+        first_poll = threading.Event()
+
+        def get_versions(residence_pks):
+            polled.append(set(residence_pks))
+            first_poll.set()
+            return dict.fromkeys(residence_pks, len(polled) - 1)
+
+        with mock.patch.object(gateway_config, 'get_versions', side_effect=get_versions):
+            versions = []
+            thread = threading.Thread(
+                target=lambda: versions.append(gateway_config.wait_for_version(self.other_residence.pk, 0, 60)))
+            thread.start()
+            first_poll.wait()
+            # Reads the versions of both residences and wakes up the other thread
+            self.assertEqual(gateway_config.wait_for_version(self.residence.pk, 0, 60), 1)
+            thread.join()
+        self.assertEqual(versions, [1])
+        self.assertEqual(polled, [{self.other_residence.pk}, {self.residence.pk, self.other_residence.pk}])
+
+    def test_previous_residences_are_only_read_for_movable_objects(self):
+        device = models.ThermostatDevice.objects.get(rfid='5')
+        with CaptureQueriesContext(connection) as queries:
+            device.save()
+        self.assertFalse([query['sql'] for query in queries.captured_queries
+                          if query['sql'].startswith('SELECT') and '"smart_heating_thermostatdevice"' in query['sql']])
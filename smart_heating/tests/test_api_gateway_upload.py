@@ -0,0 +1,98 @@
+"""
+Copyright 2016 Michael Spiegel, Wilhelm Kleiminger
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import datetime
+from unittest import mock
+
+from rest_framework import status
+from rest_framework.test import APITestCase
+from django.utils import timezone
+
+from smart_heating import ingest, models
+
+
+class ViewGatewayUploadTestCase(APITestCase):
+    def setUp(self):
+        self.residence = models.Residence.objects.create(rfid='3')
+        self.room = models.Room.objects.create(residence=self.residence, name='fancy room name')
+        self.thermostat0 = models.Thermostat.objects.create(room=self.room, rfid='5')
+        self.thermostat1 = models.Thermostat.objects.create(room=self.room, rfid='6')
+        self.device = models.RaspberryDevice.objects.create(rfid='3', mac='b8:27:eb:00:00:01')
+        self.date = datetime.datetime(2015, 5, 13, 7, 0, 0, 0, timezone.get_current_timezone())
+
+    def test_upload_temperatures_and_meta_entries_of_all_thermostats(self):
+        data = {
+            'temperatures': [{'thermostat': '5', 'datetime': self.date.isoformat(), 'value': 21.5},
+                             {'thermostat': '6', 'datetime': (self.date + datetime.timedelta(seconds=1)).isoformat(),
+                              'value': 19.5}],
+            'meta_entries': [{'thermostat': '5', 'datetime': self.date.isoformat(), 'rssi': -30, 'battery': 3300},
+                             {'thermostat': '6', 'datetime': self.date.isoformat(), 'uptime': 50}],
+        }
+        response = self.client.post('/device/raspberry/3/upload/', data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        self.assertEqual(len(response.data.get('temperatures')), 2)
+        self.assertEqual(len(response.data.get('meta_entries')), 2)
+        self.assertEqual(self.thermostat0.temperatures.get().value, 21.5)
+        self.assertEqual(self.thermostat1.temperatures.get().value, 19.5)
+        self.assertEqual(self.thermostat0.meta_entries.get().battery, 3300)
+        self.assertEqual(self.thermostat1.meta_entries.get().uptime, 50)
+
+    def test_upload_by_mac(self):
+        data = {'temperatures': [{'thermostat': '5', 'datetime': self.date.isoformat(), 'value': 21.5}]}
+        response = self.client.post('/device/raspberry/upload/?mac=b8:27:eb:00:00:01', data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        self.assertEqual(response.data.get('meta_entries'), [])
+        self.assertEqual(models.Temperature.objects.count(), 1)
+
+    def test_upload_rejects_thermostat_of_other_residence(self):
+        other_residence = models.Residence.objects.create(rfid='4')
+        other_room = models.Room.objects.create(residence=other_residence, name='other room')
+        models.Thermostat.objects.create(room=other_room, rfid='7')
+        data = {'meta_entries': [{'thermostat': '7', 'datetime': self.date.isoformat(), 'rssi': -30},
+                                 {'thermostat': '5', 'datetime': self.date.isoformat(), 'rssi': -30}]}
+        response = self.client.post('/device/raspberry/3/upload/', data, format='json')
+
+        self.assertEqual(response.status_code, 207, response.data)
+        self.assertEqual([result.get('status') for result in response.data.get('meta_entries')], [400, 201])
+        self.assertIn('thermostat', response.data.get('meta_entries')[0].get('errors'))
+        self.assertEqual(models.ThermostatMetaEntry.objects.count(), 1)
+
+    def test_retried_upload_reports_duplicates_stored_concurrently(self):
+        models.Temperature.objects.create(thermostat=self.thermostat0, datetime=self.date, value=21.5)
+        models.ThermostatMetaEntry.objects.create(thermostat=self.thermostat1, datetime=self.date, uptime=50)
+        data = {
+            'temperatures': [{'thermostat': '5', 'datetime': self.date.isoformat(), 'value': 21.5},
+                             {'thermostat': '6', 'datetime': self.date.isoformat(), 'value': 19.5}],
+            'meta_entries': [{'thermostat': '5', 'datetime': self.date.isoformat(), 'rssi': -30},
+                             {'thermostat': '6', 'datetime': self.date.isoformat(), 'uptime': 50}],
+        }
+        # The duplicates are stored after the uniqueness check by the first attempt of the upload
+        with mock.patch.object(ingest, 'get_existing_keys', side_effect=lambda model, items: set()):
+            response = self.client.post('/device/raspberry/3/upload/', data, format='json')
+
+        self.assertEqual(response.status_code, 207, response.data)
+        self.assertEqual([result.get('status') for result in response.data.get('temperatures')], [400, 201])
+        self.assertEqual([result.get('status') for result in response.data.get('meta_entries')], [201, 400])
+        self.assertEqual(models.Temperature.objects.count(), 2)
+        self.assertEqual(models.ThermostatMetaEntry.objects.count(), 2)
+
+    def test_upload_of_device_without_residence_404(self):
+        models.RaspberryDevice.objects.create(rfid='9', mac='b8:27:eb:00:00:09')
+        response = self.client.post('/device/raspberry/9/upload/', {'temperatures': []}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
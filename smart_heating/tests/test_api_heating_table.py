@@ -0,0 +1,133 @@
+"""
+Copyright 2016 Michael Spiegel, Wilhelm Kleiminger
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import datetime
+
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from smart_heating import gateway_config, models, schedule
+
+
+class BulkHeatingTableTestCase(APITestCase):
+    def setUp(self):
+        self.residence = models.Residence.objects.create(rfid='3')
+        room = models.Room.objects.create(residence=self.residence, name='room')
+        self.thermostats = [models.Thermostat.objects.create(room=room, rfid=rfid, name='thermostat ' + rfid)
+                            for rfid in ('5', '6', '7')]
+        for hour, temperature in [(6, 21.0), (22, 17.0)]:
+            models.HeatingTableEntry.objects.create(thermostat=self.thermostats[0],
+                                                    day=models.HeatingTableEntry.MONDAY,
+                                                    time=datetime.time(hour), temperature=temperature)
+        self.url = '/residence/3/room/%d/thermostat/5/heating_table/' % room.pk
+
+    def get_table(self, thermostat_pk='5'):
+        return [(entry.day, entry.time.hour, entry.temperature)
+                for entry in models.HeatingTableEntry.objects.filter(thermostat_id=thermostat_pk)]
+
+    def test_replace(self):
+        data = [{'day': 0, 'time': '06:00', 'temperature': 20.0},
+                {'day': '1', 'time': '07:00:00', 'temperature': 21.0}]
+        response = self.client.put(self.url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 2)
+        self.assertEqual(self.get_table(), [('0', 6, 20.0), ('1', 7, 21.0)])
+
+    def test_replace_with_constant_queries(self):
+        data = [{'day': day, 'time': '%02d:00' % hour, 'temperature': 20.0} for day in range(7) for hour in (6, 22)]
+        # Hierarchy, lock, stored entries, update, insert, change markers, result and four savepoint queries
+        with self.assertNumQueries(11):
+            response = self.client.put(self.url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(self.get_table()), 14)
+
+    def test_replace_with_invalid_items(self):
+        data = [{'day': 0, 'time': '06:00', 'temperature': 20.0},
+                {'day': 7, 'time': '06:00', 'temperature': 20.0},
+                {'day': 0, 'time': '06:00:00', 'temperature': 21.0},
+                {'day': 1, 'time': '06:00', 'temperature': 40.0}]
+        response = self.client.put(self.url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('day', response.data[1])
+        self.assertIn('non_field_errors', response.data[2])
+        self.assertIn('temperature', response.data[3])
+        # Nothing is applied
+        self.assertEqual(self.get_table(), [('0', 6, 21.0), ('0', 22, 17.0)])
+
+    def test_replace_without_list(self):
+        response = self.client.put(self.url, {'day': 0}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_partial_replace(self):
+        data = [{'day': 0, 'time': '06:00', 'temperature': 19.0},
+                {'day': 0, 'time': '22:00', 'temperature': None},
+                {'day': 4, 'time': '08:00', 'temperature': 20.0}]
+        response = self.client.patch(self.url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.get_table(), [('0', 6, 19.0), ('4', 8, 20.0)])
+
+    def test_null_temperature_is_invalid_on_replace(self):
+        response = self.client.put(self.url, [{'day': 0, 'time': '06:00', 'temperature': None}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_unchanged_table_keeps_the_versions(self):
+        version = gateway_config.get_version('3')
+        data = [{'day': 0, 'time': '06:00', 'temperature': 21.0}, {'day': 0, 'time': '22:00', 'temperature': 17.0}]
+        self.client.put(self.url, data, format='json')
+        self.assertEqual(gateway_config.get_version('3'), version)
+
+    def test_replace_invalidates_derived_data(self):
+        compiled_schedule = schedule.get_schedules(['5'])['5']
+        version = gateway_config.get_version('3')
+        etag = self.client.get(self.url)['ETag']
+
+        self.client.patch(self.url, [{'day': 0, 'time': '06:00', 'temperature': 19.0}], format='json')
+
+        self.assertIsNot(schedule.get_schedules(['5'])['5'], compiled_schedule)
+        self.assertGreater(gateway_config.get_version('3'), version)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]['temperature'], 19.0)
+
+    def test_copy(self):
+        models.HeatingTableEntry.objects.create(thermostat=self.thermostats[1], day=models.HeatingTableEntry.SUNDAY,
+                                                time=datetime.time(12), temperature=25.0)
+        response = self.client.post(self.url + 'copy/', {'thermostats': ['6']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.get_table('6'), self.get_table('5'))
+        self.assertEqual(self.get_table('7'), [])
+
+    def test_copy_to_residence(self):
+        response = self.client.post(self.url + 'copy/', {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'thermostats': ['5', '6', '7']})
+        self.assertEqual(self.get_table('7'), self.get_table('5'))
+
+    def test_copy_to_other_residence(self):
+        other_residence = models.Residence.objects.create(rfid='4')
+        room = models.Room.objects.create(residence=other_residence, name='room')
+        models.Thermostat.objects.create(room=room, rfid='8', name='thermostat 8')
+        response = self.client.post(self.url + 'copy/', {'thermostats': ['6', '8']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.get_table('6'), [])
+
+    def test_copy_with_invalid_thermostats(self):
+        for data in ([], {'thermostats': '6'}, {'thermostats': [{'a': 1}]}, {'thermostats': [['6']]}):
+            response = self.client.post(self.url + 'copy/', data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('thermostats', response.data)
+        self.assertEqual(self.get_table('6'), [])
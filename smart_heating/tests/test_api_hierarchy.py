@@ -0,0 +1,75 @@
+"""
+Copyright 2016 Michael Spiegel, Wilhelm Kleiminger
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import datetime
+
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from smart_heating import models
+
+
+class HierarchyTestCase(APITestCase):
+    def setUp(self):
+        self.residence = models.Residence.objects.create(rfid='3')
+        self.room = models.Room.objects.create(residence=self.residence, name='fancy room name')
+        self.thermostat = models.Thermostat.objects.create(room=self.room, rfid='5', name='window')
+        self.other_residence = models.Residence.objects.create(rfid='4')
+        self.other_room = models.Room.objects.create(residence=self.other_residence, name='other room')
+        self.date = datetime.datetime(2015, 5, 13, 7, 0, 0, 0, timezone.utc)
+
+    def add_temperatures(self, start, count):
+        models.Temperature.objects.bulk_create([
+            models.Temperature(thermostat=self.thermostat, datetime=self.date + datetime.timedelta(minutes=minute),
+                               value=20.0) for minute in range(start, start + count)])
+
+    def test_temperatures_with_constant_queries(self):
+        self.add_temperatures(0, 2)
+        # Change markers, hierarchy, count and page
+        with self.assertNumQueries(4):
+            response = self.client.get('/residence/3/room/1/thermostat/5/temperature/')
+        self.add_temperatures(2, 10)
+        with self.assertNumQueries(4):
+            response = self.client.get('/residence/3/room/1/thermostat/5/temperature/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        temperature = response.data['results'][0]
+        self.assertTrue(temperature['url'].startswith('http://testserver/residence/3/room/1/thermostat/5/'))
+        self.assertTrue(temperature['thermostat']['url'].endswith('/residence/3/room/1/thermostat/5/'))
+
+    def test_rooms_with_constant_queries(self):
+        models.Room.objects.create(residence=self.residence, name='second room')
+        with self.assertNumQueries(3):
+            response = self.client.get('/residence/3/room/')
+        self.assertEqual(len(response.data), 2)
+        self.assertEqual(response.data[1]['residence']['rfid'], '3')
+
+    def test_rooms_in_browsable_api(self):
+        # The parents are attached while the list is rendered
+        response = self.client.get('/residence/3/room/', {'format': 'api'})
+        self.assertContains(response, 'http://testserver/residence/3/room/1/')
+
+    def test_thermostat_of_other_residence(self):
+        response = self.client.get('/residence/4/room/1/thermostat/5/temperature/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_thermostat_of_other_room(self):
+        response = self.client.get('/residence/4/room/%d/thermostat/5/heating_table/' % self.other_room.pk)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_room_of_other_residence(self):
+        response = self.client.get('/residence/3/room/%d/thermostat/' % self.other_room.pk)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
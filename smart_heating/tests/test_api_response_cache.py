@@ -0,0 +1,107 @@
+"""
+Copyright 2016 Michael Spiegel, Wilhelm Kleiminger
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import datetime
+import json
+
+from django.core.cache import cache
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from smart_heating import models
+
+
+@override_settings(RESPONSE_CACHE='default')
+class ResponseCacheTestCase(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.residence = models.Residence.objects.create(rfid='3')
+        self.room = models.Room.objects.create(residence=self.residence, name='fancy room name')
+        self.thermostat0 = models.Thermostat.objects.create(room=self.room, rfid='5', name='window')
+        self.thermostat1 = models.Thermostat.objects.create(room=self.room, rfid='6', name='door')
+        self.date = datetime.datetime(2015, 5, 13, 7, 0, 0, 0, timezone.utc)
+
+    def assertCached(self, url, expected_response):
+        # Only the parents in the url and the change markers are queried
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.content, expected_response.content)
+        self.assertEqual(response['Content-Type'], expected_response['Content-Type'])
+
+    def test_room_list_is_cached(self):
+        url = '/residence/3/room/'
+        response = self.client.get(url)
+        self.assertCached(url, response)
+
+        models.Room.objects.create(residence=self.residence, name='other room')
+        response = self.client.get(url)
+        self.assertEqual(len(response.data), 2)
+
+    def test_temperature_invalidates_only_its_thermostat(self):
+        models.Temperature.objects.create(thermostat=self.thermostat0, datetime=self.date, value=20.0)
+        latest_url = '/residence/3/room/1/thermostat/5/temperature/latest/'
+        other_url = '/residence/3/room/1/thermostat/6/temperature/'
+        thermostats_url = '/residence/3/room/1/thermostat/'
+        responses = dict((url, self.client.get(url)) for url in (latest_url, other_url, thermostats_url))
+
+        models.Temperature.objects.create(thermostat=self.thermostat0, datetime=self.date + datetime.timedelta(
+            minutes=1), value=21.0)
+
+        self.assertEqual(self.client.get(latest_url).data['value'], 21.0)
+        self.assertCached(other_url, responses[other_url])
+        self.assertCached(thermostats_url, responses[thermostats_url])
+
+    def test_updated_and_deleted_meta_entry_is_not_cached(self):
+        meta_entry = models.ThermostatMetaEntry.objects.create(thermostat=self.thermostat0, datetime=self.date,
+                                                               rssi=-50)
+        url = '/residence/3/room/1/thermostat/5/meta_entry/%d/' % meta_entry.pk
+        self.assertCached(url, self.client.get(url))
+
+        data = {'datetime': self.date.isoformat(), 'rssi': -60, 'uptime': 10, 'battery': 3000}
+        self.client.put(url, data, format='json')
+        self.assertEqual(json.loads(self.client.get(url).content.decode())['rssi'], -60)
+
+        self.client.delete(url)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_query_string_and_format_are_part_of_the_key(self):
+        for minute in range(2):
+            models.Temperature.objects.create(thermostat=self.thermostat0, value=20.0,
+                                              datetime=self.date + datetime.timedelta(minutes=minute))
+        url = '/residence/3/room/1/thermostat/5/temperature/'
+        self.client.get(url, {'limit': 1})
+        self.assertEqual(len(self.client.get(url, {'limit': 2}).data['results']), 2)
+        self.assertEqual(len(json.loads(self.client.get(url, {'limit': 1}).content.decode())['results']), 1)
+
+        response = self.client.get(url, {'limit': 1}, HTTP_ACCEPT='text/html')
+        self.assertTrue(response['Content-Type'].startswith('text/html'))
+
+    def test_host_and_scheme_are_part_of_the_key(self):
+        url = '/residence/3/room/'
+        self.client.get(url)
+        for scheme in ('http', 'https'):
+            response = self.client.get(url, HTTP_HOST='example.com', **{'wsgi.url_scheme': scheme})
+            self.assertTrue(json.loads(response.content.decode())[0]['url'].startswith(scheme + '://example.com/'))
+
+    @override_settings(RESPONSE_CACHE=None)
+    def test_disabled_cache(self):
+        url = '/residence/3/room/'
+        self.client.get(url)
+        with self.assertNumQueries(3):
+            self.client.get(url)
@@ -0,0 +1,102 @@
+"""
+Copyright 2016 Michael Spiegel, Wilhelm Kleiminger
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import datetime
+import json
+import shutil
+import tempfile
+from unittest import mock
+
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APITestCase, APIRequestFactory
+
+from smart_heating import archive, models, serializers
+from smart_heating.pagination import ThermostatMetaEntriesCursorPagination
+
+
+class RowListTestCase(APITestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.settings_override = override_settings(TEMPERATURE_ARCHIVE_DIR=self.directory)
+        self.settings_override.enable()
+        self.residence = models.Residence.objects.create(rfid='3')
+        self.room = models.Room.objects.create(residence=self.residence, name='fancy room name')
+        self.thermostat = models.Thermostat.objects.create(room=self.room, rfid='5', name='window')
+        self.url = '/residence/3/room/1/thermostat/5/'
+        self.dates = [datetime.datetime(2015, 5, 13, 7, minute, 0, 250000, timezone.utc) for minute in range(5)]
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.directory)
+
+    def get_expected(self, serializer_class, queryset, path):
+        request = Request(APIRequestFactory().get(path))
+        data = serializer_class(queryset, many=True, context={'request': request}).data
+        return json.loads(JSONRenderer().render(data).decode())
+
+    def get_results(self, path, params=None):
+        response = self.client.get(path, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return json.loads(response.content.decode())['results']
+
+    def test_temperatures_as_model_serializer(self):
+        for index, date in enumerate(self.dates):
+            models.Temperature.objects.create(thermostat=self.thermostat, datetime=date, value=20 + index / 4)
+        path = self.url + 'temperature/'
+        expected = self.get_expected(serializers.TemperatureSerializer, models.Temperature.objects.all(), path)
+
+        self.assertEqual(self.get_results(path), expected)
+        self.assertEqual(self.get_results(path, {'cursor': ''}), expected)
+
+    def test_archived_temperatures_as_model_serializer(self):
+        for index, date in enumerate(self.dates):
+            models.Temperature.objects.create(thermostat=self.thermostat, datetime=date, value=20 + index / 4)
+        path = self.url + 'temperature/'
+        expected = self.get_expected(serializers.TemperatureSerializer, models.Temperature.objects.all(), path)
+        archive.archive_temperatures(datetime.datetime(2015, 6, 1, tzinfo=timezone.utc))
+
+        # Except for the latest temperature
+        self.assertEqual(models.Temperature.objects.count(), 1)
+        self.assertEqual(self.get_results(path), expected)
+        self.assertEqual(self.get_results(path, {'limit': 2, 'offset': 3}), expected[3:])
+
+    def test_meta_entries_as_model_serializer(self):
+        for index, date in enumerate(self.dates):
+            models.ThermostatMetaEntry.objects.create(thermostat=self.thermostat, datetime=date, rssi=-40 - index,
+                                                      uptime=index * 60 if index else None, battery=3300)
+        path = self.url + 'meta_entry/'
+        expected = self.get_expected(serializers.ThermostatMetaEntrySerializer,
+                                     models.ThermostatMetaEntry.objects.all(), path)
+
+        self.assertEqual(self.get_results(path), expected)
+        self.assertIsNone(expected[0]['uptime'])
+
+    @mock.patch.object(ThermostatMetaEntriesCursorPagination, 'page_size', 2)
+    def test_cursor_pages(self):
+        for index, date in enumerate(self.dates):
+            models.ThermostatMetaEntry.objects.create(thermostat=self.thermostat, datetime=date, rssi=-40)
+        response = self.client.get(self.url + 'meta_entry/', {'cursor': ''})
+        ids = [entry['id'] for entry in response.data['results']]
+        self.assertEqual(len(ids), 2)
+        while response.data['next_url'] is not None:
+            response = self.client.get(response.data['next_url'])
+            ids.extend(entry['id'] for entry in response.data['results'])
+
+        self.assertEqual(ids, list(models.ThermostatMetaEntry.objects.values_list('id', flat=True)))
@@ -0,0 +1,102 @@
+"""
+Copyright 2016 Michael Spiegel, Wilhelm Kleiminger
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import datetime
+
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from smart_heating import models, schedule
+
+
+class SetpointTestCase(APITestCase):
+    def setUp(self):
+        residence = models.Residence.objects.create(rfid='3')
+        room = models.Room.objects.create(residence=residence, name='room')
+        self.thermostat = models.Thermostat.objects.create(room=room, rfid='5', name='window')
+        models.Thermostat.objects.create(room=room, rfid='6', name='door')
+        for day, hour, temperature in [(models.HeatingTableEntry.MONDAY, 6, 21.0),
+                                       (models.HeatingTableEntry.MONDAY, 22, 17.0),
+                                       (models.HeatingTableEntry.TUESDAY, 6, 17.0),
+                                       (models.HeatingTableEntry.FRIDAY, 8, 19.0)]:
+            models.HeatingTableEntry.objects.create(thermostat=self.thermostat, day=day, time=datetime.time(hour),
+                                                    temperature=temperature)
+        self.url = '/residence/3/room/%d/thermostat/5/setpoint/' % room.pk
+
+    def get_compiled_schedule(self):
+        return schedule.get_schedules(['5'])['5']
+
+    def test_next_change(self):
+        # 2015-05-11 is a Monday
+        now = datetime.datetime(2015, 5, 11, 23, 30, 15, 500, timezone.utc)
+        next_change = self.get_compiled_schedule().get_next_change(now)
+        # The entry of Tuesday keeps the setpoint
+        self.assertEqual(next_change[0], datetime.datetime(2015, 5, 15, 8, 0, tzinfo=timezone.utc))
+        self.assertEqual(next_change[1].temperature, 19.0)
+
+    def test_next_change_wraps_around_the_week(self):
+        now = datetime.datetime(2015, 5, 16, 12, 0, tzinfo=timezone.utc)
+        next_change = self.get_compiled_schedule().get_next_change(now)
+        self.assertEqual(next_change[0], datetime.datetime(2015, 5, 18, 6, 0, tzinfo=timezone.utc))
+        self.assertEqual(next_change[1].temperature, 21.0)
+
+    def test_next_change_of_constant_schedule(self):
+        compiled_schedule = schedule.CompiledSchedule([schedule.ScheduleEntry('0', datetime.time(6), 20.0)])
+        self.assertIsNone(compiled_schedule.get_next_change(timezone.now()))
+        self.assertIsNone(schedule.CompiledSchedule([]).get_next_change(timezone.now()))
+
+    def test_schedule_is_cached(self):
+        compiled_schedule = self.get_compiled_schedule()
+        with self.assertNumQueries(1):
+            self.assertIs(self.get_compiled_schedule(), compiled_schedule)
+
+    def test_schedule_is_reloaded_after_writes(self):
+        compiled_schedule = self.get_compiled_schedule()
+        models.HeatingTableEntry.objects.filter(thermostat=self.thermostat, day=models.HeatingTableEntry.FRIDAY) \
+            .get().delete()
+        self.assertIsNot(self.get_compiled_schedule(), compiled_schedule)
+        self.assertEqual(len(self.get_compiled_schedule().entries), 3)
+
+    def test_setpoint(self):
+        response = self.client.get(self.url, {'at': '2015-05-11T07:00:00Z'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['thermostat'], '5')
+        self.assertEqual(response.data['setpoint'], 21.0)
+        self.assertEqual(response.data['next_change'], {'datetime': '2015-05-11T22:00:00Z', 'setpoint': 17.0})
+
+    def test_setpoint_now(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(response.data['setpoint'], (21.0, 17.0, 19.0))
+
+    def test_setpoint_with_invalid_time(self):
+        response = self.client.get(self.url, {'at': 'invalid'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_setpoints_of_residence(self):
+        response = self.client.get('/residence/3/setpoints/', {'at': '2015-05-11T07:00:00Z'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([state['thermostat'] for state in response.data], ['5', '6'])
+        self.assertEqual(response.data[0]['setpoint'], 21.0)
+        self.assertIsNone(response.data[1]['setpoint'])
+        self.assertIsNone(response.data[1]['next_change'])
+
+    def test_setpoints_of_residence_with_constant_queries(self):
+        self.client.get('/residence/3/setpoints/')
+        # Residence, thermostats and the versions of the heating tables
+        with self.assertNumQueries(3):
+            self.client.get('/residence/3/setpoints/')
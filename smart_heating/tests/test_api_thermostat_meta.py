@@ -64,6 +64,33 @@ class ViewThermostatMetaEntryTestCase(APITestCase):
         self.assertEqual(response.data.get('next_url'), None)
         self.assertEqual(response.data.get('results'), expected_results)
 
+    def test_meta_entries_collection_with_cursor(self):
+        date0 = datetime.datetime(2015, 5, 13, 7, 0, 0, 0, timezone.get_current_timezone())
+        models.ThermostatMetaEntry.objects.create(thermostat=self.thermostat, datetime=date0, rssi=-30)
+
+        response = self.client.get('/residence/3/room/1/thermostat/5/meta_entry/?cursor=')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('count', response.data)
+        self.assertEqual(response.data.get('next_url'), None)
+        self.assertEqual(response.data.get('previous_url'), None)
+        self.assertEqual(response.data.get('latest_entry_url'),
+                         'http://testserver/residence/3/room/1/thermostat/5/meta_entry/latest/')
+        self.assertEqual(len(response.data.get('results')), 1)
+
+    def test_meta_entries_collection_in_time_range(self):
+        date0 = datetime.datetime(2015, 5, 13, 7, 0, 0, 0, timezone.get_current_timezone())
+        date1 = datetime.datetime(2015, 5, 13, 8, 0, 0, 0, timezone.get_current_timezone())
+        models.ThermostatMetaEntry.objects.create(thermostat=self.thermostat, datetime=date0, rssi=-30)
+        models.ThermostatMetaEntry.objects.create(thermostat=self.thermostat, datetime=date1, rssi=-40)
+
+        # The plus sign of the UTC offset is not escaped
+        response = self.client.get('/residence/3/room/1/thermostat/5/meta_entry/?from=2015-05-13T07:30:00+00:00')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data.get('count'), 1)
+        self.assertEqual(response.data.get('results')[0].get('rssi'), -40)
+
     def test_meta_representation_contains_rssi_uptime_battery(self):
         date = datetime.datetime(2015, 5, 13, 7, 0, 0, 0, timezone.get_current_timezone())
         meta_entry = models.ThermostatMetaEntry.objects.create(thermostat=self.thermostat, datetime=date,
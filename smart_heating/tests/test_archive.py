@@ -0,0 +1,164 @@
+"""
+Copyright 2016 Michael Spiegel, Wilhelm Kleiminger
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import datetime
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import override_settings
+from django.utils import timezone
+from django.utils.six import StringIO
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from smart_heating import archive, models, rollups
+from smart_heating.pagination import TemperatureCursorPagination
+
+
+class ArchiveTestCase(APITestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.settings_override = override_settings(TEMPERATURE_ARCHIVE_DIR=self.directory)
+        self.settings_override.enable()
+        self.residence = models.Residence.objects.create(rfid='3')
+        self.room = models.Room.objects.create(residence=self.residence, name='fancy room name')
+        self.thermostat = models.Thermostat.objects.create(room=self.room, rfid='5')
+        self.url = '/residence/3/room/1/thermostat/5/temperature/'
+        # Two days at the end of April, two at the start of May and one in June
+        self.dates = [datetime.datetime(2015, month, day, 12, 0, 0, 0, timezone.utc)
+                      for month, day in [(4, 29), (4, 30), (5, 1), (5, 2), (6, 1)]]
+        for index, date in enumerate(self.dates):
+            models.Temperature.objects.create(thermostat=self.thermostat, datetime=date, value=20.25 + index)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.directory)
+
+    def archive_until_june(self):
+        return archive.archive_temperatures(datetime.datetime(2015, 6, 15, tzinfo=timezone.utc))
+
+    def get_values(self, params=None):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [temperature['value'] for temperature in response.data['results']]
+
+    def test_encode_and_decode(self):
+        readings = [(self.dates[0], 20.25), (self.dates[0] + datetime.timedelta(milliseconds=1500), -3.1),
+                    (self.dates[1], 21.0)]
+        self.assertEqual(archive.decode(archive.encode(readings, 100)), readings)
+
+    def test_archive_moves_old_months(self):
+        self.assertEqual(self.archive_until_june(), 4)
+
+        self.assertEqual(list(models.Temperature.objects.values_list('datetime', flat=True)), self.dates[4:])
+        self.assertEqual(archive.get_archived_months('5'), [datetime.datetime(2015, 4, 1, tzinfo=timezone.utc),
+                                                            datetime.datetime(2015, 5, 1, tzinfo=timezone.utc)])
+        self.assertEqual(archive.read_month('5', datetime.datetime(2015, 5, 1, tzinfo=timezone.utc)),
+                         [(self.dates[2], 22.25), (self.dates[3], 23.25)])
+
+    def test_list_reads_across_tiers(self):
+        self.archive_until_june()
+
+        self.assertEqual(self.get_values(), [20.25, 21.25, 22.25, 23.25, 24.25])
+        self.assertEqual(self.get_values({'limit': 2, 'offset': 1}), [21.25, 22.25])
+        self.assertEqual(self.get_values({'limit': 2, 'offset': 3}), [23.25, 24.25])
+        self.assertEqual(self.client.get(self.url).data['count'], 5)
+        self.assertEqual(self.get_values({'from': self.dates[1].isoformat(), 'to': self.dates[3].isoformat()}),
+                         [21.25, 22.25])
+
+    @mock.patch.object(TemperatureCursorPagination, 'page_size', 2)
+    def test_cursor_pagination_reads_across_tiers(self):
+        self.archive_until_june()
+
+        response = self.client.get(self.url, {'cursor': ''})
+        values = [temperature['value'] for temperature in response.data['results']]
+        while response.data['next_url']:
+            response = self.client.get(response.data['next_url'])
+            values.extend(temperature['value'] for temperature in response.data['results'])
+        self.assertEqual(values, [20.25, 21.25, 22.25, 23.25, 24.25])
+
+        # The previous page of the recent temperatures lies in the archive
+        response = self.client.get(response.data['previous_url'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([temperature['datetime'] for temperature in response.data['results']],
+                         ['2015-05-01T12:00:00Z', '2015-05-02T12:00:00Z'])
+
+    def test_archived_temperatures_are_retrieved(self):
+        self.archive_until_june()
+
+        url = self.client.get(self.url).data['results'][0]['url']
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['datetime'], response.data['value']), ('2015-04-29T12:00:00Z', 20.25))
+
+        self.assertEqual(self.client.delete(url).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(self.url + '2015-04-29T13:00:00Z/').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_archive_truncates_datetimes_to_milliseconds(self):
+        date = datetime.datetime(2015, 4, 30, 0, 0, 0, 123456, timezone.utc)
+        models.Temperature.objects.create(thermostat=self.thermostat, datetime=date, value=10.0)
+        self.archive_until_june()
+
+        self.assertEqual(archive.read_month('5', datetime.datetime(2015, 4, 1, tzinfo=timezone.utc))[1],
+                         (date.replace(microsecond=123000), 10.0))
+
+    def test_latest_temperature_is_not_archived(self):
+        self.assertEqual(archive.archive_temperatures(datetime.datetime(2016, 1, 1, tzinfo=timezone.utc)), 4)
+
+        self.assertEqual(list(models.Temperature.objects.values_list('datetime', flat=True)), self.dates[4:])
+        response = self.client.get(self.url + 'latest/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['value'], 24.25)
+        self.assertEqual(self.get_values(), [20.25, 21.25, 22.25, 23.25, 24.25])
+
+    def test_backfilled_temperatures_are_merged(self):
+        self.archive_until_june()
+        backfill = datetime.datetime(2015, 4, 30, 0, 0, 0, 0, timezone.utc)
+        models.Temperature.objects.create(thermostat=self.thermostat, datetime=backfill, value=10.0)
+
+        self.assertEqual(self.get_values(), [20.25, 10.0, 21.25, 22.25, 23.25, 24.25])
+
+        self.assertEqual(self.archive_until_june(), 1)
+        self.assertEqual(self.get_values(), [20.25, 10.0, 21.25, 22.25, 23.25, 24.25])
+
+    def test_downsample_and_export_read_across_tiers(self):
+        self.archive_until_june()
+
+        response = self.client.get(self.url + 'downsample/', {'points': 10})
+        self.assertEqual([point[1] for point in response.data], [20.25, 21.25, 22.25, 23.25, 24.25])
+
+        response = self.client.get('/residence/3/room/1/thermostat/5/export/', {'format': 'csv'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 6)
+        self.assertEqual(lines[1], '5,2015-04-29T12:00:00Z,20.25')
+
+    def test_rebuild_rollups_reads_archive(self):
+        self.archive_until_june()
+        rollups.rebuild()
+
+        day = models.TemperatureRollup.objects.get(bucket=models.TemperatureRollup.DAY,
+                                                   start=self.dates[0].replace(hour=0))
+        self.assertEqual((day.count, day.max), (1, 20.25))
+        self.assertEqual(models.TemperatureRollup.objects.filter(bucket=models.TemperatureRollup.DAY).count(), 5)
+
+    def test_archive_command(self):
+        out = StringIO()
+        call_command('archive_temperatures', '5', before='2015-05-15T00:00:00Z', stdout=out)
+
+        self.assertIn('Archived 2 temperatures.', out.getvalue())
+        self.assertEqual(models.Temperature.objects.count(), 3)
@@ -0,0 +1,109 @@
+"""
+Copyright 2016 Michael Spiegel, Wilhelm Kleiminger
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import datetime
+
+from django.core.management import call_command
+from django.utils import timezone
+from django.utils.six import StringIO
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from smart_heating import battery, models
+
+
+class BatteryForecastTestCase(APITestCase):
+    def setUp(self):
+        self.now = timezone.now().replace(microsecond=0)
+        residence = models.Residence.objects.create(rfid='3')
+        room = models.Room.objects.create(residence=residence, name='room')
+        other_room = models.Room.objects.create(residence=models.Residence.objects.create(rfid='4'), name='room')
+        # Depletes by 10 per day and reaches 2200 in 100 days
+        self.add_levels(models.Thermostat.objects.create(room=room, rfid='5'), lambda day: 3200 - 10 * day)
+        # Depletes by 20 per day and reaches 2200 in 20 days
+        self.add_levels(models.Thermostat.objects.create(room=other_room, rfid='6'), lambda day: 2600 - 20 * day)
+        # Constant level
+        self.add_levels(models.Thermostat.objects.create(room=room, rfid='7'), lambda day: 3000)
+        # Too few levels
+        self.add_levels(models.Thermostat.objects.create(room=room, rfid='8'), lambda day: 3000, days=2)
+
+    def add_levels(self, thermostat, level, days=10):
+        models.ThermostatMetaEntry.objects.bulk_create([
+            models.ThermostatMetaEntry(thermostat=thermostat, datetime=self.now + datetime.timedelta(days=day),
+                                       battery=level(day))
+            for day in range(-days + 1, 1)])
+
+    def get_forecasts(self):
+        return dict((forecast.thermostat_id, forecast) for forecast in battery.forecast(now=self.now))
+
+    def test_forecast(self):
+        forecasts = self.get_forecasts()
+        self.assertEqual(set(forecasts), {'5', '6', '7'})
+
+        self.assertEqual(forecasts['5'].count, 10)
+        self.assertEqual(forecasts['5'].battery, 3200)
+        self.assertAlmostEqual(forecasts['5'].slope, -10.0)
+        self.assertAlmostEqual(forecasts['5'].confidence, 1.0)
+        self.assertAlmostEqual((forecasts['5'].empty_date - self.now).total_seconds(), 100 * 24 * 60 * 60, delta=1)
+        self.assertAlmostEqual((forecasts['6'].empty_date - self.now).total_seconds(), 20 * 24 * 60 * 60, delta=1)
+
+    def test_forecast_of_constant_level(self):
+        forecast = self.get_forecasts()['7']
+        self.assertIsNone(forecast.empty_date)
+        self.assertEqual(forecast.slope, 0.0)
+        self.assertEqual(forecast.confidence, 0.0)
+
+    def test_forecast_without_levels(self):
+        models.ThermostatMetaEntry.objects.all().delete()
+        self.assertEqual(battery.forecast(now=self.now), [])
+
+    def test_command(self):
+        out = StringIO()
+        call_command('forecast_batteries', stdout=out)
+
+        self.assertIn('Forecasted the battery depletion of 3 thermostats.', out.getvalue())
+        self.assertEqual(models.BatteryForecast.objects.count(), 3)
+
+        call_command('forecast_batteries', '5', stdout=out)
+        self.assertEqual(models.BatteryForecast.objects.count(), 3)
+
+    def test_api(self):
+        battery.update(now=self.now)
+
+        response = self.client.get('/battery_forecast/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual([forecast['thermostat'] for forecast in response.data['results']], ['6', '5', '7'])
+
+        response = self.client.get('/battery_forecast/', {'to': (self.now + datetime.timedelta(days=30)).isoformat()})
+        self.assertEqual([forecast['thermostat'] for forecast in response.data['results']], ['6'])
+
+        response = self.client.get('/battery_forecast/', {'residence': '3'})
+        self.assertEqual(set(forecast['thermostat'] for forecast in response.data['results']), {'5', '7'})
+
+        response = self.client.get('/battery_forecast/5/')
+        self.assertTrue(response.data['thermostat_url'].endswith('/residence/3/room/1/thermostat/5/'))
+
+    def test_api_orders_forecasts_without_empty_date_last(self):
+        battery.update(now=self.now)
+        models.BatteryForecast.objects.create(thermostat_id='8', computed=self.now, count=2, battery=3000, slope=0.0,
+                                              confidence=0.0)
+        models.BatteryForecast.objects.filter(thermostat='6').update(empty_date=None)
+
+        response = self.client.get('/battery_forecast/')
+        self.assertEqual([(forecast['thermostat'], forecast['empty_date'] is None)
+                          for forecast in response.data['results']],
+                         [('5', False), ('6', True), ('7', True), ('8', True)])
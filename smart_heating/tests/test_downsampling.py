@@ -0,0 +1,122 @@
+"""
+Copyright 2016 Michael Spiegel, Wilhelm Kleiminger
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import datetime
+
+from django.test import SimpleTestCase
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from smart_heating import downsampling, models
+
+
+class LTTBTestCase(SimpleTestCase):
+    def test_short_series_is_not_changed(self):
+        points = [(0, 1), (1, 2), (2, 3)]
+        self.assertEqual(list(downsampling.lttb(points, 3, 10)), points)
+
+    def test_keeps_first_and_last_point(self):
+        points = [(x, x % 7) for x in range(100)]
+        result = list(downsampling.lttb(points, 100, 10))
+
+        self.assertEqual(len(result), 10)
+        self.assertEqual(result[0], (0, 0))
+        self.assertEqual(result[-1], (99, 99 % 7))
+        self.assertEqual(result, sorted(result))
+
+    def test_two_points_are_first_and_last_point(self):
+        points = [(x, x % 7) for x in range(1000)]
+        self.assertEqual(list(downsampling.lttb(points, 1000, 2)), [(0, 0), (999, 999 % 7)])
+
+    def test_selects_peak(self):
+        points = [(x, 0) for x in range(50)] + [(50, 100)] + [(x, 0) for x in range(51, 101)]
+        result = list(downsampling.lttb(points, 101, 5))
+
+        self.assertIn((50, 100), result)
+
+    def test_fewer_points_than_counted(self):
+        points = [(x, x % 7) for x in range(50)]
+        result = list(downsampling.lttb(points, 100, 10))
+
+        self.assertLessEqual(len(result), 10)
+        self.assertEqual(result[0], (0, 0))
+        self.assertEqual(result[-1], (49, 49 % 7))
+        self.assertEqual(result, sorted(result))
+
+    def test_fewer_points_than_counted_before_last_point(self):
+        points = [(x, x % 7) for x in range(99)]
+        result = list(downsampling.lttb(points, 100, 10))
+
+        self.assertEqual(result[0], (0, 0))
+        self.assertEqual(result[-1], (98, 98 % 7))
+
+    def test_no_points_although_counted(self):
+        self.assertEqual(list(downsampling.lttb([], 100, 10)), [])
+        self.assertEqual(list(downsampling.lttb([], 100, 2)), [])
+        self.assertEqual(list(downsampling.lttb([(0, 1)], 100, 2)), [(0, 1)])
+
+
+class MinMaxTestCase(SimpleTestCase):
+    def test_yields_minimum_and_maximum_of_each_bucket_in_order(self):
+        points = [(0, 5), (1, 9), (2, 1), (3, 4), (4, 3), (5, 8), (6, 2), (7, 6)]
+        result = list(downsampling.min_max(points, 8, 4))
+
+        self.assertEqual(result, [(1, 9), (2, 1), (5, 8), (6, 2)])
+
+    def test_constant_bucket_yields_single_point(self):
+        points = [(x, 1) for x in range(10)]
+        result = list(downsampling.min_max(points, 10, 4))
+
+        self.assertEqual(result, [(0, 1), (5, 1)])
+
+
+class ViewDownsampleTestCase(APITestCase):
+    def setUp(self):
+        self.residence = models.Residence.objects.create(rfid='3')
+        self.room = models.Room.objects.create(residence=self.residence, name='fancy room name')
+        self.thermostat = models.Thermostat.objects.create(room=self.room, rfid='5')
+        self.date = datetime.datetime(2015, 5, 13, 7, 0, 0, 0, timezone.utc)
+        models.Temperature.objects.bulk_create([
+            models.Temperature(thermostat=self.thermostat, datetime=self.date + datetime.timedelta(minutes=i),
+                               value=20 + i % 5)
+            for i in range(500)])
+
+    def test_downsample_temperatures(self):
+        response = self.client.get('/residence/3/room/1/thermostat/5/temperature/downsample/',
+                                   {'points': 50, 'mode': 'minmax'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 50)
+        self.assertEqual(response.data[0], [int(self.date.timestamp() * 1000), 20])
+
+    def test_downsample_to_two_points(self):
+        response = self.client.get('/residence/3/room/1/thermostat/5/temperature/downsample/', {'points': 2})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 2)
+        self.assertEqual(response.data[-1][0], int((self.date + datetime.timedelta(minutes=499)).timestamp() * 1000))
+
+    def test_downsample_with_invalid_points(self):
+        response = self.client.get('/residence/3/room/1/thermostat/5/temperature/downsample/', {'points': 'many'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_chart_is_downsampled(self):
+        response = self.client.get('/residence/3/room/1/thermostat/5/temperature/chart/', {'points': 20})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.context['temperatures']), 20)
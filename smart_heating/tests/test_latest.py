@@ -0,0 +1,104 @@
+"""
+Copyright 2016 Michael Spiegel, Wilhelm Kleiminger
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import datetime
+
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from smart_heating import models
+
+
+class LatestReadingTestCase(APITestCase):
+    def setUp(self):
+        self.residence = models.Residence.objects.create(rfid='3')
+        self.room = models.Room.objects.create(residence=self.residence, name='fancy room name')
+        self.thermostat = models.Thermostat.objects.create(room=self.room, rfid='5')
+        self.date = datetime.datetime(2015, 5, 13, 7, 0, 0, 0, timezone.utc)
+        self.url = '/residence/3/room/1/thermostat/5/temperature/'
+
+    def get_date(self, minutes):
+        return self.date + datetime.timedelta(minutes=minutes)
+
+    def get_latest_value(self):
+        response = self.client.get(self.url + 'latest/')
+        if response.status_code == status.HTTP_404_NOT_FOUND:
+            return None
+        return response.data['value']
+
+    def test_bulk_upload_updates_latest_temperature(self):
+        data = [{'datetime': self.get_date(minute).isoformat(), 'value': value}
+                for minute, value in [(10, 21.0), (20, 22.0), (5, 20.0)]]
+        self.client.post(self.url + 'bulk/', data, format='json')
+        self.assertEqual(self.get_latest_value(), 22.0)
+
+    def test_backfilled_temperatures_keep_latest_temperature(self):
+        models.Temperature.objects.create(thermostat=self.thermostat, datetime=self.get_date(20), value=22.0)
+        self.client.post(self.url + 'bulk/', [{'datetime': self.get_date(10).isoformat(), 'value': 21.0}],
+                         format='json')
+        models.Temperature.objects.create(thermostat=self.thermostat, datetime=self.get_date(5), value=20.0)
+        self.assertEqual(self.get_latest_value(), 22.0)
+
+    def test_updated_temperature_refreshes_latest_temperature(self):
+        temperature = models.Temperature.objects.create(thermostat=self.thermostat, datetime=self.get_date(20),
+                                                        value=22.0)
+        models.Temperature.objects.create(thermostat=self.thermostat, datetime=self.get_date(10), value=21.0)
+        temperature.datetime = self.get_date(0)
+        temperature.save()
+        self.assertEqual(self.get_latest_value(), 21.0)
+
+    def test_deleted_temperature_refreshes_latest_temperature(self):
+        models.Temperature.objects.create(thermostat=self.thermostat, datetime=self.get_date(10), value=21.0)
+        models.Temperature.objects.create(thermostat=self.thermostat, datetime=self.get_date(20), value=22.0)
+
+        self.client.delete('%s%s/' % (self.url, self.get_date(20).isoformat()))
+        self.assertEqual(self.get_latest_value(), 21.0)
+
+        # Deleted without the API
+        models.Temperature.objects.all().delete()
+        self.assertIsNone(self.get_latest_value())
+
+    def test_deletes_keep_fast_path(self):
+        for minute in range(3):
+            models.Temperature.objects.create(thermostat=self.thermostat, datetime=self.get_date(minute), value=20.0)
+        # A single delete query without loading the temperatures or updating the cache
+        with self.assertNumQueries(1):
+            models.Temperature.objects.filter(datetime__gte=self.get_date(1)).delete()
+        self.assertEqual(self.get_latest_value(), 20.0)
+        self.assertEqual(models.LatestReading.objects.get().temperature_datetime, self.get_date(0))
+
+    def test_latest_temperature_with_constant_queries(self):
+        for minute in range(3):
+            models.Temperature.objects.create(thermostat=self.thermostat, datetime=self.get_date(minute), value=20.0)
+        with self.assertNumQueries(3):
+            self.client.get(self.url + 'latest/')
+        models.Temperature.objects.create(thermostat=self.thermostat, datetime=self.get_date(3), value=20.0)
+        with self.assertNumQueries(3):
+            self.client.get(self.url + 'latest/')
+
+    def test_gateway_upload_updates_latest_meta_entry(self):
+        models.RaspberryDevice.objects.create(rfid='3', mac='b8:27:eb:00:00:01')
+        data = {
+            'meta_entries': [
+                {'thermostat': '5', 'datetime': self.get_date(10).isoformat(), 'rssi': -40},
+                {'thermostat': '5', 'datetime': self.get_date(0).isoformat(), 'rssi': -60},
+            ],
+        }
+        self.client.post('/device/raspberry/3/upload/', data, format='json')
+        response = self.client.get('/residence/3/room/1/thermostat/5/meta_entry/latest/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['rssi'], -40)
@@ -14,6 +14,10 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import importlib
+from unittest import mock
+
+from django.apps import apps
 from django.test import TestCase
 
 from smart_heating.models import *
@@ -32,3 +36,70 @@ class ResidenceTestCase(TestCase):
         residence = Residence.objects.create(rfid='3')
         residence = Residence.objects.get(rfid='3')
         self.assertEqual(residence.rfid, '3')
+
+
+class DeviceRelationsTestCase(TestCase):
+    def setUp(self):
+        for residence_rfid, thermostat_rfids in [('3', ['5', '6']), ('4', ['7'])]:
+            residence = Residence.objects.create(rfid=residence_rfid)
+            RaspberryDevice.objects.create(rfid=residence_rfid, mac='00:00:00:00:00:0%s' % residence_rfid)
+            room = Room.objects.create(residence=residence, name='room')
+            for rfid in thermostat_rfids:
+                Thermostat.objects.create(room=room, rfid=rfid, name='thermostat')
+                ThermostatDevice.objects.create(rfid=rfid, mac='00:00:00:00:00:0%s' % rfid)
+        Residence.objects.create(rfid='8')
+        RaspberryDevice.objects.create(rfid='8', mac='00:00:00:00:00:08')
+        RaspberryDevice.objects.create(rfid='9', mac='00:00:00:00:00:09')
+
+    def test_thermostat_devices(self):
+        """The thermostat devices of a Raspberry Pi are resolved with two queries"""
+        device = RaspberryDevice.objects.get(rfid='3')
+        with self.assertNumQueries(2):
+            self.assertEqual(sorted(thermostat_device.rfid for thermostat_device in device.thermostat_devices),
+                             ['5', '6'])
+        self.assertEqual(RaspberryDevice.objects.get(rfid='8').thermostat_devices, [])
+        self.assertIsNone(RaspberryDevice.objects.get(rfid='9').thermostat_devices)
+
+    def test_resolve_many(self):
+        """The relations of many devices are resolved at once and cached"""
+        devices = list(RaspberryDevice.objects.order_by('rfid'))
+        with self.assertNumQueries(2):
+            RaspberryDevice.thermostat_devices.resolve_many(devices)
+            self.assertEqual([len(device.thermostat_devices) if device.thermostat_devices is not None else None
+                              for device in devices], [2, 1, 0, None])
+
+    def test_prefetch(self):
+        """The relations can be prefetched"""
+        # Devices, residences, thermostats of the residences and thermostat devices
+        with self.assertNumQueries(4):
+            devices = list(RaspberryDevice.objects.order_by('rfid').prefetch_related('residence', 'thermostat_devices'))
+            self.assertEqual([device.residence.rfid if device.residence is not None else None for device in devices],
+                             ['3', '4', '8', None])
+            self.assertEqual(devices[1].thermostat_devices[0].rfid, '7')
+        with self.assertNumQueries(2):
+            devices = list(ThermostatDevice.objects.order_by('rfid').prefetch_related('thermostat'))
+            self.assertEqual([device.thermostat.rfid for device in devices], ['5', '6', '7'])
+
+
+class NormalizeMacMigrationTestCase(TestCase):
+    def test_colliding_mac_addresses_are_kept(self):
+        migration = importlib.import_module('smart_heating.migrations.0017_device_mac')
+        # Bulk creation skips the normalisation of `Device.save`
+        ThermostatDevice.objects.bulk_create([
+            ThermostatDevice(rfid='5', mac='00-00-00-00-00-0A'),
+            ThermostatDevice(rfid='6', mac='00:00:00:00:00:0a'),
+            ThermostatDevice(rfid='7', mac='0000.0000.000B'),
+            ThermostatDevice(rfid='8', mac='00:00:00:00:00:0B'),
+        ])
+
+        with mock.patch.object(migration.logger, 'warning') as warning:
+            migration.normalize_macs(apps, None)
+
+        self.assertEqual(dict(ThermostatDevice.objects.values_list('rfid', 'mac')), {
+            '5': '00-00-00-00-00-0A',
+            '6': '00:00:00:00:00:0a',
+            '7': '00:00:00:00:00:0b',
+            '8': '00:00:00:00:00:0B',
+        })
+        self.assertEqual([call[0][1:3] for call in warning.call_args_list],
+                         [('ThermostatDevice', '5'), ('ThermostatDevice', '8')])
@@ -0,0 +1,86 @@
+"""
+Copyright 2016 Michael Spiegel, Wilhelm Kleiminger
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import datetime
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.test import APITestCase, APIRequestFactory
+
+from smart_heating import models, planner, serializers
+
+
+class PlannerTestCase(APITestCase):
+    def setUp(self):
+        self.residence = models.Residence.objects.create(rfid='3')
+        models.RaspberryDevice.objects.create(rfid='3', mac='00:00:00:00:00:03')
+        self.rooms = [models.Room.objects.create(residence=self.residence, name='room %d' % index)
+                      for index in range(3)]
+        for index, room in enumerate(self.rooms):
+            rfid = str(5 + index)
+            thermostat = models.Thermostat.objects.create(room=room, rfid=rfid, name='thermostat ' + rfid)
+            models.ThermostatDevice.objects.create(rfid=rfid, mac='00:00:00:00:00:0%s' % rfid)
+            models.HeatingTableEntry.objects.create(thermostat=thermostat, day=models.HeatingTableEntry.MONDAY,
+                                                    time=datetime.time(6, 0), temperature=21.0)
+
+    def get_num_queries(self, url, params=None):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(context.captured_queries)
+
+    def test_plan(self):
+        request = Request(APIRequestFactory().get('/'))
+        serializer = serializers.ThermostatSerializer(context={'request': request})
+        queryset = planner.plan_queryset(models.Thermostat.objects.all(), serializer)
+
+        self.assertEqual(queryset.query.select_related, {'room': {'residence': {}}})
+        with self.assertNumQueries(1):
+            data = serializers.ThermostatSerializer(queryset, many=True, context={'request': request}).data
+        self.assertEqual(data[2]['room']['residence']['rfid'], '3')
+
+    def test_plan_of_sparse_fieldset(self):
+        request = Request(APIRequestFactory().get('/', {'fields': 'name'}))
+        serializer = serializers.ThermostatSerializer(context={'request': request})
+        queryset = planner.plan_queryset(models.Thermostat.objects.all(), serializer)
+
+        self.assertFalse(queryset.query.select_related)
+        self.assertEqual(queryset.query.deferred_loading, ({'rfid', 'name'}, False))
+
+    def test_thermostat_devices_with_constant_queries(self):
+        # Change markers, devices and the thermostats joined with their rooms and residences
+        self.assertEqual(self.get_num_queries('/device/thermostat/'), 3)
+
+    def test_raspberry_devices_with_constant_queries(self):
+        models.RaspberryDevice.objects.create(rfid='4', mac='00:00:00:00:00:04')
+        # Change markers, devices, residences, thermostats of the residences, thermostat devices and their thermostats
+        self.assertEqual(self.get_num_queries('/device/raspberry/'), 6)
+
+    def test_thermostat_devices_of_sparse_fieldset(self):
+        # Change markers and devices
+        self.assertEqual(self.get_num_queries('/device/thermostat/', {'fields': 'mac'}), 2)
+
+    def test_rooms_with_constant_queries(self):
+        # Change markers, hierarchy and rooms
+        self.assertEqual(self.get_num_queries('/residence/3/room/'), 3)
+
+    def test_heating_table_with_constant_queries(self):
+        self.assertEqual(self.get_num_queries('/residence/3/room/%d/thermostat/6/heating_table/' % self.rooms[1].pk), 3)
+
+    def test_residences_with_constant_queries(self):
+        self.assertEqual(self.get_num_queries('/residence/'), 2)
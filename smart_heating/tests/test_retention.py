@@ -0,0 +1,146 @@
+"""
+Copyright 2016 Michael Spiegel, Wilhelm Kleiminger
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import datetime
+import shutil
+import tempfile
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.test import override_settings
+from django.utils import timezone
+from django.utils.six import StringIO
+from rest_framework.test import APITestCase
+
+from smart_heating import archive, models, retention, rollups
+
+
+class RetentionTestCase(APITestCase):
+    def setUp(self):
+        self.residence = models.Residence.objects.create(rfid='3')
+        self.room = models.Room.objects.create(residence=self.residence, name='fancy room name')
+        self.thermostat = models.Thermostat.objects.create(room=self.room, rfid='5')
+        self.now = datetime.datetime(2015, 6, 1, 12, 0, 0, 0, timezone.utc)
+        self.policy = [(1, None), (10, 15 * 60), (None, 24 * 60 * 60)]
+
+    def add_temperatures(self, start, minutes, value=20.0):
+        models.Temperature.objects.bulk_create([
+            models.Temperature(thermostat=self.thermostat, datetime=start + datetime.timedelta(minutes=minute),
+                               value=value + minute) for minute in minutes])
+
+    def get_temperatures(self):
+        return list(models.Temperature.objects.order_by('datetime').values_list('datetime', 'value'))
+
+    def test_get_tiers(self):
+        tiers, remove_before = retention.get_tiers([(1, None), (10, 15 * 60), (20, 60 * 60)], self.now)
+        self.assertEqual(remove_before, datetime.datetime(2015, 5, 12, 12, 0, 0, 0, timezone.utc))
+        self.assertEqual(tiers, [
+            (remove_before, datetime.datetime(2015, 5, 22, 12, 0, 0, 0, timezone.utc), 60 * 60),
+            (datetime.datetime(2015, 5, 22, 12, 0, 0, 0, timezone.utc),
+             datetime.datetime(2015, 5, 31, 12, 0, 0, 0, timezone.utc), 15 * 60),
+            (datetime.datetime(2015, 5, 31, 12, 0, 0, 0, timezone.utc), self.now, None),
+        ])
+
+    def test_invalid_policy(self):
+        with self.assertRaises(ImproperlyConfigured):
+            retention.get_tiers([(10, 60), (5, 120)], self.now)
+        with self.assertRaises(ImproperlyConfigured):
+            retention.get_tiers([(10, 60), (20, 90)], self.now)
+
+    def test_compact_temperatures(self):
+        recent = self.now - datetime.timedelta(hours=1)
+        week_ago = datetime.datetime(2015, 5, 25, 8, 0, 0, 0, timezone.utc)
+        month_ago = datetime.datetime(2015, 5, 1, 0, 0, 0, 0, timezone.utc)
+        self.add_temperatures(recent, range(3))
+        self.add_temperatures(week_ago, range(0, 30, 5))
+        self.add_temperatures(month_ago, [0, 60 * 6, 60 * 12])
+
+        result = retention.apply(models.Temperature, self.policy, self.now, chunk_size=2)
+
+        self.assertEqual((result.compacted, result.created, result.removed), (9, 3, 0))
+        self.assertEqual(self.get_temperatures(), [
+            (month_ago, 380.0),
+            (week_ago, 25.0),
+            (week_ago + datetime.timedelta(minutes=15), 40.0),
+            (recent, 20.0),
+            (recent + datetime.timedelta(minutes=1), 21.0),
+            (recent + datetime.timedelta(minutes=2), 22.0),
+        ])
+
+        # Compacted buckets are kept
+        result = retention.apply(models.Temperature, self.policy, self.now, chunk_size=2)
+        self.assertEqual((result.compacted, result.created, result.removed), (0, 0, 0))
+
+    def test_compact_meta_entries_and_remove_old_entries(self):
+        date = datetime.datetime(2015, 5, 30, 8, 0, 0, 0, timezone.utc)
+        for minute in range(4):
+            models.ThermostatMetaEntry.objects.create(thermostat=self.thermostat, rssi=-minute,
+                                                      datetime=date + datetime.timedelta(minutes=minute))
+        models.ThermostatMetaEntry.objects.create(thermostat=self.thermostat, rssi=-100,
+                                                  datetime=datetime.datetime(2015, 1, 1, tzinfo=timezone.utc))
+
+        result = retention.apply(models.ThermostatMetaEntry, [(1, None), (10, 60 * 60)], self.now)
+
+        self.assertEqual((result.compacted, result.created, result.removed), (3, 0, 1))
+        self.assertEqual(list(models.ThermostatMetaEntry.objects.values_list('rssi', flat=True)), [-3])
+
+    def test_compaction_rebuilds_rollups(self):
+        week_ago = datetime.datetime(2015, 5, 25, 8, 0, 0, 0, timezone.utc)
+        self.add_temperatures(week_ago, range(0, 30, 5))
+        rollups.rebuild()
+
+        retention.apply(models.Temperature, self.policy, self.now)
+
+        hour = models.TemperatureRollup.objects.get(bucket=models.TemperatureRollup.HOUR, start=week_ago)
+        self.assertEqual((hour.count, hour.min, hour.max), (2, 25.0, 40.0))
+        day = models.TemperatureRollup.objects.get(bucket=models.TemperatureRollup.DAY, start=week_ago.replace(hour=0))
+        self.assertEqual(day.count, 2)
+
+    def test_archived_months_are_skipped_and_removed(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        april = datetime.datetime(2015, 4, 29, 0, 0, 0, 0, timezone.utc)
+        may = datetime.datetime(2015, 5, 1, 0, 0, 0, 0, timezone.utc)
+        self.add_temperatures(april, [0, 60])
+        self.add_temperatures(may, [0, 60, 60 * 24 * 5, 60 * 24 * 5 + 60])
+        # The latest temperature isn't archived
+        self.add_temperatures(self.now.replace(hour=0), [0])
+        with override_settings(TEMPERATURE_ARCHIVE_DIR=directory):
+            archive.archive_temperatures(datetime.datetime(2015, 5, 15, tzinfo=timezone.utc))
+
+            result = retention.apply(models.Temperature, self.policy, self.now)
+            # The archived month of April keeps its full resolution
+            self.assertEqual((result.compacted, result.created, result.removed), (4, 2, 0))
+            self.assertEqual(len(archive.read_month('5', april.replace(day=1))), 2)
+
+            archive.archive_temperatures(datetime.datetime(2015, 6, 1, tzinfo=timezone.utc))
+            result = retention.apply(models.Temperature, [(1, None), (30, None)], self.now)
+            # Removes the archived temperatures before May 2 12:00
+            self.assertEqual(result.removed, 3)
+            self.assertEqual(archive.get_archived_months('5'), [may])
+            self.assertEqual(archive.read_month('5', may), [(may + datetime.timedelta(days=5), 7250.0)])
+
+    @override_settings(THERMOSTAT_META_ENTRY_RETENTION=[(1, None)])
+    def test_command(self):
+        self.add_temperatures(datetime.datetime(2000, 1, 1, tzinfo=timezone.utc), range(3))
+        models.ThermostatMetaEntry.objects.create(thermostat=self.thermostat,
+                                                  datetime=datetime.datetime(2000, 1, 1, tzinfo=timezone.utc))
+        out = StringIO()
+        call_command('apply_retention', stdout=out)
+
+        self.assertIn('Temperature: compacted 3 entries into 1, removed 0.', out.getvalue())
+        self.assertIn('ThermostatMetaEntry: compacted 0 entries into 0, removed 1.', out.getvalue())
+        self.assertEqual(models.Temperature.objects.get().value, 21.0)
@@ -0,0 +1,103 @@
+"""
+Copyright 2016 Michael Spiegel, Wilhelm Kleiminger
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import datetime
+
+from django.core.management import call_command
+from django.utils import timezone
+from django.utils.six import StringIO
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from smart_heating import models
+
+
+class TemperatureRollupTestCase(APITestCase):
+    def setUp(self):
+        self.residence = models.Residence.objects.create(rfid='3')
+        self.room = models.Room.objects.create(residence=self.residence, name='fancy room name')
+        self.thermostat = models.Thermostat.objects.create(room=self.room, rfid='5')
+        self.date = datetime.datetime(2015, 5, 13, 7, 0, 0, 0, timezone.utc)
+
+    def post_temperatures(self, values_by_minute):
+        data = [{'datetime': (self.date + datetime.timedelta(minutes=minute)).isoformat(), 'value': value}
+                for minute, value in values_by_minute]
+        response = self.client.post('/residence/3/room/1/thermostat/5/temperature/bulk/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+
+    def get_rollup(self, bucket, start):
+        return models.TemperatureRollup.objects.get(thermostat=self.thermostat, bucket=bucket, start=start)
+
+    def test_rollups_are_updated_incrementally(self):
+        self.post_temperatures([(10, 20.0), (70, 22.0)])
+        # Out of order and into an existing bucket
+        self.post_temperatures([(5, 18.0), (20, 21.0)])
+
+        hour = self.get_rollup('hour', self.date)
+        self.assertEqual((hour.count, hour.sum, hour.min, hour.max), (3, 59.0, 18.0, 21.0))
+        self.assertEqual((hour.first, hour.last), (18.0, 21.0))
+        self.assertEqual(self.get_rollup('hour', self.date + datetime.timedelta(hours=1)).count, 1)
+
+        day = self.get_rollup('day', self.date.replace(hour=0))
+        self.assertEqual((day.count, day.min, day.max, day.first, day.last), (4, 18.0, 22.0, 18.0, 22.0))
+
+    def test_single_create_update_and_delete_maintain_rollups(self):
+        url = '/residence/3/room/1/thermostat/5/temperature/'
+        self.client.post(url, {'datetime': self.date.isoformat(), 'value': 20.0})
+        self.client.post(url, {'datetime': (self.date + datetime.timedelta(minutes=1)).isoformat(), 'value': 25.0})
+        self.assertEqual(self.get_rollup('hour', self.date).max, 25.0)
+
+        self.client.put('%s%s/' % (url, self.date.isoformat()), {'datetime': self.date.isoformat(), 'value': 30.0})
+        self.assertEqual(self.get_rollup('hour', self.date).max, 30.0)
+
+        self.client.delete('%s%s/' % (url, self.date.isoformat()))
+        hour = self.get_rollup('hour', self.date)
+        self.assertEqual((hour.count, hour.max), (1, 25.0))
+
+    def test_rebuild_command(self):
+        self.post_temperatures([(10, 20.0), (70, 22.0), (60 * 25, 19.0)])
+        expected = list(models.TemperatureRollup.objects.order_by('bucket', 'start')
+                        .values_list('bucket', 'start', 'count', 'sum', 'min', 'max', 'first', 'last'))
+        models.TemperatureRollup.objects.all().delete()
+
+        out = StringIO()
+        call_command('rebuild_rollups', stdout=out)
+
+        self.assertIn('Wrote 5 rollups.', out.getvalue())
+        self.assertEqual(list(models.TemperatureRollup.objects.order_by('bucket', 'start')
+                              .values_list('bucket', 'start', 'count', 'sum', 'min', 'max', 'first', 'last')),
+                         expected)
+
+    def test_rollup_route(self):
+        self.post_temperatures([(10, 20.0), (70, 22.0), (60 * 25, 19.0)])
+
+        response = self.client.get('/residence/3/room/1/thermostat/5/temperature/rollup/', {'bucket': 'day'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 2)
+        self.assertEqual(response.data[0].get('start'), '2015-05-13T00:00:00Z')
+        self.assertEqual(response.data[0].get('average'), 21.0)
+
+        response = self.client.get('/residence/3/room/1/thermostat/5/temperature/rollup/',
+                                   {'from': (self.date + datetime.timedelta(minutes=30)).isoformat()})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([rollup.get('count') for rollup in response.data], [1, 1, 1])
+
+    def test_rollup_route_with_invalid_bucket(self):
+        response = self.client.get('/residence/3/room/1/thermostat/5/temperature/rollup/', {'bucket': 'week'})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,112 @@
+"""
+Copyright 2016 Michael Spiegel, Wilhelm Kleiminger
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import datetime
+from unittest import mock
+
+from django.conf.urls import url
+from django.core.urlresolvers import NoReverseMatch, RegexURLResolver, set_script_prefix
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.reverse import reverse
+from rest_framework.test import APITestCase, APIRequestFactory
+from rest_framework.request import Request
+
+from smart_heating import models
+from smart_heating.relations import build_url
+
+
+def export(request, series, format):
+    pass
+
+
+# Url patterns with extra keyword arguments, used by `test_extra_keyword_arguments`
+urlpatterns = [
+    url(r'^export/(?P<series>[a-z_]+)/$', export, {'format': 'csv'}, name='export'),
+    url(r'^export/$', export, {'series': 'temperature'}, name='export'),
+]
+
+
+class BuildURLTestCase(APITestCase):
+    def setUp(self):
+        self.residence = models.Residence.objects.create(rfid='3')
+        self.room = models.Room.objects.create(residence=self.residence, name='fancy room name')
+        self.thermostat = models.Thermostat.objects.create(room=self.room, rfid='5', name='window')
+        self.temperature = models.Temperature.objects.create(
+            thermostat=self.thermostat, datetime=datetime.datetime(2015, 5, 13, 7, 0, 0, 123000, timezone.utc),
+            value=20.0)
+        self.request = Request(APIRequestFactory().get('/'))
+
+    def assertSameURL(self, view_name, **kwargs):
+        self.assertEqual(build_url(view_name, request=self.request, **kwargs),
+                         reverse(view_name, request=self.request, **kwargs))
+
+    def test_same_url_as_reverse(self):
+        self.assertSameURL('residence-detail', args=['3'])
+        self.assertSameURL('room-list', args=['3'])
+        self.assertSameURL('room-detail', args=self.room.get_recursive_pks())
+        self.assertSameURL('thermostat-detail', args=self.thermostat.get_recursive_pks())
+        self.assertSameURL('temperature-detail', args=self.temperature.get_recursive_pks())
+        self.assertSameURL('temperature-latest', kwargs={'residence_pk': '3', 'room_pk': '1', 'thermostat_pk': '5'})
+        self.assertSameURL('temperature-list',
+                           kwargs={'residence_pk': '3', 'room_pk': '1', 'thermostat_pk': '5', 'format': 'json'})
+
+    def test_relative_url(self):
+        self.assertEqual(build_url('room-detail', args=['3', '1']), '/residence/3/room/1/')
+
+    def test_quoted_arguments(self):
+        self.assertSameURL('residence-detail', args=['a b'])
+
+    def test_format(self):
+        self.assertEqual(build_url('room-detail', args=['3', '1'], format='json'), '/residence/3/room/1/.json')
+
+    def test_script_prefix(self):
+        set_script_prefix('/api/')
+        try:
+            self.assertEqual(build_url('room-detail', args=['3', '1']), '/api/residence/3/room/1/')
+        finally:
+            set_script_prefix('/')
+
+    def test_arguments_not_matching_the_pattern(self):
+        self.assertRaises(NoReverseMatch, build_url, 'room-detail', args=['3/4', '1'])
+        self.assertRaises(NoReverseMatch, build_url, 'room-detail', args=['3'])
+        self.assertRaises(NoReverseMatch, build_url, 'unknown-detail', args=['3'])
+
+    @override_settings(ROOT_URLCONF='smart_heating.tests.test_urls')
+    def test_extra_keyword_arguments(self):
+        for kwargs in ({}, {'series': 'temperature'}, {'series': 'meta_entry'},
+                       {'series': 'meta_entry', 'format': 'csv'}):
+            self.assertSameURL('export', kwargs=kwargs)
+        self.assertRaises(NoReverseMatch, build_url, 'export', kwargs={'series': 'meta_entry', 'format': 'json'})
+
+    def test_temperatures_without_resolver(self):
+        models.Temperature.objects.bulk_create([
+            models.Temperature(thermostat=self.thermostat, value=20.0,
+                               datetime=datetime.datetime(2015, 5, 14, 7, minute, 0, 0, timezone.utc))
+            for minute in range(60)] + [
+            models.Temperature(thermostat=self.thermostat, value=20.0,
+                               datetime=datetime.datetime(2015, 5, 14, 8, minute, 0, 0, timezone.utc))
+            for minute in range(39)])
+        with mock.patch.object(RegexURLResolver, '_reverse_with_prefix',
+                               side_effect=AssertionError('The url resolver was called.')):
+            # Change markers, hierarchy, count and page
+            with self.assertNumQueries(4):
+                response = self.client.get('/residence/3/room/1/thermostat/5/temperature/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 100)
+        self.assertEqual(response.data['results'][0]['url'], 'http://testserver/residence/3/room/1/thermostat/5/'
+                                                              'temperature/2015-05-13T07:00:00.123000+00:00/')
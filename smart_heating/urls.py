@@ -23,7 +23,17 @@ from rest_framework import routers
 
 from smart_heating import views
 
-router = routers.DefaultRouter()
+
+class Router(routers.DefaultRouter):
+    """
+    Maps PUT and PATCH of a collection to the `replace` and `partial_replace` methods of viewsets defining them.
+    """
+    routes = [routers.DefaultRouter.routes[0]._replace(
+        mapping=dict(routers.DefaultRouter.routes[0].mapping, put='replace', patch='partial_replace'))] + \
+        routers.DefaultRouter.routes[1:]
+
+
+router = Router()
 router.register(r'residence', views.ResidenceViewSet)
 router.register(r'residence/(?P<residence_pk>[^/.]+)/user', views.UserViewSet)
 router.register(r'residence/(?P<residence_pk>[^/.]+)/room', views.RoomViewSet)
@@ -37,6 +47,7 @@ router.register(r'residence/(?P<residence_pk>[^/.]+)/room/(?P<room_pk>[^/.]+)/'
                 r'thermostat/(?P<thermostat_pk>[^/.]+)/heating_table', views.HeatingTableEntryViewSet)
 router.register(r'device/raspberry', views.RaspberryDeviceViewSet)
 router.register(r'device/thermostat', views.ThermostatDeviceViewSet)
+router.register(r'battery_forecast', views.BatteryForecastViewSet)
 
 urlpatterns = [
     url(r'^', include(router.urls)),
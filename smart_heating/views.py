@@ -14,12 +14,30 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
-from django.http.response import Http404
-from django.shortcuts import get_object_or_404, render
-from rest_framework import viewsets, renderers, mixins
-from rest_framework.decorators import list_route
+from collections import OrderedDict
 
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.db.models import Case, IntegerField, Prefetch, Value, When
+from django.http.response import Http404, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, render
+from django.utils import timezone
+from django.utils.http import quote_etag
+from rest_framework import viewsets, renderers, mixins, status
+from rest_framework.decorators import list_route, detail_route
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+
+from smart_heating import caching, devices, downsampling, gateway_config, heating_tables, ingest, latest, markers, \
+    planner, rollups, schedule
+from smart_heating.archive import TieredTemperatures
+from smart_heating.export import get_series, stream_series
+from smart_heating.latest import get_latest
+from smart_heating.filters import TimeRangeFilter, get_time, get_time_range, filter_time_range
 from smart_heating.pagination import *
+from smart_heating.renderers import CSVRenderer, NDJSONRenderer
+from smart_heating.rows import RowQuerySet
 from smart_heating.serializers import *
 
 
@@ -27,19 +45,41 @@ class HierarchicalModelHelper:
     """
     Helper class for hierarchical models.
     Provides access to the often used residence, room and thermostat objects.
+
+    The objects given by the url are resolved once per request with a single joined query.
     """
+    def get_hierarchy(self):
+        """
+        Returns a dictionary of the residence, room and thermostat given by the url.
+
+        The deepest object is fetched together with its parents and memoised on the view.
+        Raises Http404 if an object doesn't exist or doesn't belong to its parent.
+        """
+        if not hasattr(self, '_hierarchy'):
+            residence_pk = self.kwargs.get('residence_pk')
+            room_pk = self.kwargs.get('room_pk')
+            thermostat_pk = self.kwargs.get('thermostat_pk')
+            if thermostat_pk is not None:
+                thermostat = get_object_or_404(Thermostat.objects.select_related('room__residence'),
+                                               room__residence=residence_pk, room=room_pk, pk=thermostat_pk)
+                self._hierarchy = {'residence': thermostat.room.residence, 'room': thermostat.room,
+                                   'thermostat': thermostat}
+            elif room_pk is not None:
+                room = get_object_or_404(Room.objects.select_related('residence'),
+                                         residence=residence_pk, pk=room_pk)
+                self._hierarchy = {'residence': room.residence, 'room': room}
+            else:
+                self._hierarchy = {'residence': get_object_or_404(Residence.objects.all(), pk=residence_pk)}
+        return self._hierarchy
+
     def get_residence(self):
-        return get_object_or_404(Residence.objects.all(), pk=self.kwargs['residence_pk'])
+        return self.get_hierarchy()['residence']
 
     def get_room(self):
-        residence_pk = self.kwargs.get('residence_pk')
-        room_pk = self.kwargs.get('room_pk')
-        return get_object_or_404(Room.objects.all(), residence=residence_pk, pk=room_pk)
+        return self.get_hierarchy()['room']
 
     def get_thermostat(self):
-        room_pk = self.kwargs.get('room_pk')
-        thermostat_pk = self.kwargs.get('thermostat_pk')
-        return get_object_or_404(Thermostat.objects.all(), room=room_pk, pk=thermostat_pk)
+        return self.get_hierarchy()['thermostat']
 
     @abstractmethod
     def get_parent(self):
@@ -48,12 +88,11 @@ class HierarchicalModelHelper:
         """
         pass
 
-    @abstractmethod
     def check_hierarchy(self):
         """
         Checks if the URL arguments match the parents of the queried model.
         """
-        pass
+        self.get_hierarchy()
 
     def get_queryset(self):
         self.check_hierarchy()
@@ -63,6 +102,97 @@ class HierarchicalModelHelper:
         return self.get_parent()
 
 
+class EarlyResponse(Exception):
+    """
+    Raised to answer a request before its handler runs.
+    """
+
+    def __init__(self, response):
+        super().__init__()
+        self.response = response
+
+
+class ConditionalGetMixin:
+    """
+    Answers conditional GET requests with 304 Not Modified and sets the ETag and Last-Modified headers.
+
+    The validators are derived from the change markers of the requested object or collection and of its
+    parents in the url, before the response is rendered. Responses are served from the response cache
+    if it is enabled.
+    """
+    conditional_actions = ('list', 'retrieve', 'latest')
+    # Models whose changes affect every response, e.g. through nested representations
+    change_marker_models = ()
+
+    def get_change_marker_keys(self):
+        model = self.queryset.model
+        keys = []
+        parent = ()
+        for kwarg, parent_model in markers.URL_KWARGS:
+            if kwarg in self.kwargs:
+                keys.append(markers.get_object_key(parent_model, self.kwargs[kwarg]))
+                parent = (parent_model, self.kwargs[kwarg])
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        # Only the signals touch the markers of single objects, writes of the time series touch their collection
+        if self.action == 'retrieve' and self.lookup_field == 'pk' and model in markers.TRACKED_MODELS:
+            keys.append(markers.get_object_key(model, self.kwargs[lookup_url_kwarg]))
+        else:
+            keys.append(markers.get_collection_key(model, *parent))
+        keys.extend(markers.get_model_key(marker_model) for marker_model in self.change_marker_models)
+        return keys
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.validators = None
+        if request.method in ('GET', 'HEAD') and self.action in self.conditional_actions:
+            if any(kwarg in self.kwargs for kwarg, parent_model in markers.URL_KWARGS):
+                # Parents which don't exist are not found rather than not modified
+                self.check_hierarchy()
+            # The query string selects the page and the fields of the representation
+            variant = '%s?%s' % (request.accepted_renderer.format, request.META.get('QUERY_STRING', ''))
+            self.validators = markers.get_validators(self.get_change_marker_keys(), variant)
+            if markers.is_not_modified(request, *self.validators):
+                raise EarlyResponse(Response(status=status.HTTP_304_NOT_MODIFIED))
+            cached_response = caching.get_response(request, self.validators[0])
+            if cached_response is not None:
+                raise EarlyResponse(cached_response)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, EarlyResponse):
+            return exc.response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if getattr(self, 'validators', None) is None:
+            return response
+        if status.is_success(response.status_code) or response.status_code == status.HTTP_304_NOT_MODIFIED:
+            markers.set_validator_headers(response, *self.validators)
+        if response.status_code == status.HTTP_200_OK and isinstance(response, Response):
+            caching.store_response(request, self.validators[0], response)
+        return response
+
+
+class PlannedQuerysetMixin:
+    """
+    Loads the related objects and the fields required by the serializer with the queryset of the read
+    actions, see `smart_heating.planner`.
+    """
+    planned_actions = ('list', 'retrieve')
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in self.planned_actions and self.request.method in SAFE_METHODS:
+            queryset = planner.plan_queryset(queryset, self.get_serializer(), exclude=self.get_planner_exclude())
+        return queryset
+
+    def get_planner_exclude(self):
+        """
+        Returns the names of the relations which are set on the objects by the view.
+        """
+        return ()
+
+
 class ProtectedModelViewSet(mixins.CreateModelMixin,
                             mixins.RetrieveModelMixin,
                             mixins.UpdateModelMixin,
@@ -77,13 +207,19 @@ class ProtectedModelViewSet(mixins.CreateModelMixin,
     pass
 
 
-class HierarchicalModelViewSet(HierarchicalModelHelper,
+class HierarchicalModelViewSet(ConditionalGetMixin,
+                               PlannedQuerysetMixin,
+                               HierarchicalModelHelper,
                                viewsets.ModelViewSet):
     """
     A viewset that provides default `create()`, `retrieve()`, `update()`,
     `partial_update()`, `destroy()` and `list()` actions.
     """
 
+    def get_planner_exclude(self):
+        # The parents are attached by `get_serializer`
+        return set(self.get_parent())
+
     def get_serializer_context(self):
         """
         Extra context provided to the serializer class.
@@ -92,8 +228,113 @@ class HierarchicalModelViewSet(HierarchicalModelHelper,
         context['extra_data'] = self.get_serializer_extra_data()
         return context
 
+    def get_serializer(self, *args, **kwargs):
+        if args and args[0] is not None:
+            instance = args[0]
+            if kwargs.get('many', False):
+                # Attached during the iteration, so unpaginated lists aren't loaded into a list first
+                instance = self.iter_with_parent(instance)
+            else:
+                self.attach_parent(instance)
+            args = (instance,) + args[1:]
+        return super().get_serializer(*args, **kwargs)
+
+    def iter_with_parent(self, instances):
+        for instance in instances:
+            self.attach_parent(instance)
+            yield instance
+
+    def attach_parent(self, *instances):
+        """
+        Sets the resolved parent objects on the instances, so their urls and nested parents are
+        serialized without querying the parents of each instance again.
+        """
+        parent = self.get_parent()
+        for instance in instances:
+            if isinstance(instance, self.queryset.model):
+                for name, obj in parent.items():
+                    setattr(instance, name, obj)
+
+
+class TimeSeriesPaginationMixin:
+    """
+    Paginates with limit and offset by default and with a cursor over the datetime
+    if the `cursor` query parameter is given. An empty cursor requests the first page.
+    """
+    pagination_class = None
+    cursor_pagination_class = None
+
+    @property
+    def paginator(self):
+        """
+        The paginator instance associated with the view, or `None`.
+        """
+        # Override the paginator property to inject the kwargs to the paginator. This is required
+        # to generate the urls of the custom pagination fields.
+        if not hasattr(self, '_paginator'):
+            if self.cursor_pagination_class is not None and 'cursor' in self.request.query_params:
+                self._paginator = self.cursor_pagination_class(kwargs=self.kwargs)
+            elif self.pagination_class is not None:
+                self._paginator = self.pagination_class(kwargs=self.kwargs)
+            else:
+                self._paginator = None
+        return self._paginator
+
+
+class RowListMixin:
+    """
+    Lists the entries as rows of their values with the `row_serializer_class`, which produces the same
+    representation as the `serializer_class` without model instances or serializer fields for each entry.
+    """
+    row_serializer_class = None
+    # The rows don't need the related objects
+    planned_actions = ('retrieve',)
+
+    def get_row_queryset(self):
+        return RowQuerySet(self.get_queryset())
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_row_queryset())
+        context = self.get_serializer_context()
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.row_serializer_class(page, many=True, context=context)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.row_serializer_class(queryset, many=True, context=context)
+        return Response(serializer.data)
+
+
+class ExportMixin:
+    """
+    Adds an `export` route streaming the temperatures or meta entries of the thermostats of the object.
 
-class ResidenceViewSet(viewsets.ModelViewSet):
+    Select the format with `?format=csv` (default) or `?format=ndjson`, the series with
+    `?series=temperature` (default) or `?series=meta_entry` and the time range with `from` and `to`.
+    """
+    # Lookup of the exported thermostats by the object
+    export_thermostat_lookup = None
+
+    @detail_route(methods=['get'], url_path='export',
+                  renderer_classes=[CSVRenderer, NDJSONRenderer])
+    def export(self, request, *args, **kwargs):
+        instance = self.get_object()
+        series = get_series(request)
+        start, end = get_time_range(request)
+        thermostat_pks = list(Thermostat.objects.filter(**{self.export_thermostat_lookup: instance})
+                              .order_by('pk').values_list('pk', flat=True))
+
+        export_format = request.accepted_renderer.format
+        response = StreamingHttpResponse(stream_series(series, export_format, thermostat_pks, start, end),
+                                         content_type=request.accepted_renderer.media_type)
+        response['Content-Disposition'] = 'attachment; filename="%s-%s.%s"' % (
+            '-'.join(str(pk) for pk in instance.get_recursive_pks()), series, export_format)
+        return response
+
+
+class ResidenceViewSet(ConditionalGetMixin,
+                       ExportMixin,
+                       PlannedQuerysetMixin,
+                       viewsets.ModelViewSet):
     """
     API endpoint that represents residences.
 
@@ -102,6 +343,61 @@ class ResidenceViewSet(viewsets.ModelViewSet):
     """
     queryset = Residence.objects.all()
     serializer_class = ResidenceSerializer
+    export_thermostat_lookup = 'room__residence'
+
+    @detail_route(methods=['get'], url_path='dashboard')
+    def dashboard(self, request, *args, **kwargs):
+        """
+        Returns the rooms and thermostats of the residence with the latest temperature, the latest meta entry
+        and the current heating table setpoint of each thermostat.
+
+        Runs a constant number of queries regardless of the number of thermostats.
+        """
+        residence = self.get_object()
+        thermostats = Thermostat.objects.select_related('latest_reading__temperature',
+                                                        'latest_reading__meta_entry')
+        rooms = list(Room.objects.filter(residence=residence).select_related('residence')
+                     .prefetch_related(Prefetch('thermostats', queryset=thermostats),
+                                       'thermostats__heating_table_entries'))
+        now = timezone.now()
+        deleted = dict((model, []) for model in latest.FIELDS)
+        for room in rooms:
+            for thermostat in room.thermostats.all():
+                try:
+                    reading = thermostat.latest_reading
+                except LatestReading.DoesNotExist:
+                    reading = None
+                thermostat.latest_temperature = reading.temperature if reading is not None else None
+                thermostat.latest_meta_entry = reading.meta_entry if reading is not None else None
+                thermostat.setpoint = schedule.get_current_setpoint(thermostat.heating_table_entries.all(), now)
+                for model, field in latest.FIELDS.items():
+                    if reading is not None and latest.is_deleted(reading, field):
+                        deleted[model].append(thermostat)
+        # Refresh the cached entries which were deleted, like `get_latest`
+        for model, thermostats in deleted.items():
+            if thermostats:
+                entries = latest.refresh_many(model, [thermostat.pk for thermostat in thermostats])
+                for thermostat in thermostats:
+                    setattr(thermostat, 'latest_' + latest.FIELDS[model], entries.get(thermostat.pk))
+        serializer = DashboardRoomSerializer(rooms, many=True, context=self.get_serializer_context())
+        return Response(serializer.data)
+
+    @detail_route(methods=['get'], url_path='setpoints')
+    def setpoints(self, request, *args, **kwargs):
+        """
+        Returns the heating table setpoint and its next change of each thermostat of the residence,
+        ordered by RFID.
+
+        The time defaults to now and can be given by `at`, as ISO 8601 datetime or milliseconds since the epoch.
+        """
+        residence = self.get_object()
+        now = get_time(request)
+        thermostat_pks = list(Thermostat.objects.filter(room__residence=residence).order_by('pk')
+                              .values_list('pk', flat=True))
+        schedules = schedule.get_schedules(thermostat_pks)
+        states = [schedule.get_setpoint_state(thermostat_pk, schedules[thermostat_pk], now)
+                  for thermostat_pk in thermostat_pks]
+        return Response(SetpointSerializer(states, many=True).data)
 
 
 class UserViewSet(HierarchicalModelViewSet):
@@ -118,7 +414,8 @@ class UserViewSet(HierarchicalModelViewSet):
         return {'residence': self.get_residence()}
 
 
-class RoomViewSet(HierarchicalModelViewSet):
+class RoomViewSet(ExportMixin,
+                  HierarchicalModelViewSet):
     """
     API endpoint that represents rooms.
 
@@ -127,12 +424,14 @@ class RoomViewSet(HierarchicalModelViewSet):
 
     queryset = Room.objects.all()
     serializer_class = RoomSerializer
+    export_thermostat_lookup = 'room'
 
     def get_parent(self):
         return {'residence': self.get_residence()}
 
 
-class ThermostatViewSet(HierarchicalModelViewSet):
+class ThermostatViewSet(ExportMixin,
+                        HierarchicalModelViewSet):
     """
     API endpoint that represents thermostats.
 
@@ -142,66 +441,172 @@ class ThermostatViewSet(HierarchicalModelViewSet):
 
     queryset = Thermostat.objects.all()
     serializer_class = ThermostatSerializer
+    export_thermostat_lookup = 'pk'
 
     def get_parent(self):
         return {'room': self.get_room()}
 
+    @detail_route(methods=['get'], url_path='setpoint')
+    def setpoint(self, request, *args, **kwargs):
+        """
+        Returns the heating table setpoint of the thermostat and its next change.
+
+        The time defaults to now and can be given by `at`, as ISO 8601 datetime or milliseconds since the epoch.
+        """
+        thermostat = self.get_object()
+        now = get_time(request)
+        compiled_schedule = schedule.get_schedules([thermostat.pk])[thermostat.pk]
+        return Response(SetpointSerializer(schedule.get_setpoint_state(thermostat.pk, compiled_schedule, now)).data)
+
 
-class TemperatureViewSet(HierarchicalModelViewSet):
+class TemperatureViewSet(TimeSeriesPaginationMixin,
+                         RowListMixin,
+                         HierarchicalModelViewSet):
     """
     API endpoint that represents a thermostat's temperatures.
 
     Offers pagination and custom views for the latest temperature measurement
-    and a chart to review current and historic values.
+    and a chart to review current and historic values. Pass `?cursor=` to page with a
+    cursor over the datetime instead of limit and offset. The list and the chart can be
+    restricted to a time range with `from` and `to`, given as ISO 8601 datetimes or
+    milliseconds since the epoch.
+
+    Temperatures older than `TEMPERATURE_ARCHIVE_AGE_DAYS` are moved to the archive, which truncates
+    their datetimes to milliseconds and rounds their values to `1 / TEMPERATURE_ARCHIVE_SCALE` degrees.
+    Archived temperatures are listed and retrieved like the others, but can't be changed or deleted.
     """
 
     queryset = Temperature.objects.all()
     serializer_class = TemperatureSerializer
-
-    # Allow dots in the lookup value. The datetime primary key uses a dot to represent milliseconds
+    row_serializer_class = TemperatureRowSerializer
+    pagination_class = TemperaturePagination
+    cursor_pagination_class = TemperatureCursorPagination
+    filter_backends = (TimeRangeFilter,)
+
+    # Temperatures are identified by their datetime within the thermostat
+    lookup_field = 'datetime'
+    # Allow dots in the lookup value. The datetime uses a dot to represent milliseconds
     lookup_value_regex = '[^/]+'
 
     def get_parent(self):
         return {'thermostat': self.get_thermostat()}
 
-    def check_hierarchy(self):
-        self.get_room()
+    def get_tiered_queryset(self):
+        """
+        Returns the temperatures of the thermostat in the database and in the archive.
+        """
+        thermostat = self.get_parent()['thermostat']
+        return TieredTemperatures(thermostat.pk, self.get_queryset(), thermostat)
+
+    def get_row_queryset(self):
+        # The list includes the archived temperatures, contrary to the write actions
+        return self.get_tiered_queryset().rows()
+
+    def get_object(self):
+        try:
+            return super().get_object()
+        except Http404:
+            if self.action != 'retrieve':
+                raise
+        # The urls of the listed archived temperatures are served as well
+        date = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        try:
+            temperatures = self.get_tiered_queryset().filter(datetime__gte=date, datetime__lte=date)[:1]
+        except DjangoValidationError:
+            raise Http404('Invalid datetime.')
+        if not temperatures:
+            raise Http404('No temperature matches the given query.')
+        return temperatures[0]
+
+    def perform_destroy(self, instance):
+        # Saved temperatures are handled by `smart_heating.signals`
+        with transaction.atomic():
+            instance.delete()
+            ingest.entries_changed(Temperature, instance.thermostat_id, [instance.datetime])
 
     @list_route(methods=['get'], url_path='latest')
     def latest(self, request, *args, **kwargs):
-        temperatures = self.get_queryset().order_by('-datetime')
-        if len(temperatures) == 0:
+        self.check_hierarchy()
+        latest_temperature = get_latest(Temperature, self.get_parent()['thermostat'])
+        if latest_temperature is None:
             raise Http404('There are no temperatures.')
-        latest_temperature = temperatures[0]
         return Response(self.get_serializer(latest_temperature).data)
 
+    @list_route(methods=['post'], url_path='bulk')
+    def bulk(self, request, *args, **kwargs):
+        """
+        Creates a list of temperatures with a single bulk insert and returns the status of each item.
+        """
+        if not isinstance(request.data, list):
+            return Response(status=400, data={'non_field_errors': ['Expected a list of items.']})
+        self.check_hierarchy()
+        results = ingest.bulk_create_temperatures(self.get_thermostat(), request.data)
+        return Response(status=ingest.get_bulk_response_status(results), data=results)
+
+    @list_route(methods=['get'], url_path='rollup')
+    def rollup(self, request, *args, **kwargs):
+        """
+        Returns the hourly (`bucket=hour`, default) or daily (`bucket=day`) aggregated temperatures.
+
+        The buckets overlapping the time range given by `from` and `to` are included.
+        """
+        bucket = request.query_params.get('bucket', TemperatureRollup.HOUR)
+        if bucket not in rollups.BUCKETS:
+            raise ValidationError({'bucket': ['Expected one of: %s.' % ', '.join(rollups.BUCKETS)]})
+        start, end = get_time_range(request)
+        if start is not None:
+            start = rollups.get_bucket_start(start, bucket)
+        self.check_hierarchy()
+        queryset = TemperatureRollup.objects.filter(thermostat=self.get_parent()['thermostat'], bucket=bucket)
+        queryset = filter_time_range(queryset, start, end, field='start')
+        return Response(TemperatureRollupSerializer(queryset, many=True).data)
+
     @list_route(methods=['get'], url_path='chart', renderer_classes=[renderers.TemplateHTMLRenderer])
     def chart(self, request, *args, **kwargs):
-        temperatures = self.get_queryset()
-        print(temperatures)
+        points = self.get_downsampled_points(settings.TEMPERATURE_CHART_POINTS)
         context = {
-            'temperatures': [[int(t.datetime.timestamp() * 1000), t.value] for t in temperatures],
+            'temperatures': [list(point) for point in points],
             'room': self.get_room(),
             'thermostat': self.get_thermostat()
         }
         return render(request, 'smart_heating/temperature_chart.html', context)
 
-    @property
-    def paginator(self):
+    @list_route(methods=['get'], url_path='downsample')
+    def downsample(self, request, *args, **kwargs):
         """
-        The paginator instance associated with the view, or `None`.
+        Returns the temperatures as a list of [milliseconds since the epoch, value] pairs, reduced to
+        at most `points` pairs with the `lttb` (default) or `minmax` mode.
         """
-        # Override the paginator property to inject the kwargs to the paginator. This is required
-        # to generate the latest_temperature_url.
-        if not hasattr(self, '_paginator'):
-            if self.pagination_class is None:
-                self._paginator = None
-            else:
-                self._paginator = TemperaturePagination(kwargs=self.kwargs)
-        return self._paginator
+        points = self.get_downsampled_points()
+        return Response([list(point) for point in points])
 
+    def get_downsampled_points(self, default_threshold=None):
+        """
+        Returns an iterator over the downsampled (milliseconds, value) points of the filtered temperatures.
 
-class ThermostatMetaEntryViewSet(HierarchicalModelViewSet):
+        The number of points and the mode are given by the `points` and `mode` query parameters.
+        """
+        threshold = self.request.query_params.get('points', default_threshold)
+        try:
+            threshold = int(threshold)
+        except (TypeError, ValueError):
+            raise ValidationError({'points': ['A valid integer is required.']})
+        if threshold < 2:
+            raise ValidationError({'points': ['Ensure this value is greater than or equal to 2.']})
+        mode = self.request.query_params.get('mode', downsampling.LTTB)
+        if mode not in downsampling.MODES:
+            raise ValidationError({'mode': ['Expected one of: %s.' % ', '.join(downsampling.MODES)]})
+
+        temperatures = self.filter_queryset(self.get_tiered_queryset())
+        count = temperatures.count()
+        # Stream the rows instead of creating model instances
+        points = ((int(date.timestamp() * 1000), value) for date, value in temperatures.readings())
+        return downsampling.downsample(points, count, threshold, mode)
+
+
+class ThermostatMetaEntryViewSet(TimeSeriesPaginationMixin,
+                                 RowListMixin,
+                                 HierarchicalModelViewSet):
     """
     API endpoint that represents a time depending meta information about thermostats.
 
@@ -212,31 +617,27 @@ class ThermostatMetaEntryViewSet(HierarchicalModelViewSet):
 
     queryset = ThermostatMetaEntry.objects.all()
     serializer_class = ThermostatMetaEntrySerializer
+    row_serializer_class = ThermostatMetaEntryRowSerializer
+    pagination_class = ThermostatMetaEntriesPagination
+    cursor_pagination_class = ThermostatMetaEntriesCursorPagination
+    filter_backends = (TimeRangeFilter,)
 
     def get_parent(self):
         return {'thermostat': self.get_thermostat()}
 
+    def perform_destroy(self, instance):
+        # Saved meta entries are handled by `smart_heating.signals`
+        with transaction.atomic():
+            instance.delete()
+            ingest.entries_changed(ThermostatMetaEntry, instance.thermostat_id, [instance.datetime])
+
     @list_route(methods=['get'], url_path='latest')
     def latest(self, request, *args, **kwargs):
-        meta_entries = self.get_queryset().order_by('-datetime')
-        if len(meta_entries) == 0:
+        self.check_hierarchy()
+        latest_meta_entry = get_latest(ThermostatMetaEntry, self.get_parent()['thermostat'])
+        if latest_meta_entry is None:
             raise Http404('There are no meta entries.')
-        latest_temperature = meta_entries[0]
-        return Response(self.get_serializer(latest_temperature).data)
-
-    @property
-    def paginator(self):
-        """
-        The paginator instance associated with the view, or `None`.
-        """
-        # Override the paginator property to inject the kwargs to the paginator. This is required
-        # to generate the url for the latest entry.
-        if not hasattr(self, '_paginator'):
-            if self.pagination_class is None:
-                self._paginator = None
-            else:
-                self._paginator = ThermostatMetaEntriesPagination(kwargs=self.kwargs)
-        return self._paginator
+        return Response(self.get_serializer(latest_meta_entry).data)
 
 
 class HeatingTableEntryViewSet(HierarchicalModelViewSet):
@@ -254,24 +655,123 @@ class HeatingTableEntryViewSet(HierarchicalModelViewSet):
     def get_parent(self):
         return {'thermostat': self.get_thermostat()}
 
-    def check_hierarchy(self):
-        # Check residence, room and thermostat in hierarchy
-        self.get_room()  # This includes the residence check
-        self.get_thermostat()
+    def replace(self, request, *args, **kwargs):
+        """
+        Replaces the heating table by the given list of entries in a single transaction.
+        """
+        return self.apply_table(request, partial=False)
 
+    def partial_replace(self, request, *args, **kwargs):
+        """
+        Adds or updates the given list of entries in a single transaction. Entries with a temperature of null
+        are removed.
+        """
+        return self.apply_table(request, partial=True)
+
+    def apply_table(self, request, partial):
+        if not isinstance(request.data, list):
+            return Response(status=400, data={'non_field_errors': ['Expected a list of items.']})
+        self.check_hierarchy()
+        table, errors = heating_tables.validate_table(request.data, partial)
+        if errors is not None:
+            return Response(status=400, data=errors)
+        heating_tables.apply_table([self.get_thermostat().pk], [self.get_residence().pk], table, partial)
+        return Response(self.get_serializer(self.get_queryset(), many=True).data)
+
+    @list_route(methods=['post'], url_path='copy')
+    def copy(self, request, *args, **kwargs):
+        """
+        Replaces the heating tables of other thermostats of the residence by this heating table.
 
-class DeviceLookupMixin(viewsets.ModelViewSet):
+        Expects a dictionary with the list `thermostats` of RFIDs. Without `thermostats`, the heating table is
+        copied to all thermostats of the residence. Returns the RFIDs of the thermostats.
+        """
+        serializer = HeatingTableCopySerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(status=400, data=serializer.errors)
+        thermostat_pks = serializer.validated_data.get('thermostats')
+        residence = self.get_residence()
+        residence_thermostat_pks = set(Thermostat.objects.filter(room__residence=residence)
+                                       .values_list('pk', flat=True))
+        if thermostat_pks is None:
+            thermostat_pks = sorted(residence_thermostat_pks)
+        unknown = [str(pk) for pk in thermostat_pks if pk not in residence_thermostat_pks]
+        if unknown:
+            return Response(status=400, data={'thermostats': [
+                'The thermostats %s don\'t belong to this residence.' % ', '.join(unknown)]})
+        table = OrderedDict((heating_tables.get_key(day, time), temperature) for day, time, temperature in
+                            self.get_queryset().values_list('day', 'time', 'temperature'))
+        heating_tables.apply_table(thermostat_pks, [residence.pk], table)
+        return Response({'thermostats': thermostat_pks})
+
+
+class DeviceLookupMixin(ConditionalGetMixin,
+                        PlannedQuerysetMixin,
+                        viewsets.ModelViewSet):
     """
-    Provides a list route to lookup a device by its MAC address.
+    Provides list routes to lookup devices by their MAC address and to search devices by the beginning of
+    their RFID or MAC address.
+
+    MAC addresses are accepted in any case and with any separators. The RFIDs are resolved by the device
+    index, see `smart_heating.devices`.
     """
+    conditional_actions = ('list', 'retrieve', 'lookup', 'search')
+    planned_actions = ('list', 'retrieve', 'lookup', 'search')
+    # The devices are related to the hierarchy by their RFID
+    change_marker_models = (RaspberryDevice, ThermostatDevice, Residence, Room, Thermostat)
+
+    def get_macs(self, request):
+        """
+        Returns the canonical MAC addresses given by the `mac` query parameters.
+        """
+        macs = request.query_params.getlist('mac')
+        if not macs:
+            raise ValidationError({'mac': ['This field is required']})
+        if len(macs) > devices.MAX_LOOKUP_MACS:
+            raise ValidationError({'mac': ['Ensure there are no more than %d MAC addresses.' %
+                                           devices.MAX_LOOKUP_MACS]})
+        normalized = [normalize_mac(mac) for mac in macs]
+        if None in normalized:
+            raise ValidationError({'mac': ['Enter a valid MAC address.']})
+        return normalized
+
+    def get_device_by_mac(self, mac):
+        rfid = devices.get_index(self.queryset.model).get(mac)
+        if rfid is None:
+            raise Http404('No device with this MAC address.')
+        return get_object_or_404(self.get_queryset(), pk=rfid)
+
     @list_route(methods=['get'], url_path='lookup')
     def lookup(self, request, *args, **kwargs):
-        mac = request.GET.get('mac')
-        if mac is None:
-            return Response(status=400, data={'mac': ['This field is required']})
-        device = get_object_or_404(self.get_queryset(), mac=mac)
-        serializer = self.get_serializer(device)
-        return Response(serializer.data)
+        """
+        Returns the device with the MAC address given by the `mac` query parameter.
+
+        If the parameter is given more than once, returns a dictionary of the devices by canonical MAC
+        address instead. Unknown MAC addresses map to null.
+        """
+        macs = self.get_macs(request)
+        if len(macs) == 1:
+            return Response(self.get_serializer(self.get_device_by_mac(macs[0])).data)
+
+        index = devices.get_index(self.queryset.model)
+        rfids = dict((mac, index.get(mac)) for mac in macs)
+        found = list(self.get_queryset().filter(pk__in=set(rfid for rfid in rfids.values() if rfid is not None)))
+        data = dict(zip((device.pk for device in found), self.get_serializer(found, many=True).data))
+        return Response(OrderedDict((mac, data.get(rfids[mac])) for mac in macs))
+
+    @list_route(methods=['get'], url_path='search')
+    def search(self, request, *args, **kwargs):
+        """
+        Returns the devices whose RFID or MAC address starts with the `q` query parameter, ordered by RFID.
+
+        At most `smart_heating.devices.SEARCH_LIMIT` devices are returned.
+        """
+        query = request.query_params.get('q', '')
+        if not query.strip():
+            raise ValidationError({'q': ['This field is required']})
+        rfids = devices.get_index(self.queryset.model).search(query)
+        found = self.get_queryset().filter(pk__in=rfids).order_by('pk') if rfids else []
+        return Response(self.get_serializer(found, many=True).data)
 
 
 class RaspberryDeviceViewSet(DeviceLookupMixin,
@@ -288,6 +788,67 @@ class RaspberryDeviceViewSet(DeviceLookupMixin,
     queryset = RaspberryDevice.objects.all()
     serializer_class = RaspberryDeviceSerializer
 
+    @detail_route(methods=['post'], url_path='upload')
+    def upload(self, request, *args, **kwargs):
+        """
+        Stores the temperatures and meta entries of all thermostats of the device's residence.
+
+        Expects a dictionary with the lists `temperatures` and `meta_entries`. Each item names its
+        thermostat by RFID. Returns the status of each item.
+        """
+        return self.gateway_upload(request, self.get_object())
+
+    @list_route(methods=['post'], url_path='upload')
+    def upload_by_mac(self, request, *args, **kwargs):
+        """
+        Same as `upload`, but looks up the device by the `mac` query parameter.
+        """
+        macs = self.get_macs(request)
+        if len(macs) > 1:
+            raise ValidationError({'mac': ['Expected a single MAC address.']})
+        return self.gateway_upload(request, self.get_device_by_mac(macs[0]))
+
+    @detail_route(methods=['get'], url_path='config')
+    def config(self, request, *args, **kwargs):
+        """
+        Returns the configuration of the device's residence: its rooms, thermostats, thermostat devices and
+        heating tables, together with the configuration version.
+
+        Answers with 304 Not Modified if the ETag given by `If-None-Match` is still valid. With
+        `?since_version=N&wait=S` the request blocks for up to S seconds until the version is greater than N,
+        and answers with 304 Not Modified if it isn't.
+        """
+        device = self.get_object()
+        since_version, wait = gateway_config.get_poll_params(request)
+        if since_version is None:
+            version = gateway_config.get_version(device.pk)
+        else:
+            version = gateway_config.wait_for_version(device.pk, since_version, wait)
+        etag = gateway_config.get_etag(device.pk, version, request.accepted_renderer.format)
+        if (since_version is not None and version <= since_version) or markers.is_not_modified(request, etag, None):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            residence = gateway_config.get_config(device.pk)
+            if residence is None:
+                raise Http404('The device is not associated to a residence.')
+            residence.config_version = version
+            response = Response(GatewayConfigSerializer(residence, context=self.get_serializer_context()).data)
+        response['ETag'] = quote_etag(etag)
+        return response
+
+    def gateway_upload(self, request, device):
+        residence = device.residence
+        if residence is None:
+            raise Http404('The device is not associated to a residence.')
+        data = request.data
+        if not isinstance(data, dict) or not all(isinstance(data.get(key, []), list)
+                                                 for key in ('temperatures', 'meta_entries')):
+            return Response(status=400, data={'non_field_errors': [
+                'Expected a dictionary with the lists temperatures and meta_entries.']})
+        results = ingest.gateway_upload(residence, data)
+        response_status = ingest.get_bulk_response_status(results['temperatures'] + results['meta_entries'])
+        return Response(status=response_status, data=results)
+
 
 class ThermostatDeviceViewSet(DeviceLookupMixin,
                               viewsets.ModelViewSet):
@@ -299,3 +860,37 @@ class ThermostatDeviceViewSet(DeviceLookupMixin,
 
     queryset = ThermostatDevice.objects.all()
     serializer_class = ThermostatDeviceSerializer
+
+
+class BatteryForecastViewSet(ConditionalGetMixin,
+                             TimeSeriesPaginationMixin,
+                             viewsets.ReadOnlyModelViewSet):
+    """
+    API endpoint that represents the projected battery depletion of the thermostats, ordered by the projected
+    empty date.
+
+    The forecasts are computed by the `forecast_batteries` command. The list can be restricted to a residence with
+    `residence` and to the projected empty dates of a time range with `from` and `to`, given as ISO 8601
+    datetimes or milliseconds since the epoch.
+    """
+
+    queryset = BatteryForecast.objects.select_related('thermostat__room__residence')
+    serializer_class = BatteryForecastSerializer
+    pagination_class = BasePagination
+    # The url of the thermostat depends on its parents
+    change_marker_models = (BatteryForecast, Residence, Room, Thermostat)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action != 'list':
+            return queryset
+        residence_pk = self.request.query_params.get('residence')
+        if residence_pk:
+            queryset = queryset.filter(thermostat__room__residence=residence_pk)
+        start, end = get_time_range(self.request)
+        if start is not None or end is not None:
+            queryset = filter_time_range(queryset, start, end, field='empty_date')
+        # Forecasts without empty date come last, databases disagree on the position of nulls
+        queryset = queryset.annotate(no_empty_date=Case(When(empty_date__isnull=True, then=Value(1)), default=Value(0),
+                                                        output_field=IntegerField()))
+        return queryset.order_by('no_empty_date', 'empty_date', 'thermostat')